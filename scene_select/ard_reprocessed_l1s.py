@@ -13,11 +13,12 @@ from scene_select.dass_logs import LOGGER, LogMainFunction
 from scene_select import utils
 from scene_select.do_ard import do_ard
 
-import datacube
-from datacube.model import Range, Dataset
-from datacube import Datacube
+from typing import TYPE_CHECKING, TypedDict, List
 
-from typing import TypedDict, List
+# datacube is imported where it's used, so that --help doesn't wait for it.
+if TYPE_CHECKING:
+    from datacube.model import Dataset
+    from datacube import Datacube
 
 PRODUCT = "ga_ls9c_ard_3"
 DIR_TEMPLATE = "reprocess-jobid-{jobid}"
@@ -42,13 +43,16 @@ def landsat_date(product_id):
     return date_obj
 
 
-def find_newer_level1_datasets(dc: Datacube, level1_dataset: Dataset) -> List[Dataset]:
+def find_newer_level1_datasets(
+    dc: "Datacube", level1_dataset: "Dataset"
+) -> List["Dataset"]:
     """
     Find the blocked l1 for a given level 1 dataset.
 
     (Note: I think this just finds newer datasets of the same scene, there's nothing specific to "blocking",
            so I've tentatively renamed it for clarity)
     """
+    from datacube.model import Range
 
     blocked_l1s = []
     blocking_scene_id = level1_dataset.metadata.landsat_scene_id
@@ -110,7 +114,7 @@ class BlockResult(TypedDict):
     blocking_ard_path: Path
 
 
-def find_blocked(dc: Datacube, product: str, scene_limit: int) -> List[BlockResult]:
+def find_blocked(dc: "Datacube", product: str, scene_limit: int) -> List[BlockResult]:
     """
 
     From what I can tell (reading this code), it finds all ARD datasets that have a newer
@@ -392,6 +396,8 @@ def ard_reprocessed_l1s(
     ard_click_params["logdir"] = logdir
 
     LOGGER.info("reprocessed_l1s", **locals())
+    import datacube
+
     dc = datacube.Datacube(app=THIS_TASK)
 
     # identify the blocking ARD uuids and locations
@@ -4,20 +4,31 @@ import datetime
 import os
 import re
 import uuid
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, closing, nullcontext
+from functools import partial
+from itertools import islice
 from logging.config import fileConfig
 from pathlib import Path
-from typing import List, Optional, Tuple, Dict, Iterator
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    List,
+    Optional,
+    Tuple,
+    Dict,
+    Iterator,
+    Iterable,
+    Set,
+    NamedTuple,
+)
 import calendar
+import heapq
 import click
 import json
-
-from datacube.model import Range
-from eodatasets3.utils import default_utc
-
-try:
-    import datacube
-except (ImportError, AttributeError):
-    print("Could not import Datacube")
+from attr import Factory, define
 
 from scene_select.check_ancillary import (
     DEFAULT_MODIS_DIR,
@@ -27,9 +38,42 @@ from scene_select.check_ancillary import (
     DEFAULT_VIIRS_M_PATH,
     DEFAULT_USE_VIIRS_AFTER,
 )
-from scene_select.dass_logs import LOGGER, LogMainFunction
+from scene_select.dass_logs import (
+    DECISION_SAMPLE_SIZE,
+    LOGGER,
+    REASON,
+    DecisionLog,
+    LogMainFunction,
+    SceneLog,
+)
+from scene_select.eligibility import EligibilityCalendar
+from scene_select.filter_pipeline import FilterPipeline, FilterStage
+from scene_select.processed_ard_cache import ArdEntry, ProcessedArdCache
+from scene_select.processed_ards import ProcessedArd, ProcessedArdScenes
+from scene_select.scan_state import (
+    STATE_FILE,
+    ScanState,
+    load_scan_states,
+    save_scan_states,
+)
+from scene_select.decision_ledger import (
+    DEFERRED,
+    KEEP_DAYS,
+    LEDGER_FILE,
+    REMOVED,
+    SELECTED,
+    Decision,
+    DecisionLedger,
+)
 from scene_select.do_ard import do_ard, ODC_FILTERED_FILE
+from scene_select.service import Triggers, serve
 from scene_select import utils
+from scene_select.utils import default_utc
+
+# datacube (and sqlalchemy) are imported where they're used, rather than here, so that
+# commands that don't touch the index (--help, or given --usgs-level1-files) start quickly.
+if TYPE_CHECKING:
+    from datacube.model import Range
 
 AOI_FILE = "Australian_AOI.json"
 # AOI_FILE = "Australian_AOI_mainland.json"
@@ -49,12 +93,26 @@ MANYSCENES = "Multiple identical ARD scene ids"
 
 # LOGGER keys
 DATASETTIMEEND = "dataset_time_end"
-REASON = "reason"
 MSG = "message"
 PRODUCTID = "landsat_product_id"
 
 HARD_SCENE_LIMIT = 10000
 
+# Month windows are searched concurrently on the one index. ODC's engine pool holds
+# five connections (plus up to ten on overflow), so stay well within it.
+MAX_MONTH_WORKERS = 8
+# The most dataset ids to search for at once.
+ID_SEARCH_CHUNK = 500
+# The most AOI region codes to search for at once.
+REGION_CODE_CHUNK = 500
+# How many scenes at a time get the (index-querying) checks for children and reprocessing.
+SEQUENTIAL_CHUNK = 100
+# The ARD of a level 1 has the same acquisition time, but allow for rounding of either.
+PROCESSED_ARD_TIME_MARGIN = datetime.timedelta(days=1)
+
+# Where the ARD (eo3) metadata documents store their maturity.
+DATASET_MATURITY_OFFSET = ("properties", "dea:dataset_maturity")
+
 # No such product - "ga_ls8c_level1_3": "ga_ls8c_ard_3",
 ARD_PARENT_PRODUCT_MAPPING = {
     "ga_ls5t_level1_3": "ga_ls5t_ard_3",
@@ -192,57 +250,375 @@ def load_aoi(file_name: str) -> Dict:
     return data
 
 
-def dataset_with_final_child(dc, dataset):
+# The search fields holding the product id and the scene id, for each AOI sat_key.
+# S2 has no equivalent to a scene id: sentinel_tile_id is used for both.
+L1_ID_SEARCH_FIELDS = {
+    "ls": ("landsat_product_id", "landsat_scene_id"),
+    "s2": ("sentinel_tile_id", "sentinel_tile_id"),
+}
+
+
+class Level1Record(NamedTuple):
     """
-    If any child exists that isn't archived, with a dataset_maturity of 'final'
-    :param dc:
-    :param dataset:
-    :return:
+    The few fields of a Level 1 dataset that scene select filters on.
+
+    This is built from search_returning(), so the (large, for S2) metadata documents
+    are never fetched or deserialised.
+
+    It has the `uris` and `local_path` of a datacube Dataset, so utils.calc_file_path() accepts it.
     """
-    ds_w_child = []
-    for child_dataset in dc.index.datasets.get_derived(dataset.id):
-        if (
-            not child_dataset.is_archived
-            and child_dataset.metadata.dataset_maturity == "final"
+
+    id: uuid.UUID
+    product: str
+    uri: str
+    # landsat_product_id or sentinel_tile_id
+    product_id: str
+    # landsat_scene_id or sentinel_tile_id
+    scene_id: str
+    region_code: str
+    time_end: datetime.datetime
+
+    @property
+    def uris(self) -> List[str]:
+        return [self.uri]
+
+    @property
+    def local_path(self) -> Optional[Path]:
+        # As for a datacube Dataset, only file uris have a local path.
+        if not self.uri.startswith("file:"):
+            return None
+        from datacube.utils import uri_to_local_path
+
+        return uri_to_local_path(self.uri)
+
+
+def _range_end(time_range) -> datetime.datetime:
+    from datacube.model import Range
+
+    # The postgres driver returns psycopg2 ranges, other indexes return a Range.
+    if isinstance(time_range, Range):
+        return time_range.end
+    return time_range.upper
+
+
+def _region_code_chunks(region_codes: Iterable[str]) -> List[List[str]]:
+    region_codes = sorted(region_codes)
+    return [
+        region_codes[i : i + REGION_CODE_CHUNK]
+        for i in range(0, len(region_codes), REGION_CODE_CHUNK)
+    ]
+
+
+def region_shard(region_code: str, shards: int) -> int:
+    """
+    Which of the shards a region belongs to.
+
+    (A stable hash, unlike hash(), so every process and run agrees.)
+
+    >>> region_shard('092079', 4)
+    3
+    >>> region_shard('55HFA', 4)
+    1
+    """
+    return zlib.crc32(region_code.encode("utf-8")) % shards
+
+
+def search_l1_records(
+    dc,
+    l1_products: List[str],
+    sat_key: str,
+    time_range: "Range",
+    region_codes: Optional[Iterable[str]] = None,
+    **query,
+) -> Iterator[Level1Record]:
+    """
+    Search the given Level 1 products in one search call, returning only the fields scene select needs.
+
+    With region_codes, only the datasets in those regions are searched for (in chunks of
+    region codes, each a membership test in the database query), so those outside the
+    AOI are never fetched.
+
+    Any other query (eg. a list of ids) is passed on to the search.
+    """
+    if sat_key not in L1_ID_SEARCH_FIELDS:
+        raise ValueError(f"Unsupported sat_key: {sat_key!r}")
+    product_id_field, scene_id_field = L1_ID_SEARCH_FIELDS[sat_key]
+
+    # (dict rather than set, to keep a stable order without repeated names)
+    field_names = tuple(
+        dict.fromkeys(
+            (
+                "id",
+                "product",
+                "uri",
+                product_id_field,
+                scene_id_field,
+                "region_code",
+                "time",
+            )
+        )
+    )
+    if region_codes is None:
+        searches = [query]
+    else:
+        searches = [
+            dict(query, region_code=chunk)
+            for chunk in _region_code_chunks(region_codes)
+        ]
+    for search in searches:
+        for result in dc.index.datasets.search_returning(
+            field_names, product=l1_products, time=time_range, **search
         ):
-            ds_w_child.append(child_dataset)
-    return any(ds_w_child)
+            yield Level1Record(
+                id=result.id,
+                product=result.product,
+                uri=result.uri,
+                product_id=getattr(result, product_id_field),
+                scene_id=getattr(result, scene_id_field),
+                region_code=result.region_code,
+                time_end=_range_end(result.time),
+            )
 
 
-def calc_processed_ard_scene_ids(dc, product, sat_key):
+def count_outside_aoi(
+    dc, l1_product: str, time_range: "Range", region_codes: Iterable[str]
+) -> int:
+    """
+    How many datasets of the product within the time range are outside the AOI.
+
+    (Count queries only: the datasets themselves are never fetched.)
+    """
+    total = dc.index.datasets.count(product=l1_product, time=time_range)
+    inside = sum(
+        dc.index.datasets.count(product=l1_product, time=time_range, region_code=chunk)
+        for chunk in _region_code_chunks(region_codes)
+    )
+    return total - inside
+
+
+def datasets_with_final_child(dc, dataset_ids: Iterable[uuid.UUID]) -> Set[uuid.UUID]:
+    """
+    Of the given datasets, return the ids of those with any child that isn't archived,
+    with a dataset_maturity of 'final'.
+
+    This is a single query against dataset_source, rather than a get_derived() call
+    (and full Dataset objects for every child) per dataset.
+    """
+    dataset_ids = list(dataset_ids)
+    if not dataset_ids:
+        return set()
+    if not utils.has_alchemy_engine(dc.index):
+        # (eg. the in-memory index) There's only the index API.
+        return {
+            dataset_id
+            for dataset_id in dataset_ids
+            if any(
+                not child.is_archived and child.metadata.dataset_maturity == "final"
+                for child in dc.index.datasets.get_derived(dataset_id)
+            )
+        }
+
+    from datacube.drivers.postgres._schema import DATASET, DATASET_SOURCE
+    from sqlalchemy import select
+
+    child = DATASET.alias("child")
+    query = (
+        select([DATASET_SOURCE.c.source_dataset_ref])
+        .select_from(
+            DATASET_SOURCE.join(child, child.c.id == DATASET_SOURCE.c.dataset_ref)
+        )
+        .where(DATASET_SOURCE.c.source_dataset_ref.in_(dataset_ids))
+        .where(child.c.archived.is_(None))
+        .where(child.c.metadata[DATASET_MATURITY_OFFSET].astext == "final")
+        .distinct()
+    )
+    engine = utils.alchemy_engine(dc.index)
+    return {row[0] for row in engine.execute(query)}
+
+
+def _active_product_datasets(columns, product: str):
+    from datacube.drivers.postgres._schema import DATASET, PRODUCT
+    from sqlalchemy import select
+
+    return (
+        select(columns)
+        .select_from(DATASET.join(PRODUCT, PRODUCT.c.id == DATASET.c.dataset_type_ref))
+        .where(PRODUCT.c.name == product)
+        .where(DATASET.c.archived.is_(None))
+    )
+
+
+def latest_added(dc, product: str) -> Optional[datetime.datetime]:
+    """
+    When the newest active dataset of the product was added to the index.
+    """
+    if not utils.has_alchemy_engine(dc.index):
+        return max(
+            (
+                dataset.indexed_time
+                for dataset in dc.index.datasets.search(product=product)
+            ),
+            default=None,
+        )
+    from datacube.drivers.postgres._schema import DATASET
+    from sqlalchemy import func
+
+    engine = utils.alchemy_engine(dc.index)
+    return engine.execute(
+        _active_product_datasets([func.max(DATASET.c.added)], product)
+    ).scalar()
+
+
+def datasets_added_since(
+    dc, product: str, since: datetime.datetime
+) -> Dict[uuid.UUID, datetime.datetime]:
+    """
+    The active datasets of the product added to the index after the given time,
+    with when they were added.
+
+    (The `indexed_time` search field can't be searched by range, hence the query on dataset.added)
+    """
+    if not utils.has_alchemy_engine(dc.index):
+        # Without the database, every dataset of the product is looked at.
+        return {
+            dataset.id: dataset.indexed_time
+            for dataset in dc.index.datasets.search(product=product)
+            if dataset.indexed_time > since
+        }
+    from datacube.drivers.postgres._schema import DATASET
+
+    engine = utils.alchemy_engine(dc.index)
+    query = _active_product_datasets([DATASET.c.id, DATASET.c.added], product).where(
+        DATASET.c.added > since
+    )
+    return {dataset_id: added for dataset_id, added in engine.execute(query)}
+
+
+def _log_many_scenes(chopped_id: str, old_uuid: uuid.UUID, new_uuid: uuid.UUID):
+    # The same chopped scene id has multiple scenes
+    LOGGER.warning(
+        MANYSCENES,
+        landsat_scene_id=chopped_id,
+        old_uuid=old_uuid,
+        new_uuid=new_uuid,
+    )
+
+
+class ResidentArdScenes(NamedTuple):
+    """
+    The processed ARD scene ids of a product, kept in memory between a service's cycles.
+    """
+
+    # The ARD cache's watermark when they were read
+    refreshed_until: Optional[datetime.datetime]
+    # The earliest ARD time_end they include (if limited)
+    begin: Optional[datetime.datetime]
+    scenes: ProcessedArdScenes
+
+
+def _resident_ard_scenes(
+    cache: ProcessedArdCache,
+    time_range: Optional["Range"],
+    resident: Dict[str, ResidentArdScenes],
+) -> ProcessedArdScenes:
+    """
+    The cached scene ids, reusing those already in memory if the ARD hasn't changed since.
+    """
+    from datacube.model import Range
+
+    begin = None if time_range is None else time_range.begin
+    held = resident.get(cache.ard_product)
+    if (
+        held is not None
+        and held.refreshed_until == cache.refreshed_until
+        and (held.begin is None or (begin is not None and held.begin <= begin))
+    ):
+        return held.scenes
+
+    # Nothing is acquired after now, so leave the end open for later cycles.
+    scenes = cache.processed_ard_scenes(
+        None
+        if begin is None
+        else Range(begin, datetime.datetime.max.replace(tzinfo=datetime.timezone.utc)),
+        on_collision=_log_many_scenes,
+    )
+    resident[cache.ard_product] = ResidentArdScenes(
+        cache.refreshed_until, begin, scenes
+    )
+    return scenes
+
+
+def calc_processed_ard_scene_ids(
+    dc,
+    product,
+    sat_key,
+    time_range: Optional["Range"] = None,
+    cache_dir: Optional[Path] = None,
+    rebuild_cache: bool = False,
+    resident: Optional[Dict[str, ResidentArdScenes]] = None,
+) -> Optional[ProcessedArdScenes]:
     """
     Return None or
-    a dictionary with key chopped_scene_id and value id, maturity level.
+    a mapping with key chopped_scene_id and value id, maturity level.
+
+    If a time range is given, only the ARD within it (plus a margin) are included.
+
+    With a cache_dir, the ARD product's scene ids are kept there between runs, and only
+    refreshed with what has changed since (or rebuilt in full, if rebuild_cache).
+    With a resident dict too, they're also kept there in memory (for a long-running
+    service), and only re-read when the ARD has changed.
     """
+    from datacube.model import Range
+
     if product in ARD_PARENT_PRODUCT_MAPPING:  # and sat_key == "ls":
-        processed_ard_scene_ids = {}
+        ard_product = ARD_PARENT_PRODUCT_MAPPING[product]
         if sat_key == "ls":
             scene_id = "landsat_scene_id"
         elif sat_key == "s2":
             scene_id = "sentinel_tile_id"
-        for result in dc.index.datasets.search_returning(
-            (scene_id, "dataset_maturity", "id"),
-            product=ARD_PARENT_PRODUCT_MAPPING[product],
-        ):
-            if sat_key == "ls":
-                chopped_id = utils.chopped_scene_id(result.landsat_scene_id)
-            elif sat_key == "s2":
-                chopped_id = result.sentinel_tile_id
-            else:
-                raise RuntimeError(f"Unsupported sat_key: {sat_key!r}")
-            if chopped_id in processed_ard_scene_ids:
-                # The same chopped scene id has multiple scenes
-                old_uuid = processed_ard_scene_ids[chopped_id]["id"]
-                LOGGER.warning(
-                    MANYSCENES,
-                    landsat_scene_id=chopped_id,
-                    old_uuid=old_uuid,
-                    new_uuid=result.id,
+        else:
+            raise RuntimeError(f"Unsupported sat_key: {sat_key!r}")
+
+        if time_range is not None:
+            time_range = Range(
+                time_range.begin - PROCESSED_ARD_TIME_MARGIN,
+                time_range.end + PROCESSED_ARD_TIME_MARGIN,
+            )
+
+        def search_ard(**query) -> Iterator[ArdEntry]:
+            for result in dc.index.datasets.search_returning(
+                (scene_id, "dataset_maturity", "id", "time"),
+                product=ard_product,
+                **query,
+            ):
+                if sat_key == "ls":
+                    chopped_id = utils.chopped_scene_id(result.landsat_scene_id)
+                else:
+                    chopped_id = result.sentinel_tile_id
+                yield ArdEntry(
+                    chopped_id,
+                    result.id,
+                    result.dataset_maturity,
+                    _range_end(result.time),
                 )
-            processed_ard_scene_ids[chopped_id] = {
-                "dataset_maturity": result.dataset_maturity,
-                "id": result.id,
-            }
+
+        if cache_dir is not None:
+            with ProcessedArdCache(cache_dir, ard_product) as cache:
+                cache.refresh(dc, search_ard, rebuild=rebuild_cache)
+                if resident is None:
+                    processed_ard_scene_ids = cache.processed_ard_scenes(
+                        time_range, on_collision=_log_many_scenes
+                    )
+                else:
+                    processed_ard_scene_ids = _resident_ard_scenes(
+                        cache, time_range, resident
+                    )
+        else:
+            query = {} if time_range is None else {"time": time_range}
+            processed_ard_scene_ids = ProcessedArdScenes(
+                (entry[:3] for entry in search_ard(**query)),
+                on_collision=_log_many_scenes,
+            )
     else:
         # scene select has its own mapping for l1 product to ard product
         # (ARD_PARENT_PRODUCT_MAPPING).
@@ -291,27 +667,31 @@ def get_aoi_sat_key(region_codes: Dict, product: str):
     return aoi_sat_key
 
 
-def filter_ancillary(l1_dataset, ancill_there, msg, interim_days_wait, temp_logger):
+def filter_ancillary(
+    l1_record: Level1Record,
+    ancill_there,
+    msg,
+    eligibility: EligibilityCalendar,
+    temp_logger,
+):
     # filter out due to ancillary
     # not being there
     filter_out = False
     if ancill_there is False:
-        days_ago = datetime.datetime.now(
-            l1_dataset.time.end.tzinfo
-        ) - datetime.timedelta(days=interim_days_wait)
-        if days_ago > l1_dataset.time.end:
+        days_ago = eligibility.interim_cutoff
+        if eligibility.can_process_to_interim(l1_record.time_end):
             # If the ancillary files take too long to turn up
             # process anyway
             kwargs = {
                 "days_ago": str(days_ago),
-                "dataset.time.end": str(l1_dataset.time.end),
+                "dataset.time.end": str(l1_record.time_end),
             }
             temp_logger.debug(f"{msg} Processing to interim", **kwargs)
         else:
             kwargs = {
                 REASON: "ancillary files not ready",
                 "days_ago": str(days_ago),
-                "dataset.time.end": str(l1_dataset.time.end),
+                "dataset.time.end": str(l1_record.time_end),
                 MSG: (f"Not ready: {msg}"),
             }
             temp_logger.info(SCENEREMOVED, **kwargs)
@@ -320,8 +700,7 @@ def filter_ancillary(l1_dataset, ancill_there, msg, interim_days_wait, temp_logg
 
 
 def filter_reprocessed_scenes(
-    dc,
-    l1_dataset,
+    has_final_child,
     processed_ard_scene_ids,
     find_blocked,
     ancill_there,
@@ -335,7 +714,7 @@ def filter_reprocessed_scenes(
     # But any chopped_scene_id in processed_ard_scene_ids
     # will now be a blocked reprocessed scene
     if find_blocked:
-        if dataset_with_final_child(dc, l1_dataset):
+        if has_final_child:
             temp_logger.debug(
                 SCENEREMOVED, **{REASON: "Skipping dataset with children"}
             )
@@ -344,10 +723,10 @@ def filter_reprocessed_scenes(
     if processed_ard_scene_ids and not filter_out:
         if choppedsceneid in processed_ard_scene_ids:
             kwargs = {}
-            produced_ard = processed_ard_scene_ids[choppedsceneid]
+            produced_ard: ProcessedArd = processed_ard_scene_ids[choppedsceneid]
             if find_blocked:
                 kwargs[REASON] = "Potential blocked reprocessed scene."
-                kwargs["Blocking_ard_scene_id"] = str(produced_ard["id"])
+                kwargs["Blocking_ard_scene_id"] = str(produced_ard.id)
                 # Since all dataset with final childs
                 # have been filtered out
             else:
@@ -356,9 +735,9 @@ def filter_reprocessed_scenes(
                 # filtered out we don't know why there is
                 # an ard there.
 
-            if produced_ard["dataset_maturity"] == "interim" and ancill_there is True:
+            if produced_ard.dataset_maturity == "interim" and ancill_there is True:
                 # lets build a list of ARD uuid's to delete
-                uuids2archive.append(str(produced_ard["id"]))
+                uuids2archive.append(str(produced_ard.id))
 
                 temp_logger.debug(
                     SCENEADDED, **{REASON: "Interim scene is being processed to final"}
@@ -371,13 +750,282 @@ def filter_reprocessed_scenes(
     return filter_out
 
 
-def month_as_range(year: int, month: int) -> Range:
+@define
+class SceneCandidate:
+    """
+    A Level 1 scene on its way through the filter stages.
+    """
+
+    record: Level1Record
+    file_path: str
+    chopped_scene_id: str
+    log: SceneLog
+    # Set by the ancillary stage
+    ancill_there: Optional[bool] = None
+
+
+class ProcessingLevelStage(FilterStage):
+    """Filter out if the processing level is too low"""
+
+    name = "processing_level"
+    cost = 2.0
+    selectivity = 0.9
+    settles = True
+
+    def __init__(self, pattern: str):
+        super().__init__()
+        self.pattern = re.compile(pattern)
+
+    def keep(self, candidate: SceneCandidate) -> bool:
+        if not self.pattern.match(candidate.record.product_id):
+            candidate.log.debug(SCENEREMOVED, **{REASON: "Processing level too low"})
+            return False
+        return True
+
+
+OUTSIDE_AOI = "Region not in AOI"
+
+
+class AoiStage(FilterStage):
+    """
+    Filter out if outside area of interest
+
+    (The AOI is normally part of the search, so this only catches what a search didn't
+    filter, such as one by dataset id.)
+    """
+
+    name = "aoi"
+    cost = 1.0
+    selectivity = 0.5
+    settles = True
+
+    def __init__(self, region_codes: Set[str]):
+        super().__init__()
+        self.region_codes = region_codes
+
+    def keep(self, candidate: SceneCandidate) -> bool:
+        region_code = candidate.record.region_code
+        if region_code not in self.region_codes:
+            kwargs = {
+                REASON: OUTSIDE_AOI,
+                "region_code": region_code,
+            }
+            candidate.log.debug(SCENEREMOVED, **kwargs)
+            return False
+        return True
+
+
+class AncillaryStage(FilterStage):
+    """
+    Filter out if a maturity level of final cannot be produced since the ancillary
+    files are not there (unless we've waited long enough to produce an interim).
+    """
+
+    name = "ancillary"
+    cost = 5.0
+    selectivity = 0.8
+
+    def __init__(self, ancillary_ob: AncillaryFiles, eligibility: EligibilityCalendar):
+        super().__init__()
+        self.ancillary_ob = ancillary_ob
+        self.eligibility = eligibility
+        self.checked_ancillary = {}
+
+    def prepare(self, candidates: List[SceneCandidate]):
+        # The whole batch is checked in one go.
+        ancill_there, msgs = self.ancillary_ob.ancillary_files_batch(
+            [candidate.record.time_end for candidate in candidates]
+        )
+        self.checked_ancillary = {
+            candidate.record.id: (bool(there), msg)
+            for candidate, there, msg in zip(candidates, ancill_there, msgs)
+        }
+
+    def keep(self, candidate: SceneCandidate) -> bool:
+        ancill_there, msg = self.checked_ancillary[candidate.record.id]
+        candidate.ancill_there = ancill_there
+        return not filter_ancillary(
+            candidate.record, ancill_there, msg, self.eligibility, candidate.log
+        )
+
+
+class ExcludedDaysStage(FilterStage):
+    """
+    Filter out if acquired on an excluded day.
+
+    (The excluded periods are left out of the month searches, so this only catches what
+    a search didn't filter, such as one by dataset id.)
+
+    Excluded scenes aren't kept pending by incremental runs: once an exclusion is
+    lifted, a --full-scan finds them.
+    """
+
+    name = "excluded_days"
+    selectivity = 0.99
+    settles = True
+
+    def __init__(self, eligibility: EligibilityCalendar):
+        super().__init__()
+        self.eligibility = eligibility
+        self.excluded = {}
+
+    def prepare(self, candidates: List[SceneCandidate]):
+        # One vectorised check for the batch.
+        excluded = self.eligibility.is_excluded(
+            [candidate.record.time_end for candidate in candidates]
+        )
+        self.excluded = {
+            candidate.record.id: bool(is_excluded)
+            for candidate, is_excluded in zip(candidates, excluded)
+        }
+
+    def keep(self, candidate: SceneCandidate) -> bool:
+        # FIXME remove the hard-coded list
+        if self.excluded[candidate.record.id]:
+            kwargs = {
+                DATASETTIMEEND: candidate.record.time_end,
+                REASON: "This day is excluded.",
+            }
+            candidate.log.info(SCENEREMOVED, **kwargs)
+            return False
+        return True
+
+
+DUPLICATE_PATH = "Potential multi-granule duplicate file path removed."
+
+
+class DuplicatePathStage(FilterStage):
+    """Filter out duplicate zips"""
+
+    name = "duplicate_path"
+    sequential = True
+
+    def __init__(self, files2process: Set[str]):
+        super().__init__()
+        self.files2process = files2process
+
+    def keep(self, candidate: SceneCandidate) -> bool:
+        if candidate.file_path in self.files2process:
+            kwargs = {
+                REASON: DUPLICATE_PATH,
+                "duplicate count": self.removed + 1,
+            }
+            candidate.log.debug(SCENEREMOVED, **kwargs)
+            return False
+        return True
+
+    def accepted(self, candidate: SceneCandidate):
+        self.files2process.add(candidate.file_path)
+
+
+class FinalChildStage(FilterStage):
+    """
+    Filter out scenes with any child that isn't archived, with a dataset_maturity of 'final'.
+
+    The lineage of every scene in the chunk is fetched in one query. (Before any are
+    checked, as the reprocessed stage before this one asks for it too.)
+    """
+
+    name = "final_child"
+    sequential = True
+    settles = True
+
+    def __init__(self, dc):
+        super().__init__()
+        self.dc = dc
+        self.final_child_ids = set()
+
+    def prepare(self, candidates: List[SceneCandidate]):
+        self.final_child_ids = datasets_with_final_child(
+            self.dc, (candidate.record.id for candidate in candidates)
+        )
+
+    def has_final_child(self, candidate: SceneCandidate) -> bool:
+        return candidate.record.id in self.final_child_ids
+
+    def keep(self, candidate: SceneCandidate) -> bool:
+        # WARNING any filter after the reprocessed stage will
+        # be executed on interim scenes that it is assumed will
+        # be processed
+        if self.has_final_child(candidate):
+            candidate.log.debug(
+                SCENEREMOVED, **{REASON: "Skipping dataset with children"}
+            )
+            return False
+        return True
+
+
+class ReprocessedStage(FilterStage):
+    """
+    Filter out scenes that already have an ARD (or that are blocked by one),
+    except for interims that can now be processed to final.
+    """
+
+    name = "reprocessed"
+    sequential = True
+
+    def __init__(
+        self,
+        processed_ard_scene_ids: Optional[ProcessedArdScenes],
+        find_blocked: bool,
+        final_children: FinalChildStage,
+        uuids2archive: List[str],
+        archived: Optional[List[Tuple[datetime.datetime, str, str, str]]] = None,
+    ):
+        """
+        :param archived: also given each ARD uuid to archive, with the acquisition time,
+                         dataset id and file path of the scene that replaces it
+        """
+        super().__init__()
+        self.processed_ard_scene_ids = processed_ard_scene_ids
+        self.find_blocked = find_blocked
+        self.final_children = final_children
+        self.uuids2archive = uuids2archive
+        self.archived = archived
+
+    def keep(self, candidate: SceneCandidate) -> bool:
+        already_archived = len(self.uuids2archive)
+        removed = filter_reprocessed_scenes(
+            self.final_children.has_final_child(candidate),
+            self.processed_ard_scene_ids,
+            self.find_blocked,
+            candidate.ancill_there,
+            self.uuids2archive,
+            candidate.chopped_scene_id,
+            candidate.log,
+        )
+        if self.archived is not None:
+            self.archived.extend(
+                (
+                    candidate.record.time_end,
+                    ard_uuid,
+                    str(candidate.record.id),
+                    candidate.file_path,
+                )
+                for ard_uuid in self.uuids2archive[already_archived:]
+            )
+        return not removed
+
+    def removed_for_good(self, candidate: SceneCandidate) -> bool:
+        # Only once it has a final ARD. (An interim may yet be replaced.)
+        if self.find_blocked and self.final_children.has_final_child(candidate):
+            return True
+        processed = self.processed_ard_scene_ids
+        return bool(processed) and (
+            candidate.chopped_scene_id in processed
+            and processed[candidate.chopped_scene_id].dataset_maturity == "final"
+        )
+
+
+def month_as_range(year: int, month: int) -> "Range":
     """
     >>> month_as_range(2024, 2)
     Range(begin=datetime.datetime(2024, 2, 1, 0, 0), end=datetime.datetime(2024, 2, 29, 23, 59, 59, 999999))
     >>> month_as_range(2023, 12)
     Range(begin=datetime.datetime(2023, 12, 1, 0, 0), end=datetime.datetime(2023, 12, 31, 23, 59, 59, 999999))
     """
+    from datacube.model import Range
+
     week_day, number_of_days = calendar.monthrange(year, month)
     return Range(
         datetime.datetime(year, month, 1),
@@ -407,11 +1055,124 @@ def _month_iterator(
             current_year += 1
 
 
-MAX_DATE = default_utc(datetime.datetime.utcnow())
-MIN_DATE = MAX_DATE - datetime.timedelta(days=60)
+def month_search_ranges(
+    start_time: datetime.date,
+    end_time: datetime.date,
+    eligibility: EligibilityCalendar,
+) -> List["Range"]:
+    """
+    The time ranges to search, month by month (oldest first), leaving out the excluded
+    periods. (A month may be split into several ranges, or left out entirely.)
+    """
+    from datacube.model import Range
+
+    return [
+        Range(begin, end)
+        for year, month in _month_iterator(start_time, end_time)
+        for begin, end in eligibility.included_periods(*month_as_range(year, month))
+    ]
+
+
+def searched_months_range(
+    start_time: datetime.date, end_time: datetime.date
+) -> "Range":
+    """
+    All of the months that a search between the two times looks in (from the start of the
+    first to the end of the last), as month_search_ranges() searches whole months.
+
+    >>> searched_months_range(datetime.datetime(2020, 8, 10), datetime.datetime(2020, 9, 3))
+    Range(begin=datetime.datetime(2020, 8, 1, 0, 0), end=datetime.datetime(2020, 9, 30, 23, 59, 59, 999999))
+    """
+    from datacube.model import Range
+
+    return Range(
+        month_as_range(start_time.year, start_time.month).begin,
+        month_as_range(end_time.year, end_time.month).end,
+    )
+
+
+def _fetch_months(
+    fetch: Callable[["Range"], list],
+    month_ranges: List["Range"],
+    month_workers: int = 1,
+) -> Iterator[list]:
+    """
+    Yield fetch(month_range) for each month range, in the order given.
+
+    With more than one worker, the months are fetched concurrently, sharing the index's
+    connection pool. Results are still yielded in order, so the caller sees exactly what a
+    serial run would.
+    """
+    if month_workers <= 1:
+        for month_range in month_ranges:
+            yield fetch(month_range)
+        return
+
+    month_workers = min(month_workers, MAX_MONTH_WORKERS)
+    month_ranges = iter(month_ranges)
+    with ThreadPoolExecutor(
+        max_workers=month_workers, thread_name_prefix="month-search"
+    ) as executor:
+        # Only a few months are searched ahead, so a caller that stops early doesn't
+        # wait on the rest.
+        in_flight = deque(
+            executor.submit(fetch, month_range)
+            for month_range in islice(month_ranges, month_workers)
+        )
+        while in_flight:
+            result = in_flight.popleft().result()
+            for month_range in islice(month_ranges, 1):
+                in_flight.append(executor.submit(fetch, month_range))
+            yield result
+
+
+# How far back a run looks for level 1s
+SCAN_WINDOW = datetime.timedelta(days=60)
+# Where the service keeps the ARD scene ids (in the log dir), if not told
+SERVICE_ARD_CACHE_DIR = "ard-cache"
+
+
+def scan_window(
+    now: Optional[datetime.datetime] = None,
+) -> Tuple[datetime.datetime, datetime.datetime]:
+    """
+    The (min, max) acquisition times a run looks at: the SCAN_WINDOW up to now.
+
+    (Worked out for each run, so a long-running service keeps up with the time.)
+    """
+    max_date = default_utc(now or datetime.datetime.utcnow())
+    return max_date - SCAN_WINDOW, max_date
+
 
+@define
+class L1FilterRun:
+    """
+    What a run of `iter_l1_filter` found, besides the scenes it yielded.
+
+    Filled in as the scenes are yielded, and complete once the iteration ends (or is closed).
+    """
 
-def l1_filter(
+    uuids2archive: List[str] = Factory(list)
+    # How many scenes were yielded
+    accepted: int = 0
+    duplicates: int = 0
+    stage_summary: Dict = Factory(dict)
+    scan_state: Optional[ScanState] = None
+    # Was every scene looked at? (ie. the caller didn't stop early)
+    complete: bool = False
+    # The count, and a sample, of the scenes removed (or added) for each reason
+    decisions: Dict = Factory(dict)
+    # The (file path, decision) of each scene looked at, if they're being recorded
+    ledger: List[Tuple[str, Decision]] = Factory(list)
+    # The (acquisition time, file path, dataset id) of each scene yielded, and the
+    # (acquisition time, ARD uuid, dataset id and file path of the scene replacing it)
+    # of each to archive, to merge shards in the order of a serial run (and to archive
+    # only those whose replacement is selected).
+    selected: List[Tuple[datetime.datetime, str, str]] = Factory(list)
+    archived: List[Tuple[datetime.datetime, str, str, str]] = Factory(list)
+
+
+def iter_l1_filter(
     dc,
     l1_product,
     brdfdir: Path,
@@ -423,10 +1184,29 @@ def l1_filter(
     interim_days_wait: int,
     days_to_exclude: List,
     find_blocked: bool,
-    min_date: datetime.datetime = MIN_DATE,
-    max_date: datetime.datetime = MAX_DATE,
-):
-    """return
+    min_date: Optional[datetime.datetime] = None,
+    max_date: Optional[datetime.datetime] = None,
+    month_workers: int = 1,
+    eligibility: Optional[EligibilityCalendar] = None,
+    ancillary_cache: Optional[Path] = None,
+    scan_state: Optional[ScanState] = None,
+    ard_cache_dir: Optional[Path] = None,
+    rebuild_ard_cache: bool = False,
+    log_sample_size: int = DECISION_SAMPLE_SIZE,
+    log_all_decisions: bool = False,
+    record_decisions: bool = False,
+    ancillary_ob: Optional[AncillaryFiles] = None,
+    resident_ards: Optional[Dict[str, ResidentArdScenes]] = None,
+    count_outside: bool = True,
+    shard: Optional[Tuple[int, int]] = None,
+    run: Optional[L1FilterRun] = None,
+) -> Iterator[str]:
+    """
+    Yield the file paths of the level 1 scenes to ARD process, newest acquisition first.
+
+    Scenes are only checked as they're needed, so a caller that has enough can stop early,
+    and the remaining (older) scenes are never checked against the index.
+
     @param dc:
     @param l1_product: l1 product
     @param brdfdir:
@@ -435,139 +1215,501 @@ def l1_filter(
     @param interim_days_wait:
     @param days_to_exclude:
     @param find_blocked:
-    @return: a list of file paths to ARD process
+    @param min_date: the earliest acquisition to look at (default: the start of scan_window())
+    @param max_date: the latest acquisition to look at (default: now)
+    @param month_workers: how many month windows to search concurrently
+    @param eligibility: the run's excluded periods and interim cutoff
+                        (built from interim_days_wait and days_to_exclude if not given)
+    @param ancillary_cache: a local file to cache ancillary availability in, between runs
+    @param scan_state: what the last run saw of this product. If it has a watermark, only the
+                       datasets added since then (and its pending ones) are looked at.
+    @param ard_cache_dir: a local directory to keep the ARD products' scene ids in, between runs
+    @param rebuild_ard_cache: rebuild the cached ARD scene ids in full
+    @param log_sample_size: how many scenes of each reason to log individually
+    @param log_all_decisions: log every scene's removal individually, not just a sample
+    @param record_decisions: keep the decision about every scene in the run, for the ledger
+    @param ancillary_ob: the ancillary checker to use (eg. one kept between runs), rather
+                         than a new one
+    @param resident_ards: processed ARD scene ids kept in memory between runs
+                          (with an ard_cache_dir)
+    @param count_outside: count the datasets outside the AOI, for the summary. (They're
+                          never fetched, so it's a separate count query.)
+    @param shard: (index, count): only look at the regions in this shard of the AOI
+                  (see region_shard()). A product without an AOI is all in the first.
+    @param run: filled in with the ARD uuids to archive, the duplicate count,
+                the counts and timings of each filter stage, the decisions made,
+                and the scan state for the next run (if a scan_state was given)
     """
     # pylint: disable=R0913, R0914
     # R0913: Too many arguments
     # R0914: Too many local variables
+    from datacube.model import Range
+
+    if run is None:
+        run = L1FilterRun()
+    decisions = DecisionLog(sample_size=log_sample_size, log_all=log_all_decisions)
 
     sat_key = get_aoi_sat_key(region_codes, l1_product)
+    if shard is not None and sat_key is None and shard[0] != 0:
+        # Not partitioned by region, so the first shard looks at it all.
+        run.complete = True
+        return
+    if eligibility is None:
+        eligibility = EligibilityCalendar.from_options(
+            days_to_exclude, interim_days_wait
+        )
+
+    if min_date is None or max_date is None:
+        window_start, window_end = scan_window()
+        min_date = min_date or window_start
+        max_date = max_date or window_end
+    product_start_time, product_end_time = dc.index.datasets.get_product_time_bounds(
+        product=l1_product
+    )
+
+    if min_date:
+        product_start_time = max(product_start_time, min_date)
+    if max_date:
+        product_end_time = min(product_end_time, max_date)
 
     # This is used to block reprocessing of reprocessed l1's
-    processed_ard_scene_ids = calc_processed_ard_scene_ids(dc, l1_product, sat_key)
+    # (only the ARD of the level 1s we're going to look at are needed: those of every
+    # month searched, not just between the min and max dates)
+    processed_ard_scene_ids = calc_processed_ard_scene_ids(
+        dc,
+        l1_product,
+        sat_key,
+        searched_months_range(product_start_time, product_end_time),
+        cache_dir=ard_cache_dir,
+        rebuild_cache=rebuild_ard_cache,
+        resident=resident_ards,
+    )
 
     # Don't crash on unknown l1 products
     if l1_product not in PROCESSING_PATTERN_MAPPING:
         msg = " not known to scene select processing filtering. Disabling processing filtering."
         LOGGER.warn(l1_product + msg)
 
-    ancillary_ob = AncillaryFiles(
-        brdf_dir=brdfdir,
-        viirs_i_path=i_viirsdir,
-        viirs_m_path=m_viirsdir,
-        wv_dir=wvdir,
-        use_viirs_after=use_viirs_after,
-    )
+    if ancillary_ob is None:
+        ancillary_ob = AncillaryFiles(
+            brdf_dir=brdfdir,
+            viirs_i_path=i_viirsdir,
+            viirs_m_path=m_viirsdir,
+            wv_dir=wvdir,
+            use_viirs_after=use_viirs_after,
+            cache_path=ancillary_cache,
+        )
     files2process = set({})
-    duplicates = 0
-    uuids2archive = []
-    product_start_time, product_end_time = dc.index.datasets.get_product_time_bounds(
-        product=l1_product
+    uuids2archive = run.uuids2archive
+
+    # The independent stages are reordered by their cost and selectivity, the sequential
+    # ones (which depend on earlier decisions) run last, in this order.
+    stages = [
+        AncillaryStage(ancillary_ob, eligibility),
+        ExcludedDaysStage(eligibility),
+    ]
+    if l1_product in PROCESSING_PATTERN_MAPPING:
+        stages.append(ProcessingLevelStage(PROCESSING_PATTERN_MAPPING[l1_product]))
+    aoi = None
+    # The regions searched
+    search_aoi = None
+    if sat_key is not None:
+        aoi = region_codes[sat_key]
+        stages.append(AoiStage(aoi))
+        search_aoi = aoi
+        if shard is not None:
+            shard_index, shard_count = shard
+            search_aoi = {
+                region_code
+                for region_code in aoi
+                if region_shard(region_code, shard_count) == shard_index
+            }
+    duplicate_stage = DuplicatePathStage(files2process)
+    final_child_stage = FinalChildStage(dc)
+    stages += [
+        duplicate_stage,
+        ReprocessedStage(
+            processed_ard_scene_ids,
+            find_blocked,
+            final_child_stage,
+            uuids2archive,
+            archived=run.archived,
+        ),
+        final_child_stage,
+    ]
+
+    def record(candidate: SceneCandidate, decision: str, stage: Optional[str] = None):
+        run.ledger.append(
+            (
+                candidate.file_path,
+                Decision(
+                    scene_id=candidate.record.product_id,
+                    dataset_id=str(candidate.record.id),
+                    product=l1_product,
+                    region_code=candidate.record.region_code,
+                    acquisition_date=candidate.record.time_end.date().isoformat(),
+                    decision=decision,
+                    stage=stage,
+                    reason=candidate.log.reason,
+                ),
+            )
+        )
+
+    pipeline = FilterPipeline(
+        stages,
+        on_removed=(
+            (lambda stage, candidate: record(candidate, REMOVED, stage.name))
+            if record_decisions
+            else None
+        ),
     )
 
-    if min_date:
-        product_start_time = max(product_start_time, min_date)
-    if max_date:
-        product_end_time = min(product_end_time, max_date)
+    next_scan_state = None
+    incremental = scan_state is not None and scan_state.is_incremental
+    if scan_state is not None:
+        # The watermark is from the database's clock, never ours, and taken before searching
+        # so that anything added during this run is seen by the next.
+        next_scan_state = ScanState(watermark=scan_state.watermark)
+        if incremental:
+            added = datasets_added_since(dc, l1_product, scan_state.added_since)
+            next_scan_state.watermark = max([scan_state.watermark, *added.values()])
+            dataset_ids = sorted(set(added) | scan_state.pending)
+        else:
+            next_scan_state.watermark = latest_added(dc, l1_product)
+
+    if incremental:
+        # Only the new and pending datasets, by id. (There are few, so they're all
+        # fetched at once to be sorted by time.)
+        def fetch(ids: List[uuid.UUID]) -> List[Level1Record]:
+            return list(
+                search_l1_records(
+                    dc,
+                    [l1_product],
+                    sat_key,
+                    Range(product_start_time, product_end_time),
+                    region_codes=search_aoi,
+                    id=ids,
+                )
+            )
 
-    # Query month-by-month to make DB queries smaller.
-    # Note that we may receive the same dataset multiple times due to boundaries (hence: results as a set)
-    for year, month in _month_iterator(product_start_time, product_end_time):
-        for l1_dataset in dc.index.datasets.search(
-            product=l1_product, time=month_as_range(year, month)
-        ):
-            if sat_key == "ls":
-                product_id = l1_dataset.metadata.landsat_product_id
-                choppedsceneid = utils.chopped_scene_id(
-                    l1_dataset.metadata.landsat_scene_id
+        id_chunks = [
+            dataset_ids[i : i + ID_SEARCH_CHUNK]
+            for i in range(0, len(dataset_ids), ID_SEARCH_CHUNK)
+        ]
+        batches = [
+            [
+                record
+                for records in _fetch_months(fetch, id_chunks, month_workers)
+                for record in records
+            ]
+        ]
+    else:
+
+        def fetch(month_range: "Range") -> List[Level1Record]:
+            return list(
+                search_l1_records(
+                    dc, [l1_product], sat_key, month_range, region_codes=search_aoi
                 )
-            elif sat_key == "s2":
-                product_id = l1_dataset.metadata.sentinel_tile_id
-                # S2 has no eqivalent to a scene id
-                # I'm using sentinel_tile_id.  This will work for handling interim to final.
-                # it will not catch duplicates.
-                choppedsceneid = l1_dataset.metadata.sentinel_tile_id
-            region_code = l1_dataset.metadata.region_code
-            file_path = utils.calc_file_path(l1_dataset, product_id)
-            # Set up the logging
-            temp_logger = LOGGER.bind(
-                landsat_scene_id=product_id,
-                dataset_id=str(l1_dataset.id),
-                dataset_path=file_path,
             )
 
-            # Filter out if the processing level is too low
-            if l1_product in PROCESSING_PATTERN_MAPPING:
-                prod_pattern = PROCESSING_PATTERN_MAPPING[l1_product]
-                if not re.match(prod_pattern, product_id):
-                    temp_logger.debug(
-                        SCENEREMOVED, **{REASON: "Processing level too low"}
-                    )
-                    continue
-
-            # Filter out if outside area of interest
-            if sat_key is not None and region_code not in region_codes[sat_key]:
-                kwargs = {
-                    REASON: "Region not in AOI",
-                    "region_code": region_code,
-                }
-                temp_logger.debug(SCENEREMOVED, **kwargs)
-                continue
+        # (The whole AOI, counted once across the shards)
+        if count_outside and aoi is not None and (shard is None or shard[0] == 0):
+            decisions.add_count(
+                SCENEREMOVED,
+                OUTSIDE_AOI,
+                count_outside_aoi(
+                    dc, l1_product, Range(product_start_time, product_end_time), aoi
+                ),
+            )
 
-            ancill_there, msg = ancillary_ob.ancillary_files(l1_dataset.time.end)
-            # Continue here if a maturity level of final cannot be produced
-            # since the ancillary files are not there
-            if filter_ancillary(
-                l1_dataset, ancill_there, msg, interim_days_wait, temp_logger
-            ):
-                continue
-
-            # FIXME remove the hard-coded list
-            if exclude_days(days_to_exclude, l1_dataset.time.end):
-                kwargs = {
-                    DATASETTIMEEND: l1_dataset.time.end,
-                    REASON: "This day is excluded.",
-                }
-                temp_logger.info(SCENEREMOVED, **kwargs)
-                continue
-
-            # Filter out duplicate zips
-            if file_path in files2process:
-                duplicates += 1
-                kwargs = {
-                    REASON: "Potential multi-granule duplicate file path removed.",
-                    "duplicate count": duplicates,
-                }
-                temp_logger.debug(SCENEREMOVED, **kwargs)
-                continue
-
-            if filter_reprocessed_scenes(
-                dc,
-                l1_dataset,
-                processed_ard_scene_ids,
-                find_blocked,
-                ancill_there,
-                uuids2archive,
-                choppedsceneid,
-                temp_logger,
+        # Query month-by-month to make DB queries smaller, newest month first.
+        # Note that we may receive the same dataset multiple times due to boundaries (hence: results as a set)
+        # The excluded periods are left out of the searches, so are never fetched.
+        month_ranges = month_search_ranges(
+            product_start_time, product_end_time, eligibility
+        )
+        batches = _fetch_months(fetch, month_ranges[::-1], month_workers)
+
+    try:
+        for month_records in batches:
+            candidates = []
+            # Newest first (the index gives them in no particular order).
+            for l1_record in sorted(
+                month_records, key=lambda record: record.time_end, reverse=True
             ):
-                continue
+                if sat_key == "ls":
+                    choppedsceneid = utils.chopped_scene_id(l1_record.scene_id)
+                else:
+                    # S2 has no eqivalent to a scene id
+                    # I'm using sentinel_tile_id.  This will work for handling interim to final.
+                    # it will not catch duplicates.
+                    choppedsceneid = l1_record.scene_id
+                file_path = utils.calc_file_path(l1_record, l1_record.product_id)
+                candidates.append(
+                    SceneCandidate(
+                        record=l1_record,
+                        file_path=file_path,
+                        chopped_scene_id=choppedsceneid,
+                        # Set up the logging
+                        log=decisions.scene(
+                            l1_record.product_id,
+                            landsat_scene_id=l1_record.product_id,
+                            dataset_id=str(l1_record.id),
+                            dataset_path=file_path,
+                        ),
+                    )
+                )
 
-            # WARNING any filter under here will
-            # be executed on interim scenes that it is assumed will
-            # be processed
+            # Accepted scenes are added to files2process by the duplicate stage.
+            for candidate in pipeline.iter_run(candidates, chunk_size=SEQUENTIAL_CHUNK):
+                run.accepted += 1
+                run.selected.append(
+                    (
+                        candidate.record.time_end,
+                        candidate.file_path,
+                        str(candidate.record.id),
+                    )
+                )
+                if record_decisions:
+                    record(candidate, SELECTED)
+                yield candidate.file_path
+
+            if next_scan_state is not None:
+                # Everything not settled, including the scenes selected (until their
+                # final ARD turns up, in case processing them fails).
+                settled = {candidate.record.id for candidate in pipeline.settled}
+                next_scan_state.pending.update(
+                    candidate.record.id
+                    for candidate in candidates
+                    if candidate.record.id not in settled
+                )
+        run.complete = True
+    finally:
+        run.duplicates = duplicate_stage.removed
+        run.stage_summary = pipeline.summary()
+        run.decisions = decisions.summary()
+        if next_scan_state is not None and not run.complete:
+            # Some scenes were never looked at, so the next run must look again at
+            # everything this one could have.
+            next_scan_state = ScanState(
+                watermark=scan_state.watermark,
+                pending=scan_state.pending | next_scan_state.pending,
+            )
+        run.scan_state = next_scan_state
 
-            # LOGGER.debug("location:pre dataset_with_final_child")
-            # If any child exists that isn't archived
-            if dataset_with_final_child(dc, l1_dataset):
-                temp_logger.debug(
-                    SCENEREMOVED, **{REASON: "Skipping dataset with children"}
+
+def l1_filter(dc, l1_product, *args, **kwargs):
+    """
+    Run iter_l1_filter to the end.
+
+    @return: a list of file paths to ARD process, the ARD uuids to archive,
+             the duplicate count, the counts and timings of each filter stage,
+             and the scan state for the next run (if a scan_state was given)
+    """
+    run = L1FilterRun()
+    # Sorted, so the result doesn't depend on (per-process) string hashing.
+    files2process = sorted(iter_l1_filter(dc, l1_product, *args, run=run, **kwargs))
+    return (
+        files2process,
+        run.uuids2archive,
+        run.duplicates,
+        run.stage_summary,
+        run.scan_state,
+    )
+
+
+def _newest_first(scenes: List[Iterable[str]], scene_limit: int) -> List[str]:
+    """
+    Merge the (newest-first) scene paths of each product, stopping at the limit.
+    """
+    # Each product's scenes are already newest first, so the merge only ever takes the
+    # next scene of each.
+    newest = list(
+        islice(heapq.merge(*scenes, key=_get_path_date, reverse=True), scene_limit)
+    )
+    # (in case a product's filenames disagree with their acquisition times)
+    newest.sort(key=_get_path_date, reverse=True)
+    return newest
+
+
+def _cut_off_at_limit(
+    runs: List[L1FilterRun],
+    run_scenes: List[List[str]],
+    scan_states: List[Optional[ScanState]],
+    paths_to_process: List[str],
+):
+    """
+    Mark the runs that lost scenes to the scene limit (when merged) as incomplete, as a
+    serial run would have stopped early, and keep their previous watermark.
+    """
+    kept = set(paths_to_process)
+    for run, scenes, scan_state in zip(runs, run_scenes, scan_states):
+        if all(path in kept for path in scenes):
+            continue
+        run.complete = False
+        if run.scan_state is not None:
+            run.scan_state = ScanState(
+                watermark=scan_state.watermark,
+                pending=scan_state.pending | run.scan_state.pending,
+            )
+
+
+def _l1_filter_in_process(
+    config: Optional[Path],
+    filter_kwargs: Dict,
+    scene_limit: int,
+    l1_product,
+    scan_state: Optional[ScanState] = None,
+) -> Tuple[List[str], L1FilterRun]:
+    """
+    Find the newest scenes of one product, up to the limit, with its own index connection.
+
+    (This is the entry point of a worker process, so it must be picklable.)
+    """
+    import datacube
+
+    run = L1FilterRun()
+    with datacube.Datacube(app="ard-scene-select", config=config) as dc, closing(
+        iter_l1_filter(dc, l1_product, scan_state=scan_state, run=run, **filter_kwargs)
+    ) as scenes:
+        return _newest_first([scenes], scene_limit), run
+
+
+def _l1_shard_in_process(
+    config: Optional[Path],
+    filter_kwargs: Dict,
+    shards: int,
+    l1_product,
+    shard_index: int,
+    scan_state: Optional[ScanState] = None,
+) -> L1FilterRun:
+    """
+    Filter one shard of a product's regions to the end, with its own index connection.
+
+    (This is the entry point of a worker process, so it must be picklable.)
+    """
+    import datacube
+
+    run = L1FilterRun()
+    with datacube.Datacube(app="ard-scene-select", config=config) as dc:
+        for _ in iter_l1_filter(
+            dc,
+            l1_product,
+            scan_state=scan_state,
+            shard=(shard_index, shards),
+            run=run,
+            **filter_kwargs,
+        ):
+            pass
+    return run
+
+
+def merge_shard_runs(
+    runs: List[L1FilterRun], sample_size: int = DECISION_SAMPLE_SIZE
+) -> L1FilterRun:
+    """
+    Combine the runs of each shard of one product, as one run of the whole product.
+
+    The scenes, and the ARDs to archive, are put back in acquisition order (newest first),
+    as a serial run finds them, and the counts are summed. Only the sample of each
+    decision can differ from a serial run's: it's taken from each shard in turn.
+
+    A package path can be in more than one shard (a multi-granule package, with granules
+    in several regions), so it's kept only for its newest scene, and the others are
+    counted as duplicates, as a serial run's duplicate stage would.
+    """
+    merged = L1FilterRun(complete=all(run.complete for run in runs))
+    decisions = {}
+    for run in runs:
+        merged.accepted += run.accepted
+        merged.duplicates += run.duplicates
+        merged.selected += run.selected
+        merged.archived += run.archived
+        merged.ledger += run.ledger
+        for stage, summary in run.stage_summary.items():
+            total = merged.stage_summary.setdefault(
+                stage, dict(checked=0, removed=0, seconds=0.0)
+            )
+            total["checked"] += summary["checked"]
+            total["removed"] += summary["removed"]
+            total["seconds"] = round(total["seconds"] + summary["seconds"], 3)
+        for event, reasons in run.decisions.items():
+            for reason, summary in reasons.items():
+                total = decisions.setdefault(event, {}).setdefault(
+                    reason, dict(count=0, sample=[])
                 )
-                continue
+                total["count"] += summary["count"]
+                total["sample"] = (total["sample"] + summary["sample"])[:sample_size]
+
+    # (By path as well, so scenes of the same time are always in the same order. The
+    # ARDs of a scene keep theirs.)
+    merged.selected.sort(key=lambda selected: selected[1])
+    merged.selected.sort(key=lambda selected: selected[0], reverse=True)
+    _drop_duplicate_paths(merged, decisions)
+    merged.decisions = {
+        event: dict(sorted(reasons.items())) for event, reasons in decisions.items()
+    }
+    merged.archived.sort(key=lambda archived: archived[0], reverse=True)
+    merged.uuids2archive = [ard_uuid for _, ard_uuid, _, _ in merged.archived]
+
+    scan_states = [run.scan_state for run in runs if run.scan_state is not None]
+    if scan_states:
+        watermarks = [state.watermark for state in scan_states if state.watermark]
+        # The earliest, so that nothing any shard might have missed is skipped.
+        merged.scan_state = ScanState(
+            watermark=min(watermarks) if watermarks else None,
+            pending=set().union(*(state.pending for state in scan_states)),
+        )
+    return merged
 
-            files2process.add(file_path)
 
-    return list(files2process), uuids2archive, duplicates
+def _drop_duplicate_paths(merged: L1FilterRun, decisions: Dict):
+    """
+    Keep only the first (newest) of the merged scenes selected with each path, as the
+    duplicate stage does.
+    """
+    paths = set()
+    selected = []
+    dropped = set()
+    for time_end, path, dataset_id in merged.selected:
+        if path in paths:
+            dropped.add(dataset_id)
+        else:
+            paths.add(path)
+            selected.append((time_end, path, dataset_id))
+    if not dropped:
+        return
+
+    merged.selected = selected
+    merged.accepted -= len(dropped)
+    merged.duplicates += len(dropped)
+    # Removed by the duplicate stage, so never checked by the stages after it.
+    after_duplicates = False
+    for stage, summary in merged.stage_summary.items():
+        if after_duplicates:
+            summary["checked"] -= len(dropped)
+        if stage == DuplicatePathStage.name:
+            summary["removed"] += len(dropped)
+            after_duplicates = True
+    duplicates = decisions.setdefault(SCENEREMOVED, {}).setdefault(
+        DUPLICATE_PATH, dict(count=0, sample=[])
+    )
+    duplicates["count"] += len(dropped)
+    # (Their ARDs aren't replaced after all.)
+    merged.archived = [
+        archived for archived in merged.archived if archived[2] not in dropped
+    ]
+    merged.ledger = [
+        (
+            path,
+            decision._replace(
+                decision=REMOVED, stage=DuplicatePathStage.name, reason=DUPLICATE_PATH
+            )
+            if decision.decision == SELECTED and decision.dataset_id in dropped
+            else decision,
+        )
+        for path, decision in merged.ledger
+    ]
 
 
 def _get_path_date(path: str) -> str:
@@ -606,49 +1748,193 @@ def l1_scenes_to_process(
     days_to_exclude: List,
     find_blocked: bool,
     config: Optional[Path] = None,
+    month_workers: int = 1,
+    parallel_products: int = 1,
+    ancillary_cache: Optional[Path] = None,
+    state_file: Optional[Path] = None,
+    full_scan: bool = False,
+    ard_cache_dir: Optional[Path] = None,
+    rebuild_ard_cache: bool = False,
+    log_sample_size: int = DECISION_SAMPLE_SIZE,
+    log_all_decisions: bool = False,
+    count_outside: bool = True,
+    ledger_file: Optional[Path] = None,
+    run_id: Optional[str] = None,
+    dc=None,
+    ancillary_ob: Optional[AncillaryFiles] = None,
+    resident_ards: Optional[Dict[str, ResidentArdScenes]] = None,
+    shards: int = 1,
 ) -> Tuple[int, List[str]]:
-    """Writes all the files returned from datacube for level1 to a file."""
+    """Writes all the files returned from datacube for level1 to a file.
+
+    With a state_file, the run is incremental: only the level1s added since the last run
+    (and those still pending from it) are looked at, unless full_scan is set.
+
+    With a ledger_file, the decision about every scene looked at is added to it, under the run_id.
+
+    A long-running caller can give the index connection (dc), ancillary checker and
+    resident ARD scene ids to keep between runs. (The products are then run serially.)
+
+    With shards, the regions of each product are split between that many processes (by
+    region_shard()), for sweeps of a long history. Each shard is filtered to the end, and
+    the shards merged, to give the scenes, ARDs to archive and counts of a serial run.
+    """
     # pylint: disable=R0913
     # R0913: Too many arguments
     # pylint: disable=R0914
     # R0914: Too many local variables
-    duplicate_count = 0
-    uuids2archive_combined = []
-    paths_to_process = []
+    import datacube
 
     scene_limit = min(scene_limit, HARD_SCENE_LIMIT)
-    with datacube.Datacube(app="ard-scene-select", config=config) as dc:
-        for product in products:
-            files2process, uuids2archive, duplicates = l1_filter(
-                dc,
-                product,
-                brdfdir=brdfdir,
-                i_viirsdir=i_viirsdir,
-                m_viirsdir=m_viirsdir,
-                use_viirs_after=use_viirs_after,
-                wvdir=wvdir,
-                region_codes=region_codes,
-                interim_days_wait=interim_days_wait,
-                days_to_exclude=days_to_exclude,
-                find_blocked=find_blocked,
+    # Worked out once, so every product (and process) uses the same cutoff.
+    eligibility = EligibilityCalendar.from_options(days_to_exclude, interim_days_wait)
+    min_date, max_date = scan_window()
+    filter_kwargs = dict(
+        brdfdir=brdfdir,
+        i_viirsdir=i_viirsdir,
+        m_viirsdir=m_viirsdir,
+        use_viirs_after=use_viirs_after,
+        wvdir=wvdir,
+        region_codes=region_codes,
+        interim_days_wait=interim_days_wait,
+        days_to_exclude=days_to_exclude,
+        find_blocked=find_blocked,
+        month_workers=month_workers,
+        eligibility=eligibility,
+        ancillary_cache=ancillary_cache,
+        ard_cache_dir=ard_cache_dir,
+        rebuild_ard_cache=rebuild_ard_cache,
+        log_sample_size=log_sample_size,
+        log_all_decisions=log_all_decisions,
+        count_outside=count_outside,
+        record_decisions=ledger_file is not None,
+        min_date=min_date,
+        max_date=max_date,
+    )
+    scan_states = [None] * len(products)
+    if state_file is not None:
+        previous_states = {} if full_scan else load_scan_states(state_file)
+        # (A product that is new to the state file is scanned in full.)
+        scan_states = [
+            previous_states.get(product, ScanState()) for product in products
+        ]
+
+    # Scenes are selected newest acquisition first, across all products, and selection stops
+    # at the scene limit. (So a backlog doesn't hold up recent acquisitions, and no product
+    # is left out because another came first.)
+    if shards > 1 and dc is None:
+        # Scenes of different regions never affect each other's selection (duplicates,
+        # reprocessing and final children are all within a region), so each shard can
+        # be filtered on its own.
+        with ProcessPoolExecutor(max_workers=shards) as executor:
+            shard_runs = list(
+                executor.map(
+                    partial(_l1_shard_in_process, config, filter_kwargs, shards),
+                    [product for product in products for _ in range(shards)],
+                    [shard_index for _ in products for shard_index in range(shards)],
+                    [scan_state for scan_state in scan_states for _ in range(shards)],
+                )
             )
-            uuids2archive_combined += uuids2archive
-            paths_to_process.extend(files2process)
-            duplicate_count += duplicates
-
-    # If we stopped above as soon as we reached the limit we could end up in a situation where
-    # only the first product is ever processed.
+        runs = [
+            merge_shard_runs(shard_runs[i : i + shards], log_sample_size)
+            for i in range(0, len(shard_runs), shards)
+        ]
+        run_scenes = [[path for _, path, _ in run.selected] for run in runs]
+        paths_to_process = _newest_first(run_scenes, scene_limit)
+        _cut_off_at_limit(runs, run_scenes, scan_states, paths_to_process)
+    elif parallel_products > 1 and len(products) > 1 and dc is None:
+        # The products are independent, so each is filtered in its own process,
+        # with its own index connection and ancillary checker, up to the limit.
+        with ProcessPoolExecutor(
+            max_workers=min(parallel_products, len(products))
+        ) as executor:
+            product_results = list(
+                executor.map(
+                    partial(_l1_filter_in_process, config, filter_kwargs, scene_limit),
+                    products,
+                    scan_states,
+                )
+            )
+        runs = [run for _, run in product_results]
+        run_scenes = [product_scenes for product_scenes, _ in product_results]
+        paths_to_process = _newest_first(run_scenes, scene_limit)
+        _cut_off_at_limit(runs, run_scenes, scan_states, paths_to_process)
+    else:
+        runs = [L1FilterRun() for _ in products]
+        with (
+            nullcontext(dc)
+            if dc is not None
+            else datacube.Datacube(app="ard-scene-select", config=config)
+        ) as dc, ExitStack() as product_scenes:
+            # (Closed on leaving, which finishes each product's run.)
+            scenes = [
+                product_scenes.enter_context(
+                    closing(
+                        iter_l1_filter(
+                            dc,
+                            product,
+                            scan_state=scan_state,
+                            run=run,
+                            ancillary_ob=ancillary_ob,
+                            resident_ards=resident_ards,
+                            **filter_kwargs,
+                        )
+                    )
+                )
+                for product, scan_state, run in zip(products, scan_states, runs)
+            ]
+            paths_to_process = _newest_first(scenes, scene_limit)
 
-    # Sort files so most recent acquisitions are processed first.
-    # This is to avoid a backlog holding up recent acquisitions
-    paths_to_process.sort(key=_get_path_date, reverse=True)
+    # Merged in product order, as a serial run would.
+    uuids2archive_combined = []
+    stage_summaries = {}
+    decision_summaries = {}
+    next_scan_states = {}
+    selected = set(paths_to_process)
+    for product, run in zip(products, runs):
+        # Only those replaced by a scene written out (not one cut off by the limit).
+        uuids2archive_combined += [
+            ard_uuid for _, ard_uuid, _, path in run.archived if path in selected
+        ]
+        stage_summaries[product] = run.stage_summary
+        decision_summaries[product] = run.decisions
+        next_scan_states[product] = run.scan_state
 
     # TODO: the old code reduced written records by the duplicate count, seemingly for multi-granule to be counted
     #       multiple times. But it also had a comment saying it wouldn't work well with multi-granule...
-    l1_count = min(len(paths_to_process), scene_limit)
+    l1_count = len(paths_to_process)
     with open(outfile, "w") as fid:
-        for path in paths_to_process[:l1_count]:
+        for path in paths_to_process:
             fid.write(str(path) + "\n")
+
+    LOGGER.info(
+        SUMMARY,
+        l1_count=l1_count,
+        # (those accepted before the limit was reached)
+        candidate_count=sum(run.accepted for run in runs),
+        reached_scene_limit=not all(run.complete for run in runs),
+        duplicate_count=sum(run.duplicates for run in runs),
+        archive_count=len(uuids2archive_combined),
+        filter_stages=stage_summaries,
+        decisions=decision_summaries,
+    )
+    if ledger_file is not None:
+        with DecisionLedger(ledger_file) as ledger:
+            ledger.record_run(
+                run_id or uuid.uuid4().hex,
+                products,
+                (
+                    decision._replace(decision=DEFERRED)
+                    if decision.decision == SELECTED and path not in selected
+                    else decision
+                    for run in runs
+                    for path, decision in run.ledger
+                ),
+                keep_days=KEEP_DAYS,
+            )
+    # Only once everything has succeeded, so a failed run is retried in full.
+    if state_file is not None:
+        save_scan_states(state_file, next_scan_states)
     return l1_count, uuids2archive_combined
 
 
@@ -812,6 +2098,116 @@ Does not work for multigranule zip files.",
     is_flag=True,
     help="Find l1 scenes with no children that are not getting processed.",
 )
+@click.option(
+    "--month-workers",
+    default=1,
+    type=click.IntRange(1, MAX_MONTH_WORKERS),
+    help="How many month windows to search the database for concurrently.",
+)
+@click.option(
+    "--parallel-products",
+    default=1,
+    type=click.IntRange(1, 16),
+    help="How many products to filter at once, each in its own process.",
+)
+@click.option(
+    "--shards",
+    default=1,
+    type=click.IntRange(1, 64),
+    help="Split each product's regions between this many processes, for a sweep of a "
+    "long history. Every scene is filtered (not just up to the scene limit), "
+    "and the shards merged as a serial run would find them.",
+)
+@click.option(
+    "--ancillary-cache",
+    type=click.Path(dir_okay=False, writable=True),
+    help="A local file to remember the available ancillary in, between runs. "
+    "(Entries are refreshed when the ancillary files change.)",
+    default=None,
+)
+@click.option(
+    "--incremental",
+    default=False,
+    is_flag=True,
+    help="Only look at the level-1s added since the last incremental run, and those "
+    f"still pending from it. (Remembered in {STATE_FILE} in the log dir.)",
+)
+@click.option(
+    "--full-scan",
+    default=False,
+    is_flag=True,
+    help="With --incremental, look at every level-1 anyway, starting the state afresh. "
+    "(eg. after changing the AOI or the days to exclude)",
+)
+@click.option(
+    "--ard-cache-dir",
+    type=click.Path(file_okay=False, writable=True),
+    help="A local directory to keep the scene ids of each ARD product in, between runs. "
+    "(Refreshed with the ARD added or archived since the last run.)",
+    default=None,
+)
+@click.option(
+    "--rebuild-ard-cache",
+    default=False,
+    is_flag=True,
+    help="Rebuild the --ard-cache-dir cache in full.",
+)
+@click.option(
+    "--log-sample-size",
+    type=int,
+    default=DECISION_SAMPLE_SIZE,
+    show_default=True,
+    help="How many scenes removed for each reason to log individually. The rest are "
+    "counted in the summary.",
+)
+@click.option(
+    "--log-all-decisions",
+    default=False,
+    is_flag=True,
+    help="Log every scene removed, not just a sample of each reason.",
+)
+@click.option(
+    "--count-outside-aoi/--no-count-outside-aoi",
+    "count_outside",
+    default=True,
+    help="Count the level 1s outside the AOI for the summary (with a count query: "
+    "they're never fetched).",
+)
+@click.option(
+    "--service",
+    default=False,
+    is_flag=True,
+    help="Keep running, selecting scenes (into a new job dir) each cycle. The index "
+    "connection, ancillary and ARD scene ids are kept between cycles. "
+    "Cycles are run by --service-interval, --trigger-socket or --trigger-file.",
+)
+@click.option(
+    "--service-interval",
+    type=float,
+    default=None,
+    help="With --service, run a cycle this many seconds after the last one finished.",
+)
+@click.option(
+    "--trigger-socket",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="With --service, run a cycle whenever something connects to this Unix socket. "
+    '(Send "stop" to stop the service.)',
+)
+@click.option(
+    "--trigger-file",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="With --service, run a cycle whenever this file is touched.",
+)
+@click.option(
+    "--decision-ledger",
+    type=click.Path(dir_okay=False, writable=True),
+    help="A SQLite file to record every scene decision in, for ard-scene-decisions "
+    f"to query (eg. {LEDGER_FILE} in the log dir). Runs are kept for {KEEP_DAYS} days. "
+    "(Not with --stop-logging.)",
+    default=None,
+)
 @LogMainFunction()
 def scene_select(
     usgs_level1_files: str,
@@ -832,6 +2228,22 @@ def scene_select(
     days_to_exclude: list,
     run_ard: bool,
     find_blocked: bool,
+    month_workers: int,
+    parallel_products: int,
+    shards: int,
+    ancillary_cache: Optional[str],
+    incremental: bool,
+    full_scan: bool,
+    ard_cache_dir: Optional[str],
+    rebuild_ard_cache: bool,
+    log_sample_size: int,
+    log_all_decisions: bool,
+    count_outside: bool,
+    decision_ledger: Optional[str],
+    service: bool,
+    service_interval: Optional[float],
+    trigger_socket: Optional[str],
+    trigger_file: Optional[str],
     **ard_click_params: dict,
 ):
     """
@@ -853,56 +2265,130 @@ def scene_select(
     # pylint: disable=R0913, R0914
     # R0913: Too many arguments
     # R0914: Too many local variables
+    arguments = dict(locals())
 
     logdir = Path(logdir).resolve()
-    # If we write a file we write it in the job dir
-    # set up the scene select job dir in the log dir
-    if jobdir is None:
-        logdir = Path(logdir).resolve()
-        jobdir = logdir.joinpath(FMT2.format(jobid=uuid.uuid4().hex[0:6]))
-    else:
-        jobdir = Path(jobdir).resolve()
-    jobdir.mkdir(exist_ok=True)
-
-    if not stop_logging:
-        gen_log_file = jobdir.joinpath(GEN_LOG_FILE).resolve()
-        fileConfig(
-            log_config,
-            disable_existing_loggers=False,
-            defaults={"genlogfilename": str(gen_log_file)},
-        )
-    LOGGER.info("scene_select", **locals())
-
     # logdir is used both  by scene select and ard
     # So put it in the ard parameter dictionary
     ard_click_params["logdir"] = logdir
 
-    if not usgs_level1_files:
-        usgs_level1_files = jobdir.joinpath(ODC_FILTERED_FILE)
-        l1_count, uuids2archive = l1_scenes_to_process(
-            usgs_level1_files,
-            products=products,
-            brdfdir=Path(brdfdir).resolve(),
-            i_viirsdir=Path(i_viirsdir).resolve(),
-            m_viirsdir=Path(m_viirsdir).resolve(),
-            use_viirs_after=use_viirs_after,
-            wvdir=Path(wvdir).resolve(),
-            region_codes=load_aoi(allowed_codes),
-            config=config,
-            scene_limit=scene_limit,
-            interim_days_wait=interim_days_wait,
-            days_to_exclude=days_to_exclude,
-            find_blocked=find_blocked,
+    def select_and_process(
+        jobdir: Optional[str], trigger: Optional[str] = None, **resident
+    ):
+        # If we write a file we write it in the job dir
+        # set up the scene select job dir in the log dir
+        if jobdir is None:
+            jobdir = logdir.joinpath(FMT2.format(jobid=uuid.uuid4().hex[0:6]))
+        else:
+            jobdir = Path(jobdir).resolve()
+        jobdir.mkdir(exist_ok=True)
+
+        if not stop_logging:
+            gen_log_file = jobdir.joinpath(GEN_LOG_FILE).resolve()
+            fileConfig(
+                log_config,
+                disable_existing_loggers=False,
+                defaults={"genlogfilename": str(gen_log_file)},
+            )
+        LOGGER.info(
+            "scene_select",
+            **{**arguments, "logdir": logdir, "jobdir": jobdir, "trigger": trigger},
         )
-    else:
-        uuids2archive = []
-        l1_count = sum(1 for _ in open(usgs_level1_files))
 
-    do_ard(
-        ard_click_params, l1_count, usgs_level1_files, uuids2archive, jobdir, run_ard
-    )
+        level1_files = usgs_level1_files
+        if not level1_files:
+            level1_files = jobdir.joinpath(ODC_FILTERED_FILE)
+            l1_count, uuids2archive = l1_scenes_to_process(
+                level1_files,
+                products=products,
+                brdfdir=Path(brdfdir).resolve(),
+                i_viirsdir=Path(i_viirsdir).resolve(),
+                m_viirsdir=Path(m_viirsdir).resolve(),
+                use_viirs_after=use_viirs_after,
+                wvdir=Path(wvdir).resolve(),
+                region_codes=load_aoi(allowed_codes),
+                config=config,
+                scene_limit=scene_limit,
+                interim_days_wait=interim_days_wait,
+                days_to_exclude=days_to_exclude,
+                find_blocked=find_blocked,
+                month_workers=month_workers,
+                parallel_products=parallel_products,
+                shards=shards,
+                ancillary_cache=Path(ancillary_cache).resolve()
+                if ancillary_cache
+                else None,
+                state_file=logdir.joinpath(STATE_FILE) if incremental else None,
+                full_scan=full_scan,
+                ard_cache_dir=Path(ard_cache_dir).resolve() if ard_cache_dir else None,
+                rebuild_ard_cache=rebuild_ard_cache,
+                log_sample_size=log_sample_size,
+                log_all_decisions=log_all_decisions,
+                count_outside=count_outside,
+                ledger_file=(
+                    Path(decision_ledger).resolve()
+                    if decision_ledger and not stop_logging
+                    else None
+                ),
+                run_id=jobdir.name,
+                **resident,
+            )
+        else:
+            uuids2archive = []
+            l1_count = sum(1 for _ in open(level1_files))
+
+        do_ard(ard_click_params, l1_count, level1_files, uuids2archive, jobdir, run_ard)
+
+        LOGGER.info("info", jobdir=str(jobdir))
+
+    if not service:
+        select_and_process(jobdir)
+        return
+
+    if usgs_level1_files or jobdir:
+        raise click.UsageError(
+            "--service selects the scenes into a new job dir each cycle, "
+            "so can't be given --usgs-level1-files or --jobdir"
+        )
+    try:
+        triggers = Triggers(
+            interval=service_interval,
+            socket_path=trigger_socket,
+            trigger_file=trigger_file,
+        )
+    except ValueError as ex:
+        raise click.UsageError(str(ex))
+    if ard_cache_dir is None:
+        # The resident ARD scene ids are refreshed from it.
+        ard_cache_dir = logdir.joinpath(SERVICE_ARD_CACHE_DIR)
+    import datacube
+
+    with datacube.Datacube(app="ard-scene-select", config=config) as dc:
+        ancillary_ob = AncillaryFiles(
+            brdf_dir=Path(brdfdir).resolve(),
+            viirs_i_path=Path(i_viirsdir).resolve(),
+            viirs_m_path=Path(m_viirsdir).resolve(),
+            wv_dir=Path(wvdir).resolve(),
+            use_viirs_after=use_viirs_after,
+            cache_path=Path(ancillary_cache).resolve() if ancillary_cache else None,
+        )
+        resident_ards = {}
+
+        def cycle(trigger: str):
+            nonlocal rebuild_ard_cache
+            # Look again at the ancillary that may have turned up since the last cycle.
+            ancillary_ob.refresh()
+            select_and_process(
+                None,
+                trigger=trigger,
+                dc=dc,
+                ancillary_ob=ancillary_ob,
+                resident_ards=resident_ards,
+            )
+            # (only the first cycle rebuilds the cache)
+            rebuild_ard_cache = False
 
-    LOGGER.info("info", jobdir=str(jobdir))
+        serve(cycle, triggers)
 
 
 if __name__ == "__main__":
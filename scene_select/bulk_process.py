@@ -15,15 +15,15 @@ import shlex
 import stat
 import sys
 from collections import defaultdict
+from contextlib import nullcontext
 from datetime import datetime
 from itertools import chain
 from pathlib import Path
 from textwrap import dedent
-from typing import List, Dict, Tuple
+from typing import Iterator, List, Dict, Optional, Tuple
 from uuid import UUID
 
 import click
-import datacube.drivers.postgres._schema
 import structlog
 from attr import define, field
 from datacube import Datacube
@@ -32,17 +32,28 @@ from datacube.index.abstract import AbstractIndex
 from datacube.model import Range, Dataset
 from datacube.ui import click as ui
 from packaging import version
-from sqlalchemy import func, select
-from sqlalchemy.engine import Engine
 
 from scene_select.collections import get_collection, get_product, get_product_for_level1
 from scene_select.do_ard import calc_node_with_defaults
-from scene_select.library import Level1Dataset, ArdProduct, ArdCollection, ArdDataset
+from scene_select.library import (
+    Level1Dataset,
+    ArdProduct,
+    ArdCollection,
+    ArdDataset,
+    prefetch,
+)
 from scene_select.scene_filters import parse_expressions, GreaterThan, LessThan
-from scene_select.utils import structlog_setup
+from scene_select.software_version_catalogue import (
+    CATALOGUE_FILE,
+    SoftwareVersionCatalogue,
+)
+from scene_select.utils import structlog_setup, alchemy_engine, has_alchemy_engine
 
 DEFAULT_WORK_DIR = Path("/g/data/v10/work/bulk-runs")
 
+# How many dataset ids to look up (sources, or bulk_get) in each query.
+ID_CHUNK = 2000
+
 
 def expression_parse(ctx, param, value):
     return parse_expressions(*list(value))
@@ -73,6 +84,13 @@ class Job:
     default=None,
     help="Output package base path (default: work-dir/pkg)",
 )
+@click.option(
+    "--version-catalogue",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    default=None,
+    help="A local file to remember the software versions of ARDs in, between runs, "
+    f"for `*_version` expressions (default: work-dir/{CATALOGUE_FILE})",
+)
 @click.option("--workers-per-node", type=int, default=48, help="Workers per node")
 @click.option("-P", "--project", type=str, default="v10", help="NCI project")
 @ui.pass_index(app_name="bulk-reprocess")
@@ -85,6 +103,7 @@ def cli(
     work_dir: Path,
     project: str,
     pkg_dir: Path,
+    version_catalogue: Optional[Path],
 ):
     ctx.ensure_object(dict)
     ctx.obj["index"] = index
@@ -93,6 +112,7 @@ def cli(
     ctx.obj["work_dir"] = work_dir
     ctx.obj["pkg_dir"] = pkg_dir
     ctx.obj["project"] = project
+    ctx.obj["version_catalogue"] = version_catalogue or work_dir / CATALOGUE_FILE
 
 
 @cli.command(
@@ -171,9 +191,16 @@ def cli_search(ctx, prefix: str, expressions: dict):
     pkg_dir = ctx.obj["pkg_dir"]
     project = ctx.obj["project"]
 
-    with Datacube(index=index) as dc:
+    # (Only needed for software version expressions.)
+    with Datacube(index=index) as dc, (
+        SoftwareVersionCatalogue(ctx.obj["version_catalogue"])
+        if any(key.endswith("_version") for key in expressions)
+        else nullcontext()
+    ) as catalogue:
         collection = get_collection(dc, prefix)
-        jobs = find_jobs_by_odc_ard_search(dc, collection, expressions, max_count, log)
+        jobs = find_jobs_by_odc_ard_search(
+            dc, collection, expressions, max_count, log, catalogue=catalogue
+        )
 
     platform = prefix[:2]
     create_pbs_jobs(
@@ -198,8 +225,10 @@ def cli_ard_ids(ctx, ids_file, ids: List[str]):
     structlog_setup()
 
     all_ids = list(ids)
-    for id_line in ids_file.readlines():
-        all_ids.append(id_line.strip())
+    if ids_file:
+        for id_line in ids_file.readlines():
+            if id_line.strip():
+                all_ids.append(id_line.strip())
 
     log = structlog.get_logger()
 
@@ -208,13 +237,41 @@ def cli_ard_ids(ctx, ids_file, ids: List[str]):
     work_dir = ctx.obj["work_dir"]
     workers_per_node = ctx.obj["workers_per_node"]
     pkg_dir = ctx.obj["pkg_dir"]
-    platform = None
     project = ctx.obj["project"]
 
     with Datacube(index=index) as dc:
-        jobs = []
-        for ard_id in all_ids:
-            odc_ard = dc.index.datasets.get(ard_id, include_sources=False)
+        jobs, platform = find_jobs_by_ard_ids(dc, all_ids)
+
+    create_pbs_jobs(
+        jobs=jobs,
+        platform=platform,
+        work_dir=work_dir,
+        workers_per_node=workers_per_node,
+        pkg_dir=pkg_dir,
+        max_count=max_count,
+        project=project,
+        log=log,
+    )
+
+
+def find_jobs_by_ard_ids(dc: Datacube, ard_ids: List[str]) -> Tuple[List[Job], str]:
+    """
+    The jobs to reprocess each of the ARDs (from their level1 sources), and their platform.
+
+    The ARDs, their sources, and their level1s are fetched a chunk of ids at a time.
+    """
+    platform = None
+    jobs = []
+    for i in range(0, len(ard_ids), ID_CHUNK):
+        chunk = [str(UUID(ard_id)) for ard_id in ard_ids[i : i + ID_CHUNK]]
+        odc_ards = {
+            str(odc_ard.id): odc_ard for odc_ard in dc.index.datasets.bulk_get(chunk)
+        }
+        sources = get_datasets_sources(dc.index, list(odc_ards))
+        for ard_id in chunk:
+            odc_ard = odc_ards.get(ard_id)
+            if odc_ard is None:
+                raise ValueError(f"ARD {ard_id} is not in the index")
             ard_dataset = ArdDataset.from_odc(odc_ard)
             ard_product = get_product(odc_ard.product.name)
 
@@ -225,30 +282,16 @@ def cli_ard_ids(ctx, ids_file, ids: List[str]):
                 )
             platform = this_platform
 
-            source_map, remaining = get_dataset_sources(dc.index, odc_ard.id)
-            if remaining > 0:
-                raise ValueError(
-                    f"Found {remaining} sources for {odc_ard.id}: unexpectedly huge provenance?"
-                )
-
-            odc_level1: Dataset = source_map["level1"]
+            if "level1" not in sources[ard_id]:
+                raise ValueError(f"ARD {ard_id} has no level1 source in the index")
+            odc_level1: Dataset = sources[ard_id]["level1"]
             [level1_product] = [
                 s for s in ard_product.sources if s.name == odc_level1.product.name
             ]
 
             level1_dataset = Level1Dataset.from_odc(odc_level1, level1_product)
             jobs.append(Job(level1_dataset, [ard_dataset.dataset_id], ard_product))
-
-    create_pbs_jobs(
-        jobs=jobs,
-        platform=platform,
-        work_dir=work_dir,
-        workers_per_node=workers_per_node,
-        pkg_dir=pkg_dir,
-        max_count=max_count,
-        project=project,
-        log=log,
-    )
+    return jobs, platform
 
 
 @cli.command(
@@ -501,53 +544,94 @@ def create_pbs_jobs(
 
 
 def find_jobs_by_odc_ard_search(
-    dc: Datacube, collection: ArdCollection, expressions: dict, max_count: int, log
+    dc: Datacube,
+    collection: ArdCollection,
+    expressions: dict,
+    max_count: int,
+    log,
+    catalogue: Optional[SoftwareVersionCatalogue] = None,
 ) -> List[Job]:
-    software_expressions = pop_software_expressions(expressions)
+    """
+    With a catalogue, the software versions of each ARD are only read from disk once.
+    """
+    software_expressions = compile_software_expressions(
+        pop_software_expressions(expressions)
+    )
+    software_versions = (
+        catalogue.software_versions if catalogue else ArdDataset.software_versions
+    )
 
     # The level1s to process, and the ids of datasets that will be replaced by them.
     level1s_to_process: List[Job] = []
 
+    def read_ahead(ard_dataset: ArdDataset):
+        if software_expressions:
+            software_versions(ard_dataset)
+        if ard_dataset.dataset_id not in level1_ids:
+            ard_dataset.metadata_doc()
+
     log.info("chosen_products", products=[c.name for c in collection.products])
     # Filter to our set of ARD products.
-    for ard_product, ard_dataset in collection.iterate_indexed_ard_datasets(
-        expressions
-    ):
-        ilog = log.bind(dataset_id=ard_dataset.dataset_id)
-        if not ard_dataset.metadata_path.exists():
-            ilog.warning("dataset_missing_from_disk")
-            continue
-
-        if software_expressions:
-            if not matches_software_expressions(
-                ard_dataset.software_versions(), software_expressions, log=ilog
+    for ard_product, ard_datasets in collection.iterate_indexed_ard_blocks(expressions):
+        # The lineage of the whole block from the index, rather than each ARD's metadata.
+        level1_ids = get_level1_source_ids(
+            dc.index, [ard_dataset.dataset_id for ard_dataset in ard_datasets]
+        )
+        for i in range(0, len(ard_datasets), ID_CHUNK):
+            to_process: List[Tuple[ArdDataset, str]] = []
+            # (The documents needed are read ahead, in threads.)
+            for ard_dataset in prefetch(
+                ard_datasets[i : i + ID_CHUNK], read=read_ahead
             ):
-                continue
+                ilog = log.bind(dataset_id=ard_dataset.dataset_id)
+                if not ard_dataset.metadata_path.exists():
+                    ilog.warning("dataset_missing_from_disk")
+                    continue
 
-        level1 = dc.index.datasets.get(ard_dataset.level1_id)
-        if level1 is None:
-            ilog.warning(
-                "skip.source_level1_not_indexed", dataset_id=ard_dataset.dataset_id
-            )
-            # TODO: Perhaps a newer one exists? Or on disk?
-            continue
+                if software_expressions:
+                    if not matches_software_expressions(
+                        software_versions(ard_dataset), software_expressions, log=ilog
+                    ):
+                        continue
 
-        # TODO: Does a newer Level 1 exist? We'd rather use that.
-        level1_product = [
-            s for s in ard_product.sources if s.name == level1.product.name
-        ][0]
-        level1_dataset = Level1Dataset.from_odc(level1, level1_product)
-        level1s_to_process.append(
-            Job(
-                level1=level1_dataset,
-                replacement_uuids=[ard_dataset.dataset_id],
-                target_ard_product=ard_product,
-            )
-        )
+                # (Not in the index's lineage: fall back to the metadata.)
+                level1_id = (
+                    level1_ids.get(ard_dataset.dataset_id) or ard_dataset.level1_id
+                )
+                to_process.append((ard_dataset, str(level1_id)))
 
-        if len(level1s_to_process) >= max_count:
-            log.info("reached_max_dataset_count", max_count=max_count)
-            break
+            level1s = {
+                str(level1.id): level1
+                for level1 in dc.index.datasets.bulk_get(
+                    level1_id for _, level1_id in to_process
+                )
+            }
+            for ard_dataset, level1_id in to_process:
+                level1 = level1s.get(level1_id)
+                if level1 is None:
+                    log.warning(
+                        "skip.source_level1_not_indexed",
+                        dataset_id=ard_dataset.dataset_id,
+                    )
+                    # TODO: Perhaps a newer one exists? Or on disk?
+                    continue
+
+                # TODO: Does a newer Level 1 exist? We'd rather use that.
+                level1_product = [
+                    s for s in ard_product.sources if s.name == level1.product.name
+                ][0]
+                level1_dataset = Level1Dataset.from_odc(level1, level1_product)
+                level1s_to_process.append(
+                    Job(
+                        level1=level1_dataset,
+                        replacement_uuids=[ard_dataset.dataset_id],
+                        target_ard_product=ard_product,
+                    )
+                )
+
+                if len(level1s_to_process) >= max_count:
+                    log.info("reached_max_dataset_count", max_count=max_count)
+                    return level1s_to_process
 
     return level1s_to_process
 
@@ -586,13 +670,46 @@ def pop_software_expressions(expressions: dict) -> dict:
     return {k: expressions.pop(k) for k in list(expressions) if k.endswith("_version")}
 
 
+def _as_version(value) -> Optional[version.Version]:
+    if not value:
+        return None
+    if isinstance(value, version.Version):
+        return value
+    return version.parse(value)
+
+
+def compile_software_expressions(software_expressions: dict) -> dict:
+    """
+    Parse the versions in the expressions once, rather than for every dataset.
+
+    >>> compile_software_expressions({"wagl_version": LessThan("1.2.3")})
+    {'wagl_version': LessThan(value=<Version('1.2.3')>)}
+    """
+    compiled = {}
+    for key, value in software_expressions.items():
+        match value:
+            case Range():
+                value = Range(_as_version(value.begin), _as_version(value.end))
+            case GreaterThan():
+                value = GreaterThan(_as_version(value.value))
+            case LessThan():
+                value = LessThan(_as_version(value.value))
+            case _:
+                value = _as_version(value)
+        compiled[key] = value
+    return compiled
+
+
 def matches_software_expressions(
     software_versions: dict, software_expressions: dict, log
 ) -> bool:
     """
     Check if the software versions match the expressions provided.
+
+    (The expressions can be given already compiled by compile_software_expressions())
     """
     log.debug("software_versions", software_versions=software_versions)
+    software_expressions = compile_software_expressions(software_expressions)
 
     for key, value in software_expressions.items():
         # "wagl_version" key should correspond to software called "wagl"
@@ -604,7 +721,7 @@ def matches_software_expressions(
         dataset_version = version.parse(software_versions[key])
         match value:
             case Range():
-                if value.begin and dataset_version < version.parse(value.begin):
+                if value.begin and dataset_version < value.begin:
                     log.debug(
                         "skip.software_version_too_low",
                         key=key,
@@ -612,7 +729,7 @@ def matches_software_expressions(
                         actual=software_versions[key],
                     )
                     return False
-                if value.end and dataset_version > version.parse(value.end):
+                if value.end and dataset_version > value.end:
                     log.debug(
                         "skip.software_version_too_high",
                         key=key,
@@ -621,7 +738,7 @@ def matches_software_expressions(
                     )
                     return False
             case GreaterThan():
-                if dataset_version <= version.parse(value.value):
+                if dataset_version <= value.value:
                     log.debug(
                         "skip.software_version_too_low",
                         key=key,
@@ -630,7 +747,7 @@ def matches_software_expressions(
                     )
                     return False
             case LessThan():
-                if dataset_version >= version.parse(value.value):
+                if dataset_version >= value.value:
                     log.debug(
                         "skip.software_version_too_high",
                         key=key,
@@ -639,7 +756,7 @@ def matches_software_expressions(
                     )
                     return False
             case _:
-                if dataset_version != version.parse(value):
+                if dataset_version != value:
                     log.debug(
                         "skip.software_version_mismatch",
                         key=key,
@@ -658,13 +775,6 @@ if __name__ == "__main__":
 # doing a non-recurvsive query here to avoid issues.
 
 
-def alchemy_engine(index: Index) -> Engine:
-    # There's no public api for sharing the existing engine (it's an implementation detail of the current index).
-    # We could create our own from config, but there's no api for getting the ODC config for the index either.
-    # pylint: disable=protected-access
-    return index.datasets._db._engine
-
-
 def get_dataset_sources(
     index: Index, dataset_id: UUID, limit=None
 ) -> Tuple[Dict[str, Dataset], int]:
@@ -677,7 +787,10 @@ def get_dataset_sources(
 
     Returns a source dict and how many more sources exist beyond the limit.
     """
-    dataset_source = datacube.drivers.postgres._schema.DATASET_SOURCE
+    # (The postgres driver is only loaded for commands that need it.)
+    from datacube.drivers.postgres._schema import DATASET_SOURCE as dataset_source
+    from sqlalchemy import func, select
+
     query = select(
         [dataset_source.c.source_dataset_ref, dataset_source.c.classifier]
     ).where(dataset_source.c.dataset_ref == dataset_id)
@@ -710,3 +823,70 @@ def get_dataset_sources(
             index.datasets.bulk_get(dataset_id for dataset_id, _ in dataset_classifier)
         )
     }, remaining_records
+
+
+def _dataset_source_rows(
+    index: Index, dataset_ids: List[str], classifier: Optional[str] = None
+) -> Iterator[Tuple[UUID, UUID, str]]:
+    """
+    The (dataset id, source id, classifier) of the sources of each of the given datasets.
+
+    One query against dataset_source for each chunk of ids.
+    """
+    from datacube.drivers.postgres._schema import DATASET_SOURCE as dataset_source
+    from sqlalchemy import select
+
+    engine = alchemy_engine(index)
+    dataset_ids = [UUID(str(dataset_id)) for dataset_id in dataset_ids]
+    for i in range(0, len(dataset_ids), ID_CHUNK):
+        query = select(
+            [
+                dataset_source.c.dataset_ref,
+                dataset_source.c.source_dataset_ref,
+                dataset_source.c.classifier,
+            ]
+        ).where(dataset_source.c.dataset_ref.in_(dataset_ids[i : i + ID_CHUNK]))
+        if classifier is not None:
+            query = query.where(dataset_source.c.classifier == classifier)
+        yield from engine.execute(query)
+
+
+def get_level1_source_ids(index: Index, dataset_ids: List[str]) -> Dict[str, str]:
+    """
+    The id of the level1 source of each of the given datasets (those that have one).
+
+    Rather than reading each dataset's lineage separately.
+    """
+    if not dataset_ids or not has_alchemy_engine(index):
+        # (eg. the in-memory index) Each dataset's lineage is read from its metadata.
+        return {}
+    return {
+        str(dataset_id): str(source_id)
+        for dataset_id, source_id, _ in _dataset_source_rows(
+            index, dataset_ids, classifier="level1"
+        )
+    }
+
+
+def get_datasets_sources(
+    index: Index, dataset_ids: List[str]
+) -> Dict[str, Dict[str, Dataset]]:
+    """
+    The direct source datasets of many datasets: a batched get_dataset_sources().
+
+    Returns {dataset id: {classifier: source dataset}}, with a query for the sources,
+    and a bulk_get of them, for each chunk of ids.
+    """
+    sources = {str(dataset_id): {} for dataset_id in dataset_ids}
+    for i in range(0, len(dataset_ids), ID_CHUNK):
+        rows = list(_dataset_source_rows(index, dataset_ids[i : i + ID_CHUNK]))
+        source_datasets = {
+            source.id: source
+            for source in index.datasets.bulk_get(
+                {source_id for _, source_id, _ in rows}
+            )
+        }
+        for dataset_id, source_id, classifier in rows:
+            if source_id in source_datasets:
+                sources[str(dataset_id)][classifier] = source_datasets[source_id]
+    return sources
@@ -1,16 +1,13 @@
 #!/usr/bin/env python3
 
 import datetime
-from functools import lru_cache
+import json
+import os
+import tempfile
 from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
 
-try:
-    import tables  # This is needed when testing locally
-except ModuleNotFoundError:
-    pass
-import h5py
 import numpy
-import pandas
 import structlog
 
 LOG = structlog.get_logger()
@@ -23,9 +20,26 @@ WV_DIR = "/g/data/v10/eoancillarydata-2/water_vapour"
 WV_FMT = "pr_wtr.eatm.{year}.h5"
 
 
-def read_h5_table(fid, dataset_name):
+def open_h5(path: Path):
+    """
+    Open a HDF5 file for reading.
+
+    (h5py is imported here, rather than with the module, so that commands that don't
+    read the ancillary don't pay for it.)
     """
-    From Wagl. Read a HDF5 `TABLE` as a `pandas.DataFrame`.
+    try:
+        import tables  # noqa: F401 This is needed when testing locally
+    except ModuleNotFoundError:
+        pass
+    import h5py
+
+    return h5py.File(str(path), "r")
+
+
+def read_h5_timestamps(fid, dataset_name, field="timestamp") -> numpy.ndarray:
+    """
+    Read just the timestamp field of a HDF5 `TABLE` (as written from a
+    `pandas.DataFrame` by Wagl), rather than the whole table.
 
     :param fid:
         A h5py `Group` or `File` object from which to read the
@@ -35,23 +49,85 @@ def read_h5_table(fid, dataset_name):
         A `str` containing the pathname of the dataset location.
 
     :return:
-        Either a `pandas.DataFrame` (Default) or a NumPy structured
-        array.
+        A NumPy `datetime64[ns]` array.
     """
-
     dset = fid[dataset_name]
+    timestamps = dset.fields(field)[:]
+
+    # Pandas tables store times as integers, with their real dtype as an attribute.
+    dtype = dset.attrs.get(f"{field}_dtype")
+    if dtype is not None:
+        timestamps = timestamps.astype(numpy.dtype(dtype))
+    return timestamps.astype("datetime64[ns]")
+
+
+class AncillaryCache:
+    """
+    A local file remembering what ancillary is available, so repeated runs don't
+    need to re-read it all from (slow) /g/data.
+
+    Each entry is kept with the mtime of its source file or directory, and is only used
+    while the source's mtime is unchanged.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.entries = self._read()
+
+    def _read(self) -> Dict:
+        try:
+            with open(self.path) as f:
+                cached = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            LOG.warning("ignoring unreadable ancillary cache", path=str(self.path))
+            return {}
+        if cached.get("version") != self.VERSION:
+            return {}
+        return cached["entries"]
+
+    def get(self, source: Path, mtime: Optional[int] = None) -> Optional[List]:
+        """
+        The cached values for the source, if any (and if its mtime is unchanged).
+
+        With no mtime, the cached values are returned regardless.
+        """
+        entry = self.entries.get(str(source))
+        if entry is None or (mtime is not None and entry["mtime"] != mtime):
+            return None
+        return entry["values"]
+
+    def put(self, source: Path, mtime: int, values: List):
+        self.entries[str(source)] = dict(mtime=mtime, values=values)
+        self.save()
+
+    def save(self):
+        # Other runs (or processes) may have added entries since we read it: keep them,
+        # and whichever entry of a source is of its newer mtime.
+        entries = self._read()
+        for source, entry in self.entries.items():
+            theirs = entries.get(source)
+            if theirs is None or entry["mtime"] >= theirs["mtime"]:
+                entries[source] = entry
+        self.entries = entries
+
+        # Written to a temporary file and renamed, so readers never see half a file.
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            "w", dir=self.path.parent, prefix=f".{self.path.name}.", delete=False
+        ) as f:
+            json.dump(dict(version=self.VERSION, entries=entries), f)
+        os.replace(f.name, self.path)
 
-    # grab the index names if we have them
-    idx = dset.attrs.get("index_names")
 
-    if dset.attrs.get("python_type") == "`Pandas.DataFrame`":
-        col_names = dset.dtype.names
-        dtypes = [dset.attrs[f"{name}_dtype"] for name in col_names]
-        dtype = numpy.dtype(list(zip(col_names, dtypes)))
-        data = pandas.DataFrame.from_records(dset[:].astype(dtype), index=idx)
-    else:
-        data = pandas.DataFrame.from_records(dset[:], index=idx)
-    return data
+def _is_closed_year(a_year, timestamps: numpy.ndarray) -> bool:
+    """
+    Does the water vapour data already reach the end of the year? (so it won't change)
+    """
+    return len(timestamps) > 0 and timestamps[-1] >= numpy.datetime64(f"{a_year}-12-31")
 
 
 class AncillaryFiles:
@@ -63,7 +139,12 @@ class AncillaryFiles:
         viirs_m_path=DEFAULT_VIIRS_M_PATH,
         use_viirs_after=DEFAULT_USE_VIIRS_AFTER,
         wv_days_tolerance=1,
+        cache_path: Optional[Path] = None,
     ):
+        """
+        :param cache_path: An optional local file to cache the ancillary availability in,
+                           between runs.
+        """
         self.brdf_path = Path(brdf_dir)
         self.wv_path = Path(wv_dir)  # water_vapour_dir
         self.viirs_i_path = Path(viirs_i_path)
@@ -71,22 +152,120 @@ class AncillaryFiles:
         self.use_viirs_after = use_viirs_after
         self.max_tolerance = -datetime.timedelta(days=wv_days_tolerance)
 
-    @lru_cache(maxsize=32)
-    def wv_file_exists(self, a_year):
+        # Loaded on first use, and kept for the life of this object.
+        self._wv_file_exists = {}
+        self._wv_timestamps = {}
+        self._day_dirs = {}
+        self.cache = AncillaryCache(cache_path) if cache_path else None
+
+    def refresh(self):
+        """
+        Forget what may have changed since it was looked at (for a checker kept between runs).
+
+        The water vapour of a closed year won't change, so it's kept.
+        """
+        self._wv_timestamps = {
+            year: timestamps
+            for year, timestamps in self._wv_timestamps.items()
+            if _is_closed_year(year, timestamps)
+        }
+        self._wv_file_exists = {year: True for year in self._wv_timestamps}
+        self._day_dirs = {}
+
+    def _cached_closed_year(self, a_year) -> Optional[numpy.ndarray]:
+        """
+        The timestamps of a year that is complete in the cache. (They are never re-read.)
+        """
+        if self.cache is None:
+            return None
         wv_pathname = self.wv_path.joinpath(WV_FMT.format(year=a_year))
-        return wv_pathname.exists()
+        cached = self.cache.get(wv_pathname)
+        if cached is None:
+            return None
+        timestamps = numpy.array(cached, dtype="datetime64[ns]")
+        if not _is_closed_year(a_year, timestamps):
+            return None
+        return timestamps
 
-    @lru_cache(maxsize=32)
-    def get_wv_index(self, a_year):
+    def wv_file_exists(self, a_year):
+        if a_year not in self._wv_file_exists:
+            if self._cached_closed_year(a_year) is not None:
+                self._wv_file_exists[a_year] = True
+            else:
+                wv_pathname = self.wv_path.joinpath(WV_FMT.format(year=a_year))
+                self._wv_file_exists[a_year] = wv_pathname.exists()
+        return self._wv_file_exists[a_year]
+
+    def get_wv_timestamps(self, a_year) -> numpy.ndarray:
+        """
+        The (sorted) times of the year's water vapour data.
+        """
+        if a_year not in self._wv_timestamps:
+            timestamps = self._cached_closed_year(a_year)
+            if timestamps is None:
+                timestamps = self._read_wv_timestamps(a_year)
+            self._wv_timestamps[a_year] = timestamps
+        return self._wv_timestamps[a_year]
+
+    def _read_wv_timestamps(self, a_year) -> numpy.ndarray:
         wv_pathname = self.wv_path.joinpath(WV_FMT.format(year=a_year))
-        with h5py.File(str(wv_pathname), "r") as fid:
-            index = read_h5_table(fid, "INDEX")
-        return index
+        if self.cache is None:
+            mtime = None
+        else:
+            mtime = wv_pathname.stat().st_mtime_ns
+            cached = self.cache.get(wv_pathname, mtime)
+            if cached is not None:
+                return numpy.array(cached, dtype="datetime64[ns]")
+
+        with open_h5(wv_pathname) as fid:
+            timestamps = numpy.sort(read_h5_timestamps(fid, "INDEX"))
+        if mtime is not None:
+            self.cache.put(wv_pathname, mtime, timestamps.astype("int64").tolist())
+        return timestamps
+
+    def wv_within_tolerance(self, a_year, acquisition_times: numpy.ndarray):
+        """
+        For each (naive, datetime64) acquisition time in the year, is there water vapour data
+        from shortly before it? (Within the tolerance.)
+        """
+        timestamps = self.get_wv_timestamps(a_year)
+        acquisition_times = acquisition_times.astype("datetime64[ns]")
+
+        # The latest timestamp before each acquisition.
+        before = numpy.searchsorted(timestamps, acquisition_times, side="left") - 1
+        found = before >= 0
+        found[found] = timestamps[before[found]] > acquisition_times[
+            found
+        ] + numpy.timedelta64(self.max_tolerance)
+        return found
+
+    def day_dirs(self, base_path) -> Set[str]:
+        """
+        The names of the (day) directories in the base path, listed once.
+        """
+        if base_path not in self._day_dirs:
+            self._day_dirs[base_path] = self._list_day_dirs(base_path)
+        return self._day_dirs[base_path]
+
+    def _list_day_dirs(self, base_path) -> Set[str]:
+        try:
+            # Adding or removing a day directory changes the mtime of the base path.
+            mtime = os.stat(base_path).st_mtime_ns
+        except FileNotFoundError:
+            return set()
+        if self.cache is not None:
+            cached = self.cache.get(base_path, mtime)
+            if cached is not None:
+                return set(cached)
+
+        with os.scandir(base_path) as entries:
+            day_dirs = {entry.name for entry in entries if entry.is_dir()}
+        if self.cache is not None:
+            self.cache.put(base_path, mtime, sorted(day_dirs))
+        return day_dirs
 
-    @lru_cache(maxsize=20000)
     def brdf_day_exists(self, ymd, base_path):
-        brdf_day_of_interest = base_path.joinpath(ymd)
-        return brdf_day_of_interest.is_dir()
+        return ymd in self.day_dirs(base_path)
 
     def check_modis(self, ymd):
         if self.brdf_day_exists(ymd, self.brdf_path):
@@ -102,37 +281,56 @@ class AncillaryFiles:
         else:
             return False, f"VIIRS BRDF data for {ymd} does not exist."
 
+    def check_brdf(self, acquisition_datetime):
+        ymd = acquisition_datetime.strftime("%Y.%m.%d")
+        if acquisition_datetime < MODIS_START_DATE:
+            return True, ""
+        elif acquisition_datetime < self.use_viirs_after:
+            return self.check_modis(ymd)
+        else:
+            # use viirs
+            return self.check_viirs(ymd)
+
     def ancillary_files(self, acquisition_datetime):
-        if not self.wv_file_exists(acquisition_datetime.year):
-            return (
-                False,
-                "No water vapour data for year {}.".format(acquisition_datetime.year),
-            )
+        ancill_there, msgs = self.ancillary_files_batch([acquisition_datetime])
+        return bool(ancill_there[0]), msgs[0]
 
-        # get year of acquisition to confirm definitive data
-        index = self.get_wv_index(acquisition_datetime.year)
+    def ancillary_files_batch(
+        self, acquisition_datetimes: Sequence[datetime.datetime]
+    ) -> Tuple[numpy.ndarray, List[str]]:
+        """
+        Check the ancillary of many acquisitions at once.
 
+        :return: whether the ancillary is there for each, and the reason if not
+        """
         # Removing timezone info since different UTC formats were clashing.
-        acquisition_datetime = acquisition_datetime.replace(tzinfo=None)
+        acquisition_datetimes = [
+            dt.replace(tzinfo=None) for dt in acquisition_datetimes
+        ]
+        ancill_there = numpy.zeros(len(acquisition_datetimes), dtype=bool)
+        msgs = [""] * len(acquisition_datetimes)
+        if not acquisition_datetimes:
+            return ancill_there, msgs
 
-        delta = index.timestamp - acquisition_datetime
-        afilter = (delta < datetime.timedelta()) & (delta > self.max_tolerance)
-        result = delta[afilter]
+        acquisition_times = numpy.array(acquisition_datetimes, dtype="datetime64[ns]")
+        years = numpy.array([dt.year for dt in acquisition_datetimes])
+        for year in numpy.unique(years).tolist():
+            (in_year,) = numpy.nonzero(years == year)
+            if not self.wv_file_exists(year):
+                for i in in_year:
+                    msgs[i] = "No water vapour data for year {}.".format(year)
+                continue
 
-        if result.shape[0] == 0:
-            return (
-                False,
-                "Water vapour data for {} does not exist.".format(acquisition_datetime),
-            )
-        else:
-            ymd = acquisition_datetime.strftime("%Y.%m.%d")
-            if acquisition_datetime < MODIS_START_DATE:
-                return True, ""
-            elif acquisition_datetime < self.use_viirs_after:
-                return self.check_modis(ymd)
-            else:
-                # use viirs
-                return self.check_viirs(ymd)
+            # get year of acquisition to confirm definitive data
+            has_wv = self.wv_within_tolerance(year, acquisition_times[in_year])
+            for i, wv_there in zip(in_year, has_wv):
+                if not wv_there:
+                    msgs[i] = "Water vapour data for {} does not exist.".format(
+                        acquisition_datetimes[i]
+                    )
+                else:
+                    ancill_there[i], msgs[i] = self.check_brdf(acquisition_datetimes[i])
+        return ancill_there, msgs
 
 
 if __name__ == "__main__":
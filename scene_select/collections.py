@@ -12,11 +12,10 @@ import yaml
 from datacube import Datacube
 from datacube.index.hl import Doc2Dataset
 from datacube.model import Range, Dataset
-from eodatasets3.utils import default_utc
 from structlog.typing import WrappedLogger
 
 from scene_select.library import ArdProduct, Level1Product, ArdCollection
-from scene_select.utils import chopped_scene_id
+from scene_select.utils import chopped_scene_id, default_utc
 
 PACKAGED_DATA = Path(__file__).parent / "data"
 AOI_PATH = PACKAGED_DATA / "Australian_AOI.json"
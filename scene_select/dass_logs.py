@@ -10,6 +10,8 @@ Defines structured logging for:
 import functools
 import logging
 import traceback
+from collections import defaultdict
+from typing import Dict, List, Optional
 
 import structlog
 from structlog.processors import JSONRenderer
@@ -38,7 +40,105 @@ class FormatJSONL(logging.Formatter):
         return
 
 
-LOGGER = get_wrapped_logger("general")
+LOGGER_NAME = "general"
+# The LOGGER key for why a decision was made about a scene
+REASON = "reason"
+LOGGER = get_wrapped_logger(LOGGER_NAME)
+
+# How many decisions of each reason are logged individually, by default.
+DECISION_SAMPLE_SIZE = 10
+
+
+class DecisionLog:
+    """
+    The decisions made about each scene (eg. "scene removed", with a reason), counted by reason.
+
+    There can be tens of thousands of scenes a run, mostly removed for the same few
+    reasons. So only the first few decisions of each reason are logged individually
+    (with their scene's details), and the rest are only counted. The counts, and a
+    sample of the scene ids, are given by `summary()`.
+
+    Nothing is bound or rendered for a decision that isn't logged (including when the
+    log level is disabled).
+    """
+
+    def __init__(self, sample_size: int = DECISION_SAMPLE_SIZE, log_all: bool = False):
+        """
+        :param sample_size: how many scenes of each reason to log, and give in the summary
+        :param log_all: log every decision individually (the sample is still kept)
+        """
+        self.sample_size = sample_size
+        self.log_all = log_all
+        self._stdlib_logger = logging.getLogger(LOGGER_NAME)
+        # {event: {reason: count}}
+        self.counts: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.samples: Dict[str, Dict[str, List[str]]] = defaultdict(
+            lambda: defaultdict(list)
+        )
+
+    def scene(self, scene_id: str, **fields) -> "SceneLog":
+        """
+        A logger for the decisions about one scene.
+
+        :param fields: the scene's details, bound only when a decision is logged
+        """
+        return SceneLog(self, scene_id, fields)
+
+    def log(self, level: int, scene: "SceneLog", event: str, **kwargs):
+        reason = kwargs.get(REASON)
+        if reason is not None:
+            scene.reason = reason
+            count = self.counts[event][reason] = self.counts[event][reason] + 1
+            if count <= self.sample_size:
+                self.samples[event][reason].append(scene.scene_id)
+            elif not self.log_all:
+                return
+
+        if self._stdlib_logger.isEnabledFor(level):
+            LOGGER.bind(**scene.fields).log(level, event, **kwargs)
+
+    def add_count(self, event: str, reason: str, count: int):
+        """
+        Count decisions made without looking at each scene (eg. by a count query).
+        """
+        if count:
+            self.counts[event][reason] += count
+
+    def summary(self) -> Dict[str, Dict[str, Dict]]:
+        """
+        {event: {reason: {count, sample}}}
+        """
+        return {
+            event: {
+                reason: dict(count=count, sample=self.samples[event][reason])
+                for reason, count in sorted(reasons.items())
+            }
+            for event, reasons in self.counts.items()
+        }
+
+
+class SceneLog:
+    """
+    Logs the decisions about one scene through its DecisionLog (a stand-in for a bound logger).
+    """
+
+    __slots__ = ("decisions", "scene_id", "fields", "reason")
+
+    def __init__(self, decisions: DecisionLog, scene_id: str, fields: Dict):
+        self.decisions = decisions
+        self.scene_id = scene_id
+        self.fields = fields
+        # The reason of the latest decision
+        self.reason: Optional[str] = None
+
+    def debug(self, event: str, **kwargs):
+        self.decisions.log(logging.DEBUG, self, event, **kwargs)
+
+    def info(self, event: str, **kwargs):
+        self.decisions.log(logging.INFO, self, event, **kwargs)
+
+    def warning(self, event: str, **kwargs):
+        self.decisions.log(logging.WARNING, self, event, **kwargs)
 
 
 class LogMainFunction:
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Query the scene decision ledger: why was (or wasn't) a scene processed?
+
+Each scene select run given a ledger (--decision-ledger) appends what it decided about
+each scene it looked at (selected, or removed by which filter stage, and why) to a local
+SQLite ledger, indexed by scene id, dataset id, region code, acquisition date, run id and
+reason. (Scene select keeps KEEP_DAYS of runs, removing older ones as it adds a run.)
+
+Scenes outside the AOI, or acquired on an excluded day, are left out of scene select's
+searches, so they're never looked at, and have no decisions recorded.
+"""
+
+import datetime
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Iterable, List, NamedTuple, Optional
+
+import click
+
+LEDGER_FILE = "scene_decisions.sqlite"
+
+# How many days of runs scene select keeps in the ledger
+KEEP_DAYS = 90
+
+# Decisions
+SELECTED = "selected"
+REMOVED = "removed"
+# Would have been selected, but the run had enough newer scenes
+DEFERRED = "deferred"
+
+SCHEMA = """
+create table if not exists run (
+    run_id text primary key,
+    started text not null,
+    products text
+);
+create table if not exists decision (
+    run_id text not null,
+    scene_id text not null,
+    dataset_id text not null,
+    product text not null,
+    region_code text,
+    acquisition_date text,
+    decision text not null,
+    stage text,
+    reason text
+);
+create index if not exists decision_scene_id on decision (scene_id);
+create index if not exists decision_dataset_id on decision (dataset_id);
+create index if not exists decision_region_date on decision (region_code, acquisition_date);
+create index if not exists decision_acquisition_date on decision (acquisition_date);
+create index if not exists decision_run_id on decision (run_id);
+create index if not exists decision_reason on decision (reason);
+"""
+
+COLUMNS = (
+    "run_id",
+    "started",
+    "product",
+    "scene_id",
+    "dataset_id",
+    "region_code",
+    "acquisition_date",
+    "decision",
+    "stage",
+    "reason",
+)
+
+
+class Decision(NamedTuple):
+    scene_id: str
+    dataset_id: str
+    product: str
+    region_code: Optional[str]
+    # YYYY-MM-DD
+    acquisition_date: str
+    decision: str
+    # The filter stage that removed the scene (if it was removed)
+    stage: Optional[str]
+    reason: Optional[str]
+
+
+class DecisionLedger:
+    """
+    The decisions of every run, in a SQLite file.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Runs may overlap: wait for each other.
+        self.db = sqlite3.connect(str(self.path), timeout=600)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record_run(
+        self,
+        run_id: str,
+        products: List[str],
+        decisions: Iterable[Decision],
+        started: Optional[datetime.datetime] = None,
+        keep_days: Optional[int] = None,
+    ):
+        """
+        Append the decisions of a run (replacing any already recorded for the run id).
+
+        :param keep_days: remove the runs started more than this many days before this one
+                          (eg. KEEP_DAYS. By default, everything is kept.)
+        """
+        if started is None:
+            started = datetime.datetime.now(datetime.timezone.utc)
+        with self.db:
+            if keep_days is not None:
+                cutoff = (started - datetime.timedelta(days=keep_days)).isoformat()
+                self.db.execute(
+                    "delete from decision where run_id in "
+                    "(select run_id from run where started < ?)",
+                    (cutoff,),
+                )
+                self.db.execute("delete from run where started < ?", (cutoff,))
+            self.db.execute("delete from decision where run_id = ?", (run_id,))
+            self.db.execute(
+                "insert or replace into run values (?, ?, ?)",
+                (run_id, started.isoformat(), ",".join(products)),
+            )
+            self.db.executemany(
+                "insert into decision values (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((run_id, *decision) for decision in decisions),
+            )
+
+    def query(
+        self,
+        scene: Optional[str] = None,
+        region_code: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        run_id: Optional[str] = None,
+        reason: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[dict]:
+        """
+        The matching decisions, latest run first.
+
+        :param scene: a scene id or a dataset id
+        :param date_from: the earliest acquisition date (YYYY-MM-DD, inclusive)
+        :param date_to: the latest acquisition date (YYYY-MM-DD, inclusive)
+        """
+        where, params = [], []
+        if scene is not None:
+            where.append("(d.scene_id = ? or d.dataset_id = ?)")
+            params += [scene, scene]
+        if region_code is not None:
+            where.append("d.region_code = ?")
+            params.append(region_code)
+        if date_from is not None:
+            where.append("d.acquisition_date >= ?")
+            params.append(date_from)
+        if date_to is not None:
+            where.append("d.acquisition_date <= ?")
+            params.append(date_to)
+        if run_id is not None:
+            where.append("d.run_id = ?")
+            params.append(run_id)
+        if reason is not None:
+            where.append("d.reason = ?")
+            params.append(reason)
+
+        query = (
+            "select d.run_id, r.started, d.product, d.scene_id, d.dataset_id, "
+            "d.region_code, d.acquisition_date, d.decision, d.stage, d.reason "
+            "from decision d join run r on r.run_id = d.run_id"
+        )
+        if where:
+            query += " where " + " and ".join(where)
+        query += " order by r.started desc, d.acquisition_date desc, d.scene_id"
+        if limit is not None:
+            query += " limit ?"
+            params.append(limit)
+        return [dict(zip(COLUMNS, row)) for row in self.db.execute(query, params)]
+
+    def runs(self, limit: Optional[int] = None) -> List[dict]:
+        """
+        The recorded runs, latest first, with their count of each decision.
+        """
+        query = (
+            "select r.run_id, r.started, r.products, "
+            "sum(d.decision = ?), sum(d.decision = ?), sum(d.decision = ?) "
+            "from run r left join decision d on d.run_id = r.run_id "
+            "group by r.run_id order by r.started desc"
+        )
+        params = [SELECTED, REMOVED, DEFERRED]
+        if limit is not None:
+            query += " limit ?"
+            params.append(limit)
+        return [
+            dict(
+                run_id=run_id,
+                started=started,
+                products=products,
+                selected=selected or 0,
+                removed=removed or 0,
+                deferred=deferred or 0,
+            )
+            for run_id, started, products, selected, removed, deferred in self.db.execute(
+                query, params
+            )
+        ]
+
+
+def _echo_rows(rows: List[dict], columns):
+    click.echo("\t".join(columns))
+    for row in rows:
+        click.echo("\t".join("" if row[c] is None else str(row[c]) for c in columns))
+
+
+@click.group("ard-scene-decisions", help=__doc__)
+@click.option(
+    "--ledger",
+    type=click.Path(dir_okay=False, exists=True),
+    required=True,
+    help="The ledger file (as given to ard-scene-select --decision-ledger)",
+)
+@click.pass_context
+def cli(ctx, ledger: str):
+    ctx.ensure_object(dict)
+    ctx.obj["ledger"] = Path(ledger)
+
+
+@cli.command("why", help="The decisions made about a scene (by scene id or dataset id)")
+@click.argument("scene")
+@click.option("--limit", type=int, default=20, show_default=True)
+@click.pass_context
+def cli_why(ctx, scene: str, limit: int):
+    with DecisionLedger(ctx.obj["ledger"]) as ledger:
+        rows = ledger.query(scene=scene, limit=limit)
+    if not rows:
+        click.echo(
+            f"No decisions recorded for {scene}. (Scenes outside the AOI, or acquired on "
+            "an excluded day, are never searched for, so never recorded.)",
+            err=True,
+        )
+        sys.exit(1)
+    _echo_rows(rows, COLUMNS)
+
+
+@cli.command("list", help="The decisions matching all of the given options")
+@click.option("--region-code", help="eg. 092079 or 55HFA")
+@click.option("--date-from", help="Earliest acquisition date (YYYY-MM-DD)")
+@click.option("--date-to", help="Latest acquisition date (YYYY-MM-DD)")
+@click.option("--run-id", help="eg. filter-jobid-0a1b2c")
+@click.option("--reason", help='eg. "Region not in AOI"')
+@click.option("--limit", type=int, default=100, show_default=True)
+@click.pass_context
+def cli_list(ctx, **query):
+    with DecisionLedger(ctx.obj["ledger"]) as ledger:
+        _echo_rows(ledger.query(**query), COLUMNS)
+
+
+@cli.command("runs", help="The recorded runs, latest first")
+@click.option("--limit", type=int, default=20, show_default=True)
+@click.pass_context
+def cli_runs(ctx, limit: int):
+    with DecisionLedger(ctx.obj["ledger"]) as ledger:
+        _echo_rows(
+            ledger.runs(limit=limit),
+            ("run_id", "started", "products", "selected", "removed", "deferred"),
+        )
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,174 @@
+"""
+When is a scene eligible for processing?
+
+This is worked out once per scene select run (rather than for every scene): the
+excluded days are parsed into sorted intervals, and the interim cutoff is fixed.
+"""
+
+import bisect
+import datetime
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy
+
+from scene_select.utils import default_utc
+
+Period = Tuple[datetime.datetime, datetime.datetime]
+
+# The smallest step between times (the gap between an excluded period and the next).
+RESOLUTION = datetime.timedelta(microseconds=1)
+
+
+def parse_days_to_exclude(days_to_exclude: List[str]) -> List[Period]:
+    """
+    Parse our "YYYY-MM-DD:YYYY-MM-DD" strings into (inclusive) UTC periods.
+
+    >>> parse_days_to_exclude(["2020-08-09:2020-08-30"])
+    [(datetime.datetime(2020, 8, 9, 0, 0, tzinfo=datetime.timezone.utc), datetime.datetime(2020, 8, 30, 23, 59, 59, 999999, tzinfo=datetime.timezone.utc))]
+    """
+    periods = []
+    for period in days_to_exclude:
+        start, end = period.split(":")
+        start = datetime.datetime.strptime(start, "%Y-%m-%d").replace(
+            tzinfo=datetime.timezone.utc
+        )
+        end = datetime.datetime.strptime(end, "%Y-%m-%d").replace(
+            tzinfo=datetime.timezone.utc
+        )
+        # let's make it the end of the day
+        end = end.replace(hour=23, minute=59, second=59, microsecond=999999)
+        periods.append((start, end))
+    return periods
+
+
+def _merge_periods(periods: List[Period]) -> List[Period]:
+    """
+    Sort the periods, joining any that overlap, so that they can be bisected.
+    """
+    merged = []
+    for start, end in sorted(periods):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _as_utc_datetime64(datetimes: Sequence[datetime.datetime]) -> numpy.ndarray:
+    # numpy has no timezones: everything is compared as naive UTC.
+    return numpy.array(
+        [
+            default_utc(dt).astimezone(datetime.timezone.utc).replace(tzinfo=None)
+            for dt in datetimes
+        ],
+        dtype="datetime64[us]",
+    )
+
+
+class EligibilityCalendar:
+    def __init__(
+        self,
+        excluded_periods: List[Period],
+        interim_cutoff: datetime.datetime,
+    ):
+        """
+        :param excluded_periods: inclusive (start, end) periods in which nothing is processed
+        :param interim_cutoff: scenes acquired before this are processed to interim if their
+                               ancillary isn't ready.
+        """
+        periods = _merge_periods(
+            [(default_utc(start), default_utc(end)) for start, end in excluded_periods]
+        )
+        self.excluded_starts = [start for start, _ in periods]
+        self.excluded_ends = [end for _, end in periods]
+        self._starts64 = _as_utc_datetime64(self.excluded_starts)
+        self._ends64 = _as_utc_datetime64(self.excluded_ends)
+
+        self.interim_cutoff = default_utc(interim_cutoff)
+
+    @classmethod
+    def from_options(
+        cls,
+        days_to_exclude: List[str],
+        interim_days_wait: int,
+        now: Optional[datetime.datetime] = None,
+    ):
+        """
+        Build from the scene select command line options.
+        """
+        if now is None:
+            now = datetime.datetime.now(datetime.timezone.utc)
+        return cls(
+            parse_days_to_exclude(days_to_exclude),
+            interim_cutoff=now - datetime.timedelta(days=interim_days_wait),
+        )
+
+    @property
+    def excluded_periods(self) -> List[Period]:
+        return list(zip(self.excluded_starts, self.excluded_ends))
+
+    def included_periods(
+        self, begin: datetime.datetime, end: datetime.datetime
+    ) -> List[Period]:
+        """
+        The parts of the (inclusive) period that aren't excluded, in time order.
+
+        >>> calendar = EligibilityCalendar(
+        ...     parse_days_to_exclude(["2020-08-09:2020-08-30"]),
+        ...     interim_cutoff=datetime.datetime(2020, 1, 1),
+        ... )
+        >>> for start, end in calendar.included_periods(
+        ...     datetime.datetime(2020, 8, 1), datetime.datetime(2020, 8, 31, 23, 59, 59)
+        ... ):
+        ...     print(start.isoformat(), end.isoformat())
+        2020-08-01T00:00:00+00:00 2020-08-08T23:59:59.999999+00:00
+        2020-08-31T00:00:00+00:00 2020-08-31T23:59:59+00:00
+        """
+        begin, end = default_utc(begin), default_utc(end)
+        periods = []
+        # From the first excluded period that ends within the period.
+        i = bisect.bisect_left(self.excluded_ends, begin)
+        for excluded_start, excluded_end in zip(
+            self.excluded_starts[i:], self.excluded_ends[i:]
+        ):
+            if excluded_start > end:
+                break
+            if excluded_start > begin:
+                periods.append((begin, excluded_start - RESOLUTION))
+            begin = excluded_end + RESOLUTION
+        if begin <= end:
+            periods.append((begin, end))
+        return periods
+
+    def is_excluded(
+        self,
+        checkdatetime: Union[datetime.datetime, Sequence[datetime.datetime]],
+    ) -> Union[bool, numpy.ndarray]:
+        """
+        Is the time within an excluded period?
+
+        Given a sequence (or array) of times, a boolean array is returned.
+        """
+        if not isinstance(checkdatetime, datetime.datetime):
+            return self._are_excluded(checkdatetime)
+
+        checkdatetime = default_utc(checkdatetime)
+        i = bisect.bisect_right(self.excluded_starts, checkdatetime) - 1
+        return i >= 0 and checkdatetime <= self.excluded_ends[i]
+
+    def _are_excluded(self, datetimes) -> numpy.ndarray:
+        if isinstance(datetimes, numpy.ndarray) and datetimes.dtype.kind == "M":
+            times = datetimes.astype("datetime64[us]")
+        else:
+            times = _as_utc_datetime64(datetimes)
+
+        i = numpy.searchsorted(self._starts64, times, side="right") - 1
+        within = i >= 0
+        within[within] = times[within] <= self._ends64[i[within]]
+        return within
+
+    def can_process_to_interim(self, acquisition_time: datetime.datetime) -> bool:
+        """
+        Have we waited long enough for ancillary, so that the scene should be processed anyway?
+        """
+        return self.interim_cutoff > default_utc(acquisition_time)
@@ -0,0 +1,196 @@
+"""
+An ordered chain of filter stages that candidate scenes pass through.
+
+Each stage knows its estimated cost (per scene) and selectivity (the fraction of scenes
+it is expected to keep), and records how many scenes it checked, how many it removed, and
+the time it took.
+
+Stages come in two kinds:
+
+- Independent stages decide on each scene by itself. They are run cheapest and most
+  selective first, each over the whole batch of survivors of the stage before it, so an
+  expensive stage only sees the scenes that the cheap ones let through.
+
+- Sequential stages depend on what was decided for earlier scenes (eg. duplicate
+  detection), so they run afterwards, in the order given, one scene at a time.
+
+Any stage can do batch work (such as a single DB query) in `prepare()`. An independent
+stage receives every scene it is about to check. A sequential stage receives the whole
+chunk that survived the independent stages, including scenes that an earlier sequential
+stage will go on to remove (as those decisions are only made one scene at a time).
+"""
+
+import time
+from typing import (
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TypeVar,
+)
+
+Candidate = TypeVar("Candidate")
+
+
+class FilterStage(Generic[Candidate]):
+    """
+    A single filter. Subclasses implement `keep()`, and optionally `prepare()`/`accepted()`.
+    """
+
+    name: str = "filter"
+
+    # Relative cost of checking one scene (a set lookup is ~1, a DB round trip is 1000s).
+    cost: float = 1.0
+    # The expected fraction of scenes this stage keeps.
+    selectivity: float = 1.0
+    # Does the decision depend on decisions made for earlier scenes?
+    sequential: bool = False
+    # Is a scene removed by this stage removed for good? (ie. it needn't be looked at again)
+    settles: bool = False
+
+    def __init__(self):
+        self.checked = 0
+        self.removed = 0
+        self.seconds = 0.0
+
+    @property
+    def rank(self) -> float:
+        """
+        The classic predicate-ordering rank: stages that remove the most per unit of cost
+        come first (lowest rank).
+        """
+        return (self.selectivity - 1) / self.cost
+
+    def prepare(self, candidates: List[Candidate]) -> None:
+        """
+        Called with all scenes this stage may check (eg. to fetch what it needs in bulk).
+
+        (For a sequential stage, some may be removed by an earlier stage before reaching it.)
+        """
+
+    def keep(self, candidate: Candidate) -> bool:
+        """
+        Should this scene continue to the next stage? (Log the reason if not.)
+        """
+        raise NotImplementedError
+
+    def accepted(self, candidate: Candidate) -> None:
+        """
+        Called for each scene that passed every stage.
+        """
+
+    def removed_for_good(self, candidate: Candidate) -> bool:
+        """
+        Is a scene this stage removed settled? (By default, if the stage `settles`.
+        A stage can instead decide per scene, by why it removed it.)
+        """
+        return self.settles
+
+    def timed_prepare(self, candidates: List[Candidate]):
+        start = time.perf_counter()
+        self.prepare(candidates)
+        self.seconds += time.perf_counter() - start
+
+    def timed_keep(self, candidate: Candidate) -> bool:
+        start = time.perf_counter()
+        kept = self.keep(candidate)
+        self.seconds += time.perf_counter() - start
+
+        self.checked += 1
+        if not kept:
+            self.removed += 1
+        return kept
+
+    def summary(self) -> Dict:
+        return dict(
+            checked=self.checked,
+            removed=self.removed,
+            seconds=round(self.seconds, 3),
+        )
+
+
+class FilterPipeline(Generic[Candidate]):
+    def __init__(
+        self,
+        stages: Iterable[FilterStage],
+        on_removed: Optional[Callable[[FilterStage, Candidate], None]] = None,
+    ):
+        """
+        :param on_removed: called with the stage and candidate whenever a stage removes one
+        """
+        stages = list(stages)
+        self.on_removed = on_removed
+        # (sorted() is stable, so equally-ranked stages keep their given order)
+        self.independent_stages = sorted(
+            (stage for stage in stages if not stage.sequential),
+            key=lambda stage: stage.rank,
+        )
+        self.sequential_stages = [stage for stage in stages if stage.sequential]
+        # The candidates removed for good by the last run (see removed_for_good()).
+        self.settled: List[Candidate] = []
+
+    @property
+    def stages(self) -> List[FilterStage]:
+        """All stages, in the order they are run."""
+        return self.independent_stages + self.sequential_stages
+
+    def run(self, candidates: Iterable[Candidate]) -> List[Candidate]:
+        """
+        Filter a batch of candidates, returning those that pass every stage (in their original order).
+        """
+        return list(self.iter_run(candidates))
+
+    def iter_run(
+        self, candidates: Iterable[Candidate], chunk_size: Optional[int] = None
+    ) -> Iterator[Candidate]:
+        """
+        Filter a batch of candidates, yielding those that pass every stage (in their original order).
+
+        The sequential stages are prepared and run a chunk at a time, so if the caller stops
+        early, the candidates after that chunk are never checked by them. Every sequential
+        stage is prepared with the whole chunk before any of them checks a candidate.
+        """
+        self.settled = []
+        candidates = list(candidates)
+        for stage in self.independent_stages:
+            if not candidates:
+                break
+            stage.timed_prepare(candidates)
+            kept = []
+            for candidate in candidates:
+                if stage.timed_keep(candidate):
+                    kept.append(candidate)
+                else:
+                    self._removed(stage, candidate)
+            candidates = kept
+
+        chunk_size = chunk_size or max(len(candidates), 1)
+        for start in range(0, len(candidates), chunk_size):
+            chunk = candidates[start : start + chunk_size]
+            for stage in self.sequential_stages:
+                stage.timed_prepare(chunk)
+
+            for candidate in chunk:
+                for stage in self.sequential_stages:
+                    if not stage.timed_keep(candidate):
+                        self._removed(stage, candidate)
+                        break
+                else:
+                    for stage in self.stages:
+                        stage.accepted(candidate)
+                    yield candidate
+
+    def _removed(self, stage: FilterStage, candidate: Candidate):
+        if stage.removed_for_good(candidate):
+            self.settled.append(candidate)
+        if self.on_removed is not None:
+            self.on_removed(stage, candidate)
+
+    def summary(self) -> Dict[str, Dict]:
+        """
+        The counts and timings of each stage, in run order.
+        """
+        return {stage.name: stage.summary() for stage in self.stages}
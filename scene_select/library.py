@@ -1,20 +1,38 @@
 import calendar
 import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
 from pathlib import Path
-from typing import Optional, List, Generator, Tuple, Iterable
+from typing import Callable, Dict, Optional, List, Generator, Tuple, Iterable, Iterator
 
 import structlog
+import yaml
 from attr import define, field
 from datacube import Datacube
 from datacube.model import Range, Dataset
 from datacube.utils import uri_to_local_path
-from eodatasets3.utils import default_utc
-from ruamel import yaml
+
+from scene_select.utils import default_utc
+
+try:
+    # libyaml's, which is much faster, if it's installed.
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
 
 
 _LOG = structlog.get_logger()
 
+# How many documents prefetch() reads at once. (Reads wait on the filesystem, not the CPU.)
+PREFETCH_THREADS = 16
+
+
+def load_yaml_doc(path: Path) -> dict:
+    with Path(path).open("rb") as f:
+        return yaml.load(f, Loader=YamlLoader)
+
 
 @define(hash=True)
 class Level1Product:
@@ -59,10 +77,18 @@ class BaseDataset:
     dataset_id: str = field(eq=True, hash=True)
     metadata_path: Path = field(eq=False, hash=False)
 
-    # TODO: cached_property?
+    # The documents read so far, by path.
+    _documents: Dict[Path, dict] = field(
+        factory=dict, init=False, eq=False, hash=False, repr=False
+    )
+
+    def _document(self, path: Path) -> dict:
+        if path not in self._documents:
+            self._documents[path] = load_yaml_doc(path)
+        return self._documents[path]
+
     def metadata_doc(self) -> dict:
-        with self.metadata_path.open() as f:
-            return yaml.safe_load(f)
+        return self._document(self.metadata_path)
 
 
 @define(unsafe_hash=True)
@@ -97,17 +123,16 @@ class Level1Dataset(BaseDataset):
                 )
                 # All file have an `id` field, so we can find which one matches dataset.id
                 for granule_metadata in all_granule_metadatas:
-                    with granule_metadata.open() as f:
-                        granule_doc = yaml.safe_load(f)
-                        if str(granule_doc["id"]) == str(dataset.id):
-                            metadata_path = granule_metadata
-                            break
-                        # _LOG.debug(
-                        #     "filtered_different_id",
-                        #     document_dataset_id=granule_doc["id"],
-                        #     our_dataset_id=dataset.id,
-                        #     metadata_path=granule_metadata,
-                        # )
+                    granule_doc = load_yaml_doc(granule_metadata)
+                    if str(granule_doc["id"]) == str(dataset.id):
+                        metadata_path = granule_metadata
+                        break
+                    # _LOG.debug(
+                    #     "filtered_different_id",
+                    #     document_dataset_id=granule_doc["id"],
+                    #     our_dataset_id=dataset.id,
+                    #     metadata_path=granule_metadata,
+                    # )
                 else:
                     raise ValueError(
                         f"Could not find metadata for {data_path}, tried {metadata_path} and {all_granule_metadatas}"
@@ -159,10 +184,8 @@ class ArdDataset(BaseDataset):
         # TODO: This should properly handle different subfolders/etc
         return self.metadata_path.with_name(accessories["metadata:processor"]["path"])
 
-    # TODO: cached_property?
     def proc_info_doc(self) -> dict:
-        with self.proc_info_path.open() as f:
-            return yaml.safe_load(f)
+        return self._document(self.proc_info_path)
 
     def software_versions(self):
         """
@@ -186,6 +209,44 @@ class ArdDataset(BaseDataset):
         )
 
 
+def prefetch(
+    datasets: Iterable[BaseDataset],
+    read: Callable[[BaseDataset], object] = BaseDataset.metadata_doc,
+    threads: int = PREFETCH_THREADS,
+) -> Iterator[BaseDataset]:
+    """
+    Yield the datasets in order, having read their documents (with `read`) in a pool of
+    threads, a few ahead of the caller.
+
+    A dataset that can't be read is yielded all the same: the caller gets the error
+    when it reads it.
+    """
+
+    def read_quietly(dataset: BaseDataset) -> BaseDataset:
+        try:
+            read(dataset)
+        except Exception:  # pylint: disable=broad-except
+            pass
+        return dataset
+
+    datasets = iter(datasets)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        ahead = deque(
+            executor.submit(read_quietly, dataset)
+            for dataset in islice(datasets, threads * 2)
+        )
+        try:
+            while ahead:
+                dataset = ahead.popleft().result()
+                for next_dataset in islice(datasets, 1):
+                    ahead.append(executor.submit(read_quietly, next_dataset))
+                yield dataset
+        finally:
+            # (if the caller stopped early)
+            for future in ahead:
+                future.cancel()
+
+
 class ArdCollection:
     def __init__(
         self,
@@ -214,6 +275,20 @@ class ArdCollection:
         self,
         search_expressions: dict,
     ) -> Generator[Tuple[ArdProduct, ArdDataset], None, None]:
+        for product, ard_datasets in self.iterate_indexed_ard_blocks(
+            search_expressions
+        ):
+            for ard_dataset in ard_datasets:
+                yield product, ard_dataset
+
+    def iterate_indexed_ard_blocks(
+        self,
+        search_expressions: dict,
+    ) -> Generator[Tuple[ArdProduct, List[ArdDataset]], None, None]:
+        """
+        The same datasets as iterate_indexed_ard_datasets(), a month block at a time
+        (so that each block can be looked up in bulk).
+        """
         for product in self.products:
             if (
                 "product" in search_expressions
@@ -242,6 +317,7 @@ class ArdCollection:
                     time=displayable_date_range(time),
                 )
 
+                block = []
                 for (
                     dataset_id,
                     maturity,
@@ -255,15 +331,16 @@ class ArdCollection:
                     # Note that we may receive the same dataset multiple times due to time boundaries
                     # (hence: record our seen ones)
                     if dataset_id not in seen_dataset_ids:
-                        yield (
-                            product,
+                        block.append(
                             ArdDataset(
                                 dataset_id=str(dataset_id),
                                 maturity=maturity,
                                 metadata_path=uri_to_local_path(uri),
-                            ),
+                            )
                         )
                         seen_dataset_ids.add(dataset_id)
+                if block:
+                    yield product, block
 
 
 def month_as_range(
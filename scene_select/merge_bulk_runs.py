@@ -30,13 +30,11 @@ from datacube.index import Index
 from datacube.index.hl import Doc2Dataset
 from datacube.model import Dataset
 from datacube.ui import click as ui
-from eodatasets3.prepare.landsat_l1_prepare import normalise_nci_symlinks
-from eodatasets3.utils import default_utc
 from ruamel import yaml
 
 from scene_select.collections import get_product
 from scene_select.library import ArdProduct
-from scene_select.utils import structlog_setup
+from scene_select.utils import default_utc, structlog_setup
 
 _LOG = structlog.get_logger()
 
@@ -70,6 +68,9 @@ def find_source_level1_path(metadata_file: Path) -> Path:
 
 
 def normal_path(path: Path) -> Path:
+    # (eodatasets3 takes seconds to import, so only when a path needs it)
+    from eodatasets3.prepare.landsat_l1_prepare import normalise_nci_symlinks
+
     return normalise_nci_symlinks(path.absolute())
 
 
@@ -313,7 +314,7 @@ def archive_old_dataset(
 
 
 def _normalise(path: Path) -> Path:
-    return normalise_nci_symlinks(path.absolute())
+    return normal_path(path)
 
 
 def move_to_trash(
@@ -387,7 +388,7 @@ def get_nci_drive(p: Path) -> Path:
     >>> get_nci_drive(Path('/home/547/lpgs/dea-orchestration'))
     PosixPath('/home/547/lpgs')
     """
-    match normalise_nci_symlinks(p.absolute()).parts:
+    match normal_path(p).parts:
         case ("/", "g", "data", project, *_):
             return Path("/g/data", project)
         case ("/", "scratch", project, *_):
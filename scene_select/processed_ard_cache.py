@@ -0,0 +1,250 @@
+"""
+A local SQLite copy of the scene ids of an ARD product, kept between runs.
+
+Rather than searching the whole ARD product every run, the cache is refreshed from the
+datasets added (or archived) since its last refresh.
+
+An un-archived dataset keeps its old added time (and loses its archived time), so isn't
+among those changes. Instead, each refresh compares the number of cached datasets with the
+number of active ones in the index, and rebuilds the cache if they differ.
+"""
+
+import datetime
+import sqlite3
+import uuid
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable, NamedTuple, Optional
+
+from scene_select import utils
+from scene_select.dass_logs import LOGGER
+from scene_select.processed_ards import ProcessedArdScenes
+from scene_select.scan_state import WATERMARK_OVERLAP
+from scene_select.utils import default_utc
+
+if TYPE_CHECKING:
+    from datacube.model import Range
+
+# The most dataset ids to search for at once.
+ID_CHUNK = 500
+
+SCHEMA = """
+create table if not exists ard (
+    id blob primary key,
+    scene_id text not null,
+    dataset_maturity text,
+    time_end real not null
+);
+create index if not exists ard_time_end on ard (time_end);
+create table if not exists refresh (
+    name text primary key,
+    value text
+);
+"""
+
+
+class ArdEntry(NamedTuple):
+    scene_id: str
+    id: uuid.UUID
+    dataset_maturity: Optional[str]
+    time_end: datetime.datetime
+
+
+def _timestamp(dt: datetime.datetime) -> float:
+    return default_utc(dt).timestamp()
+
+
+def _product_datasets(columns, product: str):
+    from datacube.drivers.postgres._schema import DATASET, PRODUCT
+    from sqlalchemy import select
+
+    return (
+        select(columns)
+        .select_from(DATASET.join(PRODUCT, PRODUCT.c.id == DATASET.c.dataset_type_ref))
+        .where(PRODUCT.c.name == product)
+    )
+
+
+def latest_change(dc, product: str) -> Optional[datetime.datetime]:
+    """
+    When a dataset of the product was last added or archived.
+    """
+    from datacube.drivers.postgres._schema import DATASET
+    from sqlalchemy import func
+
+    engine = utils.alchemy_engine(dc.index)
+    added, archived = engine.execute(
+        _product_datasets(
+            [func.max(DATASET.c.added), func.max(DATASET.c.archived)], product
+        )
+    ).first()
+    return max((t for t in (added, archived) if t is not None), default=None)
+
+
+def active_count(dc, product: str) -> int:
+    """
+    How many datasets of the product are active (not archived).
+    """
+    from datacube.drivers.postgres._schema import DATASET
+    from sqlalchemy import func
+
+    engine = utils.alchemy_engine(dc.index)
+    return engine.execute(
+        _product_datasets([func.count()], product).where(DATASET.c.archived.is_(None))
+    ).scalar()
+
+
+def changed_since(dc, product: str, since: datetime.datetime):
+    """
+    The datasets of the product added or archived since the given time.
+
+    :return: the ids of those that are active, those that are archived, and the latest change
+    """
+    from datacube.drivers.postgres._schema import DATASET
+    from sqlalchemy import or_
+
+    engine = utils.alchemy_engine(dc.index)
+    query = _product_datasets(
+        [DATASET.c.id, DATASET.c.added, DATASET.c.archived], product
+    ).where(or_(DATASET.c.added > since, DATASET.c.archived > since))
+    active, archived, latest = set(), set(), None
+    for dataset_id, added_time, archived_time in engine.execute(query):
+        if archived_time is None:
+            active.add(dataset_id)
+        else:
+            archived.add(dataset_id)
+        for t in (added_time, archived_time):
+            if t is not None and (latest is None or t > latest):
+                latest = t
+    return active, archived, latest
+
+
+class ProcessedArdCache:
+    """
+    The scene ids of one ARD product, in a SQLite file in the cache directory.
+    """
+
+    def __init__(self, cache_dir: Path, ard_product: str):
+        self.ard_product = ard_product
+        self.path = Path(cache_dir) / f"{ard_product}.sqlite"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Other processes may be refreshing the same product: wait for them.
+        self.db = sqlite3.connect(str(self.path), timeout=600)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def refreshed_until(self) -> Optional[datetime.datetime]:
+        row = self.db.execute(
+            "select value from refresh where name = 'refreshed_until'"
+        ).fetchone()
+        return datetime.datetime.fromisoformat(row[0]) if row else None
+
+    def _set_refreshed_until(self, when: Optional[datetime.datetime]):
+        if when is None:
+            self.db.execute("delete from refresh where name = 'refreshed_until'")
+        else:
+            self.db.execute(
+                "insert or replace into refresh values ('refreshed_until', ?)",
+                (when.isoformat(),),
+            )
+
+    def _rebuild(self, search: Callable[..., Iterable[ArdEntry]]):
+        self.db.execute("delete from ard")
+        self._insert(search())
+        LOGGER.info(
+            "Rebuilt ARD scene cache",
+            product=self.ard_product,
+            path=str(self.path),
+        )
+
+    def _insert(self, entries: Iterable[ArdEntry]):
+        self.db.executemany(
+            "insert or replace into ard values (?, ?, ?, ?)",
+            (
+                (
+                    entry.id.bytes,
+                    entry.scene_id,
+                    entry.dataset_maturity,
+                    _timestamp(entry.time_end),
+                )
+                for entry in entries
+            ),
+        )
+
+    def refresh(
+        self,
+        dc,
+        search: Callable[..., Iterable[ArdEntry]],
+        rebuild: bool = False,
+    ):
+        """
+        Bring the cache up to date with the index.
+
+        :param search: searches the ARD product with the given query (eg. ids),
+                       yielding an ArdEntry for each dataset
+        :param rebuild: reload the whole product, rather than just what has changed
+        """
+        since = self.refreshed_until
+        # The same transaction covers the whole refresh, so it is never half-done.
+        with self.db:
+            if rebuild or since is None:
+                # Taken before searching, so that anything added meanwhile is seen next time.
+                latest = latest_change(dc, self.ard_product)
+                self._rebuild(search)
+            else:
+                # Changes are stamped when their transaction starts, so look back a little.
+                active, archived, latest = changed_since(
+                    dc, self.ard_product, since - WATERMARK_OVERLAP
+                )
+                self.db.executemany(
+                    "delete from ard where id = ?",
+                    ((dataset_id.bytes,) for dataset_id in archived),
+                )
+                active = sorted(active)
+                for i in range(0, len(active), ID_CHUNK):
+                    self._insert(search(id=active[i : i + ID_CHUNK]))
+                latest = max(since, latest) if latest else since
+
+                # Anything un-archived is missing (see above).
+                (cached,) = self.db.execute("select count(*) from ard").fetchone()
+                active_datasets = active_count(dc, self.ard_product)
+                if cached != active_datasets:
+                    LOGGER.info(
+                        "ARD scene cache differs from the index",
+                        product=self.ard_product,
+                        cached=cached,
+                        active=active_datasets,
+                    )
+                    self._rebuild(search)
+            self._set_refreshed_until(latest)
+
+    def processed_ard_scenes(
+        self,
+        time_range: Optional["Range"] = None,
+        on_collision: Optional[Callable] = None,
+    ) -> ProcessedArdScenes:
+        """
+        The cached scene ids (of ARD whose time ends within the range, if given).
+        """
+        query = "select scene_id, id, dataset_maturity from ard"
+        params = ()
+        if time_range is not None:
+            query += " where time_end between ? and ?"
+            params = (_timestamp(time_range.begin), _timestamp(time_range.end))
+        # In the order they were added, as the index would give them.
+        query += " order by rowid"
+        return ProcessedArdScenes(
+            (
+                (scene_id, uuid.UUID(bytes=ard_id), maturity)
+                for scene_id, ard_id, maturity in self.db.execute(query, params)
+            ),
+            on_collision=on_collision,
+        )
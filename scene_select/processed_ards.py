@@ -0,0 +1,106 @@
+"""
+A compact lookup of the ARD already produced for each (chopped) scene id.
+
+There can be millions of these for Sentinel-2, so rather than a dict of dicts they're
+kept in sorted arrays: the interned scene ids, the ARD uuids as 16 bytes each, and the
+maturity as a small int.
+"""
+
+import bisect
+import sys
+import uuid
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy
+
+# The usual maturities get the same codes every time. Others are added as they're seen.
+KNOWN_MATURITIES = ("final", "interim", "nrt", None)
+
+
+class ProcessedArd(NamedTuple):
+    id: uuid.UUID
+    dataset_maturity: Optional[str]
+
+
+class ProcessedArdScenes:
+    """
+    A read-only mapping of chopped scene id to the ProcessedArd produced for it.
+
+    Where a scene id has more than one ARD, the last one given wins.
+    """
+
+    def __init__(
+        self,
+        entries: Iterable[Tuple[str, uuid.UUID, Optional[str]]],
+        on_collision: Optional[Callable[[str, uuid.UUID, uuid.UUID], None]] = None,
+    ):
+        """
+        :param entries: (chopped scene id, ARD id, dataset maturity) for each ARD
+        :param on_collision: called with (scene id, old id, new id) when a scene id is repeated
+        """
+        self.maturities: List[Optional[str]] = list(KNOWN_MATURITIES)
+        maturity_codes = {maturity: i for i, maturity in enumerate(self.maturities)}
+
+        scene_ids = []
+        ard_ids = bytearray()
+        maturities = []
+        for scene_id, ard_id, maturity in entries:
+            if maturity not in maturity_codes:
+                maturity_codes[maturity] = len(self.maturities)
+                self.maturities.append(maturity)
+            scene_ids.append(sys.intern(scene_id))
+            ard_ids += ard_id.bytes
+            maturities.append(maturity_codes[maturity])
+
+        # A stable sort, so repeats of a scene id stay in the order they were given.
+        order = sorted(range(len(scene_ids)), key=scene_ids.__getitem__)
+        all_ard_ids = numpy.frombuffer(bytes(ard_ids), dtype="V16")
+        all_maturities = numpy.array(maturities, dtype=numpy.uint8)
+
+        keep = []
+        for previous, current in zip(order, order[1:]):
+            if scene_ids[previous] == scene_ids[current]:
+                if on_collision:
+                    on_collision(
+                        scene_ids[current],
+                        uuid.UUID(bytes=bytes(all_ard_ids[previous])),
+                        uuid.UUID(bytes=bytes(all_ard_ids[current])),
+                    )
+            else:
+                keep.append(previous)
+        if order:
+            keep.append(order[-1])
+
+        self.scene_ids: List[str] = [scene_ids[i] for i in keep]
+        self.ard_ids: numpy.ndarray = all_ard_ids[keep]
+        self.dataset_maturities: numpy.ndarray = all_maturities[keep]
+
+    def _find(self, scene_id: str) -> Optional[int]:
+        i = bisect.bisect_left(self.scene_ids, scene_id)
+        if i < len(self.scene_ids) and self.scene_ids[i] == scene_id:
+            return i
+        return None
+
+    def __contains__(self, scene_id: str) -> bool:
+        return self._find(scene_id) is not None
+
+    def __getitem__(self, scene_id: str) -> ProcessedArd:
+        i = self._find(scene_id)
+        if i is None:
+            raise KeyError(scene_id)
+        return ProcessedArd(
+            id=uuid.UUID(bytes=bytes(self.ard_ids[i])),
+            dataset_maturity=self.maturities[self.dataset_maturities[i]],
+        )
+
+    def get(self, scene_id: str, default=None) -> Optional[ProcessedArd]:
+        try:
+            return self[scene_id]
+        except KeyError:
+            return default
+
+    def __len__(self) -> int:
+        return len(self.scene_ids)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.scene_ids)
@@ -0,0 +1,108 @@
+"""
+The state kept between incremental scene select runs.
+
+For each Level 1 product we remember:
+
+- the watermark: the latest time (by the database's clock) that a dataset of the product
+  was added to the index, as seen by the last run.
+- the pending scenes: those the last run looked at that may still need processing
+  (eg. waiting on ancillary, or with only an interim ARD). Scenes that are settled,
+  such as those outside the AOI or with a final ARD, are not kept.
+  Scenes the last run selected are kept too, until a run finds their final ARD, so that
+  one whose processing failed is selected again.
+
+The next run then only needs to look at the datasets added since the watermark, and the
+pending ones.
+"""
+
+import datetime
+import json
+import os
+import tempfile
+import uuid
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from attr import Factory, define
+
+from scene_select.dass_logs import LOGGER
+
+STATE_FILE = "ard_scene_select_state.json"
+
+# Datasets are stamped with the time their transaction started, which may be committed
+# after a later-stamped one. So each run looks back a little before the watermark.
+WATERMARK_OVERLAP = datetime.timedelta(hours=1)
+
+
+@define
+class ScanState:
+    """
+    What the last run saw of one product. With no watermark, everything is scanned.
+    """
+
+    watermark: Optional[datetime.datetime] = None
+    pending: Set[uuid.UUID] = Factory(set)
+
+    @property
+    def is_incremental(self) -> bool:
+        return self.watermark is not None
+
+    @property
+    def added_since(self) -> Optional[datetime.datetime]:
+        """The time to look for newly-added datasets from."""
+        if self.watermark is None:
+            return None
+        return self.watermark - WATERMARK_OVERLAP
+
+    def to_doc(self) -> Dict:
+        return dict(
+            watermark=self.watermark.isoformat() if self.watermark else None,
+            pending=sorted(str(dataset_id) for dataset_id in self.pending),
+        )
+
+    @classmethod
+    def from_doc(cls, doc: Dict) -> "ScanState":
+        watermark = doc.get("watermark")
+        return cls(
+            watermark=datetime.datetime.fromisoformat(watermark) if watermark else None,
+            pending={uuid.UUID(dataset_id) for dataset_id in doc.get("pending", [])},
+        )
+
+
+def load_scan_states(state_file: Path) -> Dict[str, ScanState]:
+    """
+    The state of each product from the last run (empty if there's no usable state file).
+    """
+    try:
+        with open(state_file) as f:
+            doc = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        LOGGER.warning(
+            "Unreadable scene select state. Scanning everything.",
+            state_file=str(state_file),
+        )
+        return {}
+    return {
+        product: ScanState.from_doc(product_doc)
+        for product, product_doc in doc.get("products", {}).items()
+    }
+
+
+def save_scan_states(state_file: Path, states: Dict[str, ScanState]):
+    """
+    Update the state file with these products' states (atomically, so an interrupted run
+    leaves the old one).
+
+    Other products' states are kept, so a run of only some products doesn't send the
+    others back to a full scan.
+    """
+    state_file = Path(state_file)
+    states = {**load_scan_states(state_file), **states}
+    doc = dict(products={product: state.to_doc() for product, state in states.items()})
+    with tempfile.NamedTemporaryFile(
+        "w", dir=state_file.parent, prefix=f".{state_file.name}.", delete=False
+    ) as f:
+        json.dump(doc, f, indent=2)
+    os.replace(f.name, state_file)
@@ -22,12 +22,13 @@ import warnings
 from typing import Any, NamedTuple
 
 import pandas
-from eodatasets3.utils import default_utc
 from pandas import to_datetime as pandas_to_datetime
 from lark import Lark, v_args, Transformer
 
 from datacube.model import Range
 
+from scene_select.utils import default_utc
+
 search_grammar = r"""
     start: expression*
     ?expression: equals_expr
@@ -0,0 +1,166 @@
+"""
+Run scene select as a long-lived service, rather than once per cron invocation.
+
+The index connection, ancillary checker and processed ARD scene ids are kept between
+cycles, and a cycle is run on a schedule, or when triggered locally: by a connection to a
+Unix socket, or by touching a file.
+
+    echo run | nc -U /path/to/trigger.sock
+    echo stop | nc -U /path/to/trigger.sock
+    touch /path/to/trigger-file
+"""
+
+import os
+import select
+import signal
+import socket
+import time
+import traceback
+from pathlib import Path
+from typing import Callable, Optional
+
+from scene_select.dass_logs import LOGGER
+
+# How often to check for a touched trigger file (or a stop signal)
+POLL_SECONDS = 1.0
+
+# Why a cycle was run
+STARTED = "started"
+SCHEDULE = "schedule"
+SOCKET = "socket"
+TRIGGER_FILE = "trigger file"
+
+
+class Triggers:
+    """
+    Waits for the next cycle to be due.
+    """
+
+    def __init__(
+        self,
+        interval: Optional[float] = None,
+        socket_path: Optional[Path] = None,
+        trigger_file: Optional[Path] = None,
+    ):
+        """
+        :param interval: run a cycle this many seconds after the last one finished
+        :param socket_path: run a cycle when anything connects to this Unix socket
+                            (or stop, if it sends "stop")
+        :param trigger_file: run a cycle when this file is created or touched
+        """
+        if interval is None and socket_path is None and trigger_file is None:
+            raise ValueError("The service needs an interval, socket or trigger file")
+        self.interval = interval
+        self.socket_path = Path(socket_path) if socket_path else None
+        self.trigger_file = Path(trigger_file) if trigger_file else None
+        self.stopping = False
+        self._server: Optional[socket.socket] = None
+        self._trigger_mtime = self._file_mtime()
+
+    def __enter__(self):
+        if self.socket_path is not None:
+            # (left behind by a service that didn't exit cleanly)
+            if self.socket_path.is_socket():
+                self.socket_path.unlink()
+            self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._server.bind(str(self.socket_path))
+            self._server.listen()
+        return self
+
+    def __exit__(self, *exc):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            self.socket_path.unlink(missing_ok=True)
+
+    def stop(self, *args):
+        """Stop waiting (eg. on SIGTERM). A running cycle is finished first."""
+        self.stopping = True
+
+    def _file_mtime(self) -> Optional[int]:
+        if self.trigger_file is None:
+            return None
+        try:
+            return os.stat(self.trigger_file).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _file_touched(self) -> bool:
+        mtime = self._file_mtime()
+        touched = mtime is not None and mtime != self._trigger_mtime
+        self._trigger_mtime = mtime
+        return touched
+
+    def _accept(self) -> str:
+        connection, _ = self._server.accept()
+        with connection:
+            connection.settimeout(POLL_SECONDS)
+            try:
+                command = connection.recv(1024).decode(errors="replace").strip()
+            except socket.timeout:
+                command = ""
+            connection.sendall(b"stopping\n" if command == "stop" else b"ok\n")
+        return command
+
+    def wait(self) -> Optional[str]:
+        """
+        Wait for the next cycle.
+
+        :return: why it's due, or None if the service should stop
+        """
+        deadline = None
+        if self.interval is not None:
+            deadline = time.monotonic() + self.interval
+        while not self.stopping:
+            timeout = POLL_SECONDS
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return SCHEDULE
+                timeout = min(timeout, remaining)
+
+            if self._file_touched():
+                return TRIGGER_FILE
+
+            if self._server is not None:
+                readable, _, _ = select.select([self._server], [], [], timeout)
+                if readable:
+                    if self._accept() == "stop":
+                        return None
+                    return SOCKET
+            else:
+                time.sleep(timeout)
+        return None
+
+
+def serve(run_cycle: Callable[[str], None], triggers: Triggers):
+    """
+    Run a cycle now, then each time the triggers say, until stopped.
+
+    A failed cycle is logged, and the service carries on.
+    """
+    previous_handler = signal.signal(signal.SIGTERM, triggers.stop)
+    try:
+        with triggers:
+            reason = STARTED
+            while reason is not None:
+                start = time.monotonic()
+                try:
+                    run_cycle(reason)
+                except Exception as ex:  # pylint: disable=broad-except
+                    LOGGER.error(
+                        "scene select cycle failed",
+                        trigger=reason,
+                        exception=str(ex),
+                        traceback=traceback.format_exc().splitlines(),
+                    )
+                else:
+                    LOGGER.info(
+                        "scene select cycle finished",
+                        trigger=reason,
+                        seconds=round(time.monotonic() - start, 3),
+                    )
+                reason = triggers.wait()
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+    LOGGER.info("scene select service stopped")
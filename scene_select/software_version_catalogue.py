@@ -0,0 +1,91 @@
+"""
+A local SQLite catalogue of the software versions of ARD datasets, kept between runs.
+
+An ARD's proc-info file never changes once its package is written, so its software
+versions are read once, and found again by dataset id. (With the mtime of the metadata
+file, so a rewritten package is read again.)
+"""
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict
+
+from scene_select.library import ArdDataset
+
+CATALOGUE_FILE = "software-versions.sqlite"
+
+# How many new entries to add before committing them.
+COMMIT_EVERY = 1000
+
+SCHEMA = """
+create table if not exists software_versions (
+    id text primary key,
+    metadata_mtime_ns integer not null,
+    versions text not null
+);
+"""
+
+
+class SoftwareVersionCatalogue:
+    """
+    The software versions of each ARD dataset, filled in as they're first asked for.
+
+    (Safe to use from several threads, such as those of library.prefetch().)
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Other runs may be adding to it: wait for them.
+        self.db = sqlite3.connect(str(self.path), timeout=600, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._uncommitted = 0
+        # Those already looked up in this run
+        self._found: Dict[str, dict] = {}
+
+    def close(self):
+        with self._lock:
+            self.db.commit()
+            self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def software_versions(self, ard_dataset: ArdDataset) -> Dict[str, str]:
+        """
+        The dataset's software versions (name -> version), from its proc-info file the
+        first time, and the catalogue after that.
+        """
+        found = self._found.get(ard_dataset.dataset_id)
+        if found is not None:
+            return found
+
+        mtime_ns = ard_dataset.metadata_path.stat().st_mtime_ns
+        with self._lock:
+            row = self.db.execute(
+                "select versions from software_versions "
+                "where id = ? and metadata_mtime_ns = ?",
+                (ard_dataset.dataset_id, mtime_ns),
+            ).fetchone()
+        if row is not None:
+            versions = json.loads(row[0])
+        else:
+            versions = ard_dataset.software_versions()
+            with self._lock:
+                self.db.execute(
+                    "insert or replace into software_versions values (?, ?, ?)",
+                    (ard_dataset.dataset_id, mtime_ns, json.dumps(versions)),
+                )
+                self._uncommitted += 1
+                if self._uncommitted >= COMMIT_EVERY:
+                    self.db.commit()
+                    self._uncommitted = 0
+
+        self._found[ard_dataset.dataset_id] = versions
+        return versions
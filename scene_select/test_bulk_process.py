@@ -1,7 +1,16 @@
+from types import SimpleNamespace
+from uuid import uuid4
+
 import structlog
 from datacube.model import Range
 
-from scene_select.bulk_process import matches_software_expressions
+from scene_select import bulk_process
+from scene_select.bulk_process import (
+    find_jobs_by_ard_ids,
+    find_jobs_by_odc_ard_search,
+    matches_software_expressions,
+)
+from scene_select.library import ArdDataset, ArdProduct, Level1Product
 
 
 def test_matches_software_expressions():
@@ -44,3 +53,112 @@ def test_matches_software_expressions():
         dict(wagl_version=Range(None, "1.2.4")),
         log,
     )
+
+
+def test_find_jobs_by_odc_ard_search_in_bulk(tmp_path, monkeypatch):
+    level1_product = Level1Product("usgs_ls8c_level1_2", base_collection_path=tmp_path)
+    ard_product = ArdProduct(
+        "ga_ls8c_ard_3", base_package_directory=tmp_path, sources=[level1_product]
+    )
+
+    def odc_level1(name):
+        metadata_path = tmp_path / f"{name}.odc-metadata.yaml"
+        metadata_path.touch()
+        tmp_path.joinpath(f"{name}.tar").touch()
+        return SimpleNamespace(
+            id=uuid4(),
+            uris=[metadata_path.as_uri()],
+            product=SimpleNamespace(name=level1_product.name),
+        )
+
+    level1s = [odc_level1("first"), odc_level1("second")]
+    ards = []
+    for name in ("first", "second", "unindexed"):
+        metadata_path = tmp_path / f"{name}_ard.odc-metadata.yaml"
+        metadata_path.touch()
+        ards.append(ArdDataset(str(uuid4()), metadata_path, maturity="final"))
+
+    # The lineage comes from the index, for the whole block.
+    level1_ids = {ard.dataset_id: str(level1.id) for ard, level1 in zip(ards, level1s)}
+    level1_ids[ards[2].dataset_id] = str(uuid4())
+    monkeypatch.setattr(
+        bulk_process,
+        "get_level1_source_ids",
+        lambda index, ids: {i: level1_ids[i] for i in ids},
+    )
+    bulk_gets = []
+
+    def bulk_get(ids):
+        bulk_gets.append(list(ids))
+        return [level1 for level1 in level1s if str(level1.id) in bulk_gets[-1]]
+
+    dc = SimpleNamespace(
+        index=SimpleNamespace(datasets=SimpleNamespace(bulk_get=bulk_get))
+    )
+    collection = SimpleNamespace(
+        products=[ard_product],
+        iterate_indexed_ard_blocks=lambda expressions: iter([(ard_product, ards)]),
+    )
+    log = structlog.get_logger()
+
+    jobs = find_jobs_by_odc_ard_search(dc, collection, {}, 10, log)
+    assert [job.level1.dataset_id for job in jobs] == [
+        str(level1.id) for level1 in level1s
+    ]
+    assert [job.replacement_uuids for job in jobs] == [
+        [ards[0].dataset_id],
+        [ards[1].dataset_id],
+    ]
+    # One bulk_get for the block
+    assert len(bulk_gets) == 1
+
+    jobs = find_jobs_by_odc_ard_search(dc, collection, {}, 1, log)
+    assert len(jobs) == 1
+
+
+def test_find_jobs_by_ard_ids_in_chunks(tmp_path, monkeypatch):
+    def odc_dataset(name, product_name):
+        metadata_path = tmp_path / f"{name}.odc-metadata.yaml"
+        metadata_path.touch()
+        tmp_path.joinpath(f"{name}.tar").touch()
+        return SimpleNamespace(
+            id=uuid4(),
+            uris=[metadata_path.as_uri()],
+            local_path=metadata_path,
+            product=SimpleNamespace(name=product_name),
+            metadata=SimpleNamespace(platform="landsat-8", dataset_maturity="final"),
+        )
+
+    level1s = [odc_dataset(f"level1-{i}", "usgs_ls8c_level1_2") for i in range(3)]
+    ards = [odc_dataset(f"ard-{i}", "ga_ls8c_ard_3") for i in range(3)]
+    monkeypatch.setattr(bulk_process, "ID_CHUNK", 2)
+    sources_queries = []
+
+    def get_datasets_sources(index, ids):
+        sources_queries.append(ids)
+        return {
+            str(ard.id): dict(level1=level1)
+            for ard, level1 in zip(ards, level1s)
+            if str(ard.id) in ids
+        }
+
+    monkeypatch.setattr(bulk_process, "get_datasets_sources", get_datasets_sources)
+    bulk_gets = []
+
+    def bulk_get(ids):
+        bulk_gets.append(list(ids))
+        return [ard for ard in ards if str(ard.id) in bulk_gets[-1]]
+
+    dc = SimpleNamespace(
+        index=SimpleNamespace(datasets=SimpleNamespace(bulk_get=bulk_get))
+    )
+
+    # (ids in a file may be upper case)
+    jobs, platform = find_jobs_by_ard_ids(dc, [str(ard.id).upper() for ard in ards])
+    assert platform == "ls"
+    assert [job.level1.dataset_id for job in jobs] == [
+        str(level1.id) for level1 in level1s
+    ]
+    assert [job.replacement_uuids for job in jobs] == [[str(ard.id)] for ard in ards]
+    # A bulk_get and a source query for each chunk of ids
+    assert len(bulk_gets) == len(sources_queries) == 2
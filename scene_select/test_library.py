@@ -0,0 +1,51 @@
+from pathlib import Path
+
+import pytest
+
+from scene_select.library import ArdDataset, prefetch
+
+
+def make_ard(tmp_path: Path, name: str) -> ArdDataset:
+    metadata_path = tmp_path / f"{name}.odc-metadata.yaml"
+    metadata_path.write_text(
+        "lineage:\n"
+        f"  level1: [{name}-level1]\n"
+        "accessories:\n"
+        "  metadata:processor:\n"
+        f"    path: {name}.proc-info.yaml\n"
+    )
+    tmp_path.joinpath(f"{name}.proc-info.yaml").write_text(
+        "software_versions:\n"
+        "- {name: wagl, version: 1.2.3}\n"
+        "- {name: fmask, version: 4.2.0}\n"
+    )
+    return ArdDataset(name, metadata_path, maturity="final")
+
+
+def test_documents_read_once(tmp_path):
+    ard = make_ard(tmp_path, "first")
+    assert ard.level1_id == "first-level1"
+    assert ard.software_versions() == dict(wagl="1.2.3", fmask="4.2.0")
+
+    # Cached with the dataset, so not read again.
+    ard.metadata_path.unlink()
+    tmp_path.joinpath("first.proc-info.yaml").unlink()
+    assert ard.level1_id == "first-level1"
+    assert ard.software_versions() == dict(wagl="1.2.3", fmask="4.2.0")
+
+
+def test_prefetch(tmp_path):
+    ards = [make_ard(tmp_path, f"ard{i}") for i in range(10)]
+    missing = ArdDataset("missing", tmp_path / "missing.yaml", maturity="final")
+    ards.insert(3, missing)
+
+    fetched = list(prefetch(ards, read=ArdDataset.software_versions, threads=2))
+    assert fetched == ards
+
+    for ard in ards:
+        ard.metadata_path.unlink(missing_ok=True)
+    # Already read
+    assert fetched[-1].software_versions()["wagl"] == "1.2.3"
+    # The error is for the caller to see.
+    with pytest.raises(FileNotFoundError):
+        missing.metadata_doc()
@@ -0,0 +1,38 @@
+import os
+
+from scene_select.library import ArdDataset
+from scene_select.software_version_catalogue import SoftwareVersionCatalogue
+
+
+def make_ard(tmp_path, wagl_version: str) -> ArdDataset:
+    metadata_path = tmp_path / "ard.odc-metadata.yaml"
+    metadata_path.write_text(
+        "accessories:\n  metadata:processor:\n    path: ard.proc-info.yaml\n"
+    )
+    tmp_path.joinpath("ard.proc-info.yaml").write_text(
+        f"software_versions:\n- {{name: wagl, version: {wagl_version}}}\n"
+    )
+    return ArdDataset("ard-id", metadata_path, maturity="final")
+
+
+def make_ard_again(ard: ArdDataset) -> ArdDataset:
+    """The same dataset, without the documents it has already read"""
+    return ArdDataset(ard.dataset_id, ard.metadata_path, maturity=ard.maturity)
+
+
+def test_catalogue_kept_between_runs(tmp_path):
+    catalogue_path = tmp_path / "catalogue" / "software-versions.sqlite"
+    ard = make_ard(tmp_path, "1.2.3")
+    with SoftwareVersionCatalogue(catalogue_path) as catalogue:
+        assert catalogue.software_versions(ard) == dict(wagl="1.2.3")
+
+    # The next run doesn't read the proc-info again.
+    tmp_path.joinpath("ard.proc-info.yaml").unlink()
+    with SoftwareVersionCatalogue(catalogue_path) as catalogue:
+        assert catalogue.software_versions(make_ard_again(ard)) == dict(wagl="1.2.3")
+
+    # Unless the package was rewritten.
+    ard = make_ard(tmp_path, "1.2.4")
+    os.utime(ard.metadata_path, ns=(0, 0))
+    with SoftwareVersionCatalogue(catalogue_path) as catalogue:
+        assert catalogue.software_versions(ard) == dict(wagl="1.2.4")
@@ -3,8 +3,9 @@ import logging
 import os
 import re
 import sys
+from datetime import datetime, timezone
 from pathlib import Path, PurePath
-from typing import TextIO
+from typing import TYPE_CHECKING, TextIO
 
 from urllib.parse import urlparse
 from urllib.request import url2pathname
@@ -13,7 +14,11 @@ from subprocess import Popen, PIPE
 import click
 import structlog
 
-from datacube.model import Dataset
+if TYPE_CHECKING:
+    # (Imported where they're used: they're slow to import for a command's --help.)
+    from datacube.index import Index
+    from datacube.model import Dataset
+    from sqlalchemy.engine import Engine
 
 DATA_DIR = Path(__file__).parent.joinpath("data")
 
@@ -35,7 +40,39 @@ INSIGNIFICANT_DIGITS_FIX = [
 ]
 
 
-def calc_file_path(l1_dataset: Dataset, product_id: str) -> str:
+def default_utc(d: datetime) -> datetime:
+    """
+    The datetime, in UTC if it has no timezone.
+
+    (As eodatasets3.utils.default_utc, which takes seconds to import.)
+    """
+    if d.tzinfo is None:
+        return d.replace(tzinfo=timezone.utc)
+    return d
+
+
+def alchemy_engine(index: "Index") -> "Engine":
+    # There's no public api for sharing the existing engine (it's an implementation detail of the current index).
+    # We could create our own from config, but there's no api for getting the ODC config for the index either.
+    # pylint: disable=protected-access
+    return index.datasets._db._engine
+
+
+def has_alchemy_engine(index: "Index") -> bool:
+    """
+    Is the index backed by a (postgres) database we can query directly?
+
+    Others, such as the in-memory index, only have the index API.
+    """
+    # pylint: disable=protected-access
+    return hasattr(getattr(index.datasets, "_db", None), "_engine")
+
+
+def calc_file_path(l1_dataset: "Dataset", product_id: str) -> str:
+    """
+    The l1_dataset can be a datacube Dataset, or anything with the
+    same `local_path` and `uris` (such as a Level1Record).
+    """
     if l1_dataset.local_path is None:
         # The s2 way
         file_path = calc_local_path(l1_dataset)
@@ -49,7 +86,7 @@ def calc_file_path(l1_dataset: Dataset, product_id: str) -> str:
     return file_path
 
 
-def calc_local_path(l1_dataset: Dataset) -> str:
+def calc_local_path(l1_dataset: "Dataset") -> str:
     assert len(l1_dataset.uris) == 1, str(l1_dataset.uris)
     components = urlparse(l1_dataset.uris[0])
     if not (components.scheme == "file" or components.scheme == "zip"):
@@ -32,6 +32,7 @@ setup(
             "ard-bulk-merge = scene_select.merge_bulk_runs:cli",
             "generate-aoi = scene_select.generate_aoi:generate_region",
             "ard-reprocessed-l1s = scene_select.ard_reprocessed_l1s:ard_reprocessed_l1s",
+            "ard-scene-decisions = scene_select.decision_ledger:cli",
         ]
     },
 )
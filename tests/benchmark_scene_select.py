@@ -0,0 +1,479 @@
+#! /usr/bin/env python3
+"""
+Benchmark scene selection against synthetic data, without an ODC database.
+
+Synthetic Level 1 datasets (and the ARD of some of them) are generated for the given
+products, and held in a stand-in for the index with the same search_returning / search /
+get_derived surface. Synthetic BRDF, VIIRS and water vapour trees are written to a
+temporary directory.
+
+Then l1_filter is run over each product, and l1_scenes_to_process over all of them, and
+the throughput, peak (traced) memory, and time spent in each filter stage are printed as
+JSON, to compare between commits:
+
+    python -m tests.benchmark_scene_select --scale 100000 -o before.json
+
+(This isn't collected by pytest.)
+"""
+
+import datetime
+import json
+import logging
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List
+
+import click
+import h5py
+import numpy
+from datacube.model import Range
+
+from scene_select.ard_scene_select import (
+    ARD_PARENT_PRODUCT_MAPPING,
+    AOI_FILE,
+    L1_ID_SEARCH_FIELDS,
+    get_aoi_sat_key,
+    l1_filter,
+    l1_scenes_to_process,
+    load_aoi,
+    scan_window,
+)
+from scene_select.check_ancillary import WV_FMT
+from scene_select.dass_logs import LOGGER_NAME
+from scene_select.utils import DATA_DIR, default_utc
+
+DEFAULT_PRODUCTS = (
+    "usgs_ls8c_level1_2",
+    "usgs_ls9c_level1_2",
+    "esa_s2am_level1_0",
+    "esa_s2bm_level1_0",
+)
+
+# Landsat platform codes (and collection number) of each product
+LANDSAT_PRODUCTS = {
+    "ga_ls5t_level1_3": ("LT", "05", "01"),
+    "ga_ls7e_level1_3": ("LE", "07", "01"),
+    "usgs_ls5t_level1_1": ("LT", "05", "01"),
+    "usgs_ls7e_level1_1": ("LE", "07", "01"),
+    "usgs_ls7e_level1_2": ("LE", "07", "02"),
+    "usgs_ls8c_level1_1": ("LC", "08", "01"),
+    "usgs_ls8c_level1_2": ("LC", "08", "02"),
+    "usgs_ls9c_level1_2": ("LC", "09", "02"),
+}
+
+
+class BenchmarkDatasets:
+    """
+    The index's datasets, bucketed by product and sorted by time, so searches are cheap.
+    """
+
+    def __init__(self):
+        self.by_id: Dict[uuid.UUID, dict] = {}
+        self.by_product: Dict[str, List[dict]] = defaultdict(list)
+        self.times: Dict[str, List[datetime.datetime]] = {}
+        self.derived: Dict[uuid.UUID, list] = defaultdict(list)
+        self._result_types = {}
+
+    def add(self, dataset: dict, source_id: uuid.UUID = None):
+        self.by_id[dataset["id"]] = dataset
+        self.by_product[dataset["product"]].append(dataset)
+        if source_id is not None:
+            self.derived[source_id].append(
+                SimpleNamespace(
+                    id=dataset["id"],
+                    is_archived=False,
+                    metadata=SimpleNamespace(
+                        dataset_maturity=dataset["dataset_maturity"]
+                    ),
+                )
+            )
+
+    def finish(self):
+        for product, datasets in self.by_product.items():
+            datasets.sort(key=lambda dataset: dataset["time"].end)
+            self.times[product] = [dataset["time"].end for dataset in datasets]
+
+    def get_product_time_bounds(self, product):
+        times = self.times[product]
+        return times[0], times[-1]
+
+    def search_returning(
+        self, field_names, product, time=None, id=None, region_code=None
+    ):
+        result_type = self._result_types.get(field_names)
+        if result_type is None:
+            result_type = self._result_types[field_names] = namedtuple(
+                "search_result", field_names
+            )
+        products = [product] if isinstance(product, str) else product
+        for dataset in self._search(products, time, id, region_code):
+            yield result_type(*(dataset[name] for name in field_names))
+
+    def count(self, product, time=None, region_code=None):
+        products = [product] if isinstance(product, str) else product
+        return sum(1 for _ in self._search(products, time, None, region_code))
+
+    def _search(self, products, time, ids, region_codes=None):
+        # (As the database would, with a region_code membership test)
+        if region_codes is None:
+            yield from self._search_time(products, time, ids)
+            return
+        region_codes = set(region_codes)
+        for dataset in self._search_time(products, time, ids):
+            if dataset["region_code"] in region_codes:
+                yield dataset
+
+    def _search_time(self, products, time, ids):
+        if ids is not None:
+            ids = [ids] if isinstance(ids, uuid.UUID) else ids
+            begin, end = (
+                (default_utc(time.begin), default_utc(time.end))
+                if time is not None
+                else (None, None)
+            )
+            for dataset_id in ids:
+                dataset = self.by_id.get(dataset_id)
+                if dataset is None or dataset["product"] not in products:
+                    continue
+                if begin is None or begin <= dataset["time"].end <= end:
+                    yield dataset
+            return
+
+        for product in products:
+            datasets = self.by_product.get(product, [])
+            if time is None:
+                yield from datasets
+                continue
+            times = self.times[product]
+            start = bisect_left(times, default_utc(time.begin))
+            stop = bisect_right(times, default_utc(time.end))
+            yield from datasets[start:stop]
+
+    def search(self, product):
+        for dataset in self.by_product.get(product, []):
+            yield SimpleNamespace(
+                id=dataset["id"], indexed_time=dataset["added"], is_archived=False
+            )
+
+    def get_derived(self, dataset_id):
+        return self.derived.get(dataset_id, [])
+
+
+class BenchmarkDatacube:
+    def __init__(self, datasets: BenchmarkDatasets):
+        self.index = SimpleNamespace(datasets=datasets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def _landsat_l1(product, region_code, acquired, rng):
+    sensor, satellite, collection = LANDSAT_PRODUCTS[product]
+    path, row = region_code[:3], region_code[3:]
+    ymd = acquired.strftime("%Y%m%d")
+    # A few are at a processing level that isn't processed.
+    level = "L1GS" if rng.random() < 0.05 else "L1TP"
+    product_id = f"{sensor}{satellite}_{level}_{path}{row}_{ymd}_{ymd}_{collection}_T1"
+    scene_id = f"{sensor}{satellite[1]}{path}{row}{acquired.strftime('%Y%j')}LGN00"
+    return dict(
+        uri=f"file:///l1/{product}/{path}_{row}/{scene_id[:16]}/{product_id}.odc-metadata.yaml",
+        landsat_product_id=product_id,
+        landsat_scene_id=scene_id,
+    )
+
+
+def _sentinel_l1(product, region_code, acquired, rng):
+    satellite = product[6].upper()
+    stamp = acquired.strftime("%Y%m%dT%H%M%S")
+    tile_id = f"S2{satellite}_OPER_MSI_L1C_TL_2APS_{stamp}_A{rng.randrange(10**6):06}_T{region_code}_N05.10"
+    return dict(
+        uri=f"zip:///l1/{product}/{acquired:%Y-%m}/S2{satellite}_MSIL1C_{stamp}_N0510_R002_T{region_code}_{stamp}.zip!/",
+        sentinel_tile_id=tile_id,
+    )
+
+
+def generate_index(
+    products: List[str],
+    scale: int,
+    ard_fraction: float,
+    start: datetime.datetime,
+    end: datetime.datetime,
+    seed: int,
+) -> BenchmarkDatasets:
+    """
+    `scale` Level 1 datasets, spread over the products and the time range, three quarters of
+    them in the AOI, with an ARD (mostly final) for `ard_fraction` of them.
+    """
+    rng = random.Random(seed)
+    region_codes = load_aoi(DATA_DIR.joinpath(AOI_FILE))
+    datasets = BenchmarkDatasets()
+    seconds = (end - start).total_seconds()
+
+    for i in range(scale):
+        product = products[i % len(products)]
+        sat_key = get_aoi_sat_key(region_codes, product)
+        aoi = sorted(region_codes[sat_key])
+        if rng.random() < 0.75:
+            region_code = rng.choice(aoi)
+        elif sat_key == "ls":
+            region_code = f"{rng.randrange(200):03}{rng.randrange(200, 250):03}"
+        else:
+            region_code = f"{rng.randrange(1, 60):02}X{rng.choice('ABCDEFGH')}{rng.choice('ABCDEFGH')}"
+        acquired = start + datetime.timedelta(seconds=rng.uniform(0, seconds))
+        if product in LANDSAT_PRODUCTS:
+            fields = _landsat_l1(product, region_code, acquired, rng)
+        else:
+            fields = _sentinel_l1(product, region_code, acquired, rng)
+
+        l1 = dict(
+            id=uuid.UUID(int=rng.getrandbits(128)),
+            product=product,
+            region_code=region_code,
+            time=Range(acquired, acquired),
+            added=acquired + datetime.timedelta(days=1),
+            dataset_maturity=None,
+            **fields,
+        )
+        datasets.add(l1)
+
+        if rng.random() < ard_fraction:
+            maturity = "final" if rng.random() < 0.8 else "interim"
+            ard = dict(
+                id=uuid.UUID(int=rng.getrandbits(128)),
+                product=ARD_PARENT_PRODUCT_MAPPING[product],
+                region_code=region_code,
+                time=l1["time"],
+                added=l1["added"] + datetime.timedelta(days=1),
+                dataset_maturity=maturity,
+            )
+            id_field = L1_ID_SEARCH_FIELDS[sat_key][1]
+            ard[id_field] = l1[id_field]
+            # The ARD (of either satellite) is searched by either id field.
+            ard.setdefault("landsat_scene_id", None)
+            ard.setdefault("sentinel_tile_id", None)
+            datasets.add(ard, source_id=l1["id"])
+
+    datasets.finish()
+    return datasets
+
+
+def write_ancillary(
+    base: Path, start: datetime.datetime, end: datetime.datetime, seed: int
+) -> Dict[str, Path]:
+    """
+    BRDF (MODIS and VIIRS) day directories for most days, and water vapour up to a week
+    before the end, so some scenes are waiting on ancillary.
+    """
+    rng = random.Random(seed)
+    dirs = {
+        name: base.joinpath(name)
+        for name in ("brdf", "viirs_i", "viirs_m", "water_vapour")
+    }
+    for path in dirs.values():
+        path.mkdir(parents=True)
+
+    day = start.date()
+    while day <= end.date():
+        for name in ("brdf", "viirs_i", "viirs_m"):
+            if rng.random() < 0.97:
+                dirs[name].joinpath(day.strftime("%Y.%m.%d")).mkdir()
+        day += datetime.timedelta(days=1)
+
+    wv_end = (end - datetime.timedelta(days=7)).date()
+    for year in range(start.year, end.year + 1):
+        last = min(wv_end, datetime.date(year, 12, 31))
+        timestamps = numpy.arange(
+            numpy.datetime64(f"{year}-01-01"),
+            numpy.datetime64(last + datetime.timedelta(days=1)),
+            numpy.timedelta64(6, "h"),
+        ).astype("datetime64[ns]")
+        index = numpy.zeros(
+            len(timestamps), dtype=[("timestamp", "<i8"), ("band_name", "S12")]
+        )
+        index["timestamp"] = timestamps.astype("i8")
+        index["band_name"] = [f"BAND-{i + 1}" for i in range(len(timestamps))]
+        with h5py.File(dirs["water_vapour"] / WV_FMT.format(year=year), "w") as fid:
+            dset = fid.create_dataset("INDEX", data=index)
+            dset.attrs["timestamp_dtype"] = "<M8[ns]"
+            dset.attrs["band_name_dtype"] = "|S12"
+    return dirs
+
+
+@contextmanager
+def _measure(results: dict, trace_memory: bool):
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        results["seconds"] = round(time.perf_counter() - start, 3)
+        if trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results["peak_memory_mb"] = round(peak / 2**20, 1)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command(help=__doc__)
+@click.option("--scale", type=int, default=10000, show_default=True)
+@click.option(
+    "--product",
+    "products",
+    multiple=True,
+    default=DEFAULT_PRODUCTS,
+    show_default=True,
+    type=click.Choice(sorted(ARD_PARENT_PRODUCT_MAPPING)),
+)
+@click.option(
+    "--ard-fraction",
+    type=float,
+    default=0.6,
+    show_default=True,
+    help="The fraction of Level 1s that already have an ARD",
+)
+@click.option("--scene-limit", type=int, default=1000, show_default=True)
+@click.option("--interim-days-wait", type=int, default=35, show_default=True)
+@click.option("--find-blocked", is_flag=True, default=False)
+@click.option("--seed", type=int, default=1, show_default=True)
+@click.option(
+    "--log-level",
+    type=click.Choice(["DEBUG", "INFO", "WARNING", "ERROR"]),
+    default="DEBUG",
+    show_default=True,
+    help="The level of the scene select log (which is rendered, then discarded)",
+)
+@click.option(
+    "--trace-memory/--no-trace-memory",
+    default=True,
+    show_default=True,
+    help="Measure peak memory (which slows the runs down)",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the results here, rather than stdout",
+)
+def benchmark(
+    scale: int,
+    products: List[str],
+    ard_fraction: float,
+    scene_limit: int,
+    interim_days_wait: int,
+    find_blocked: bool,
+    seed: int,
+    log_level: str,
+    trace_memory: bool,
+    output: str,
+):
+    products = list(products)
+    # As configured for a real run, but not written anywhere.
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(log_level)
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    # Scene select only looks at the recent level 1s.
+    start, end = scan_window()
+    end -= datetime.timedelta(hours=1)
+
+    generate_start = time.perf_counter()
+    datasets = generate_index(products, scale, ard_fraction, start, end, seed)
+    results = dict(
+        commit=_git_commit(),
+        python=platform.python_version(),
+        parameters=dict(
+            scale=scale,
+            products=products,
+            ard_fraction=ard_fraction,
+            scene_limit=scene_limit,
+            interim_days_wait=interim_days_wait,
+            find_blocked=find_blocked,
+            seed=seed,
+            log_level=log_level,
+        ),
+        generate_seconds=round(time.perf_counter() - generate_start, 3),
+        l1_filter={},
+    )
+    dc = BenchmarkDatacube(datasets)
+
+    with tempfile.TemporaryDirectory(prefix="benchmark-scene-select-") as tmp:
+        tmp = Path(tmp)
+        ancillary = write_ancillary(tmp, start, end, seed)
+        filter_kwargs = dict(
+            brdfdir=ancillary["brdf"],
+            i_viirsdir=ancillary["viirs_i"],
+            m_viirsdir=ancillary["viirs_m"],
+            # (naive, as given on the command line)
+            use_viirs_after=(end - datetime.timedelta(days=30)).replace(tzinfo=None),
+            wvdir=ancillary["water_vapour"],
+            region_codes=load_aoi(DATA_DIR.joinpath(AOI_FILE)),
+            interim_days_wait=interim_days_wait,
+            days_to_exclude=[],
+            find_blocked=find_blocked,
+        )
+
+        for product in products:
+            product_results = results["l1_filter"][product] = dict(
+                scenes=len(datasets.by_product[product])
+            )
+            with _measure(product_results, trace_memory):
+                files, _, _, stages, _ = l1_filter(dc, product, **filter_kwargs)
+            product_results.update(
+                selected=len(files),
+                scenes_per_second=round(
+                    product_results["scenes"] / product_results["seconds"]
+                ),
+                stages=stages,
+            )
+
+        # The whole run, with the newest-first early stop.
+        run_results = results["l1_scenes_to_process"] = dict(scenes=scale)
+        with _measure(run_results, trace_memory):
+            selected, _ = l1_scenes_to_process(
+                tmp.joinpath("scenes.txt"),
+                products=products,
+                scene_limit=scene_limit,
+                dc=dc,
+                **filter_kwargs,
+            )
+        run_results.update(
+            selected=selected,
+            scenes_per_second=round(scale / run_results["seconds"]),
+        )
+
+    doc = json.dumps(results, indent=2, default=str)
+    if output:
+        Path(output).write_text(doc + "\n")
+    else:
+        click.echo(doc)
+
+
+if __name__ == "__main__":
+    sys.exit(benchmark())
@@ -0,0 +1,175 @@
+#! /usr/bin/env python3
+"""
+Benchmark the start-up time of each console entry point in setup.py.
+
+Each entry point's module is imported in a fresh interpreter under `python -X importtime`,
+and its total (cumulative) import time, its heaviest direct imports, and the time for
+`<command> --help` are printed as JSON, to compare between commits:
+
+    python -m tests.benchmark_startup -o before.json
+
+With --budget, it exits with an error if any entry point takes longer than that to import.
+
+(This isn't collected by pytest.)
+"""
+
+import ast
+import json
+import platform
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import click
+
+REPO = Path(__file__).parent.parent
+SETUP_PY = REPO / "setup.py"
+
+# "import time:       123 |       4567 |   package.module"
+IMPORT_TIME = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def console_scripts(setup_py: Path = SETUP_PY) -> Dict[str, str]:
+    """
+    The console entry points declared in setup.py ({command: "module:function"}).
+
+    (Read from the file, so the package needn't be installed.)
+    """
+    for node in ast.walk(ast.parse(setup_py.read_text())):
+        if isinstance(node, ast.keyword) and node.arg == "entry_points":
+            entry_points = ast.literal_eval(node.value)
+            break
+    else:
+        return {}
+    scripts = {}
+    for declaration in entry_points.get("console_scripts", []):
+        command, target = (part.strip() for part in declaration.split("=", 1))
+        scripts[command] = target
+    return scripts
+
+
+def parse_importtime(stderr: str, module: str) -> Optional[dict]:
+    """
+    The module's cumulative import time, and that of its heaviest direct imports
+    (in microseconds).
+    """
+    total = None
+    direct = []
+    # Nested imports are listed (indented) before the module that imported them.
+    pending = []
+    for line in stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if not match:
+            continue
+        _, cumulative, indent, name = match.groups()
+        depth = len(indent) // 2
+        if depth > 0:
+            pending.append((name, int(cumulative), depth))
+            continue
+        if name == module:
+            total = int(cumulative)
+            direct = [(n, c) for n, c, d in pending if d == 1]
+        # (Those were imported by another top-level import, eg. site)
+        pending = []
+    if total is None:
+        return None
+    direct.sort(key=lambda item: item[1], reverse=True)
+    return dict(total_us=total, heaviest=[dict(module=n, us=c) for n, c in direct[:5]])
+
+
+def _run(args: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args], cwd=REPO, capture_output=True, text=True
+    )
+
+
+def measure(target: str, repeat: int) -> dict:
+    """
+    The fastest of `repeat` runs, of both the import and --help.
+    """
+    module, function = target.split(":")
+    result = dict(target=target)
+    imports = []
+    for _ in range(repeat):
+        process = _run(["-X", "importtime", "-c", f"import {module}"])
+        if process.returncode != 0:
+            result["error"] = process.stderr.strip().splitlines()[-1]
+            return result
+        imports.append(parse_importtime(process.stderr, module))
+    fastest = min(imports, key=lambda i: i["total_us"])
+    result["import_seconds"] = round(fastest["total_us"] / 1e6, 4)
+    result["heaviest"] = fastest["heaviest"]
+
+    help_seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process = _run(
+            ["-c", f"from {module} import {function}; {function}(['--help'])"]
+        )
+        help_seconds.append(time.perf_counter() - start)
+        if process.returncode != 0:
+            result["help_error"] = process.stderr.strip().splitlines()[-1]
+            break
+    result["help_seconds"] = round(min(help_seconds), 4)
+    return result
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@click.command(help=__doc__)
+@click.option(
+    "--repeat",
+    type=int,
+    default=3,
+    show_default=True,
+    help="Runs of each entry point (the fastest is reported)",
+)
+@click.option(
+    "--budget",
+    type=float,
+    default=None,
+    help="Fail if any entry point takes longer than this many seconds to import",
+)
+@click.option("--output", "-o", type=click.Path(dir_okay=False), default=None)
+def benchmark(repeat: int, budget: Optional[float], output: Optional[str]):
+    results = dict(
+        commit=_git_commit(),
+        python=platform.python_version(),
+        entry_points={
+            command: measure(target, repeat)
+            for command, target in console_scripts().items()
+        },
+    )
+    text = json.dumps(results, indent=2)
+    if output:
+        Path(output).write_text(text + "\n")
+    click.echo(text)
+
+    if budget is not None:
+        over = [
+            command
+            for command, result in results["entry_points"].items()
+            if result.get("import_seconds", 0) > budget
+        ]
+        if over:
+            raise click.ClickException(
+                f"Over the {budget}s start-up budget: {', '.join(over)}"
+            )
+
+
+if __name__ == "__main__":
+    benchmark()
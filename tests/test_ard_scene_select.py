@@ -4,12 +4,28 @@ import datetime
 import pytz
 import re
 import os
+import time
+import uuid
+from collections import namedtuple
 from pathlib import Path
+from unittest.mock import MagicMock, Mock
+import datacube
 from click.testing import CliRunner
+from sqlalchemy.dialects import postgresql
+from scene_select import ard_scene_select, utils
+from datacube.model import Range
 from scene_select.ard_scene_select import (
+    Level1Record,
+    _fetch_months,
+    _get_path_date,
+    _newest_first,
+    datasets_with_final_child,
     exclude_days,
+    l1_scenes_to_process,
     scene_select,
+    search_l1_records,
 )
+from scene_select.scan_state import ScanState, load_scan_states, save_scan_states
 
 DATAFILE_DIR = Path(__file__).parent.joinpath("test_data").resolve()
 
@@ -85,6 +101,214 @@ def test_exclude_days_empty():
     assert not exclude_days(range1, a_dt)
 
 
+def test_datasets_with_final_child(monkeypatch):
+    with_child = uuid.uuid4()
+    engine = Mock()
+    engine.execute.return_value = [(with_child,)]
+    monkeypatch.setattr(utils, "alchemy_engine", lambda index: engine)
+
+    # Nothing to look up: no query.
+    assert datasets_with_final_child(Mock(), []) == set()
+    engine.execute.assert_not_called()
+
+    assert datasets_with_final_child(Mock(), [with_child, uuid.uuid4()]) == {with_child}
+    # All ids are looked up in the one query.
+    engine.execute.assert_called_once()
+    [query] = engine.execute.call_args.args
+    sql = str(query.compile(dialect=postgresql.dialect()))
+    assert "dataset_source" in sql
+    assert "archived IS NULL" in sql
+
+
+def test_search_l1_records():
+    dataset_id = uuid.uuid4()
+    end = datetime.datetime(2024, 1, 29, 0, 57, 13, tzinfo=pytz.UTC)
+    tile_id = "S2A_OPER_MSI_L1C_TL_2APS_20240129T005713_A044929_T56JLN_N05.10"
+    zip_path = "/g/data/fj7/S2A_MSIL1C_20240129T005713_N0510_R102_T56JLN.zip"
+
+    dc = Mock()
+
+    def search_returning(field_names, **query):
+        result = namedtuple("search_result", field_names)
+        values = dict(
+            id=dataset_id,
+            product="esa_s2am_level1_0",
+            uri=f"zip:{zip_path}!/",
+            sentinel_tile_id=tile_id,
+            region_code="56JLN",
+            time=Range(end, end),
+        )
+        yield result(**{name: values[name] for name in field_names})
+
+    dc.index.datasets.search_returning = search_returning
+
+    [record] = search_l1_records(
+        dc, ["esa_s2am_level1_0"], "s2", Range(end - datetime.timedelta(days=1), end)
+    )
+    assert record.id == dataset_id
+    assert record.product_id == record.scene_id == tile_id
+    assert record.time_end == end
+    assert record.local_path is None
+    assert utils.calc_file_path(record, record.product_id) == zip_path
+
+
+def test_fetch_months_keeps_order():
+    months = [Range(month, month) for month in range(1, 13)]
+
+    def fetch(month_range):
+        # Earlier months take longer, so finish last when concurrent.
+        time.sleep((13 - month_range.begin) / 1000)
+        return [month_range.begin]
+
+    serial = list(_fetch_months(fetch, months))
+    assert serial == [[month] for month in range(1, 13)]
+    assert list(_fetch_months(fetch, months, month_workers=4)) == serial
+
+
+FAKE_WATERMARK = datetime.datetime(2024, 4, 2, tzinfo=pytz.UTC)
+
+
+def _fake_iter_l1_filter(dc, l1_product, scan_state=None, run=None, **kwargs):
+    run.duplicates += 1
+    # Newest first, with each product a day apart.
+    day = {"usgs_ls8c_level1_2": 9, "usgs_ls9c_level1_2": 8}.get(l1_product, 7)
+    # The newest and oldest scenes each replace an interim ARD.
+    archives = {0: f"{l1_product}-archive", 2: f"{l1_product}-archive-oldest"}
+    try:
+        for i in range(3):
+            run.accepted += 1
+            path = f"/l1/{l1_product}/LC08_L1TP_092079_2024031{day - i * 3}_20240401_02_T1.tar"
+            if i in archives:
+                run.uuids2archive.append(archives[i])
+                run.archived.append((None, archives[i], f"{l1_product}-{i}", path))
+            yield path
+        run.complete = True
+    finally:
+        # (Moves on only once every scene was looked at)
+        if scan_state is not None and run.complete:
+            scan_state = ScanState(watermark=FAKE_WATERMARK)
+        run.scan_state = scan_state
+
+
+def test_l1_scenes_to_process_parallel_products(tmp_path, monkeypatch):
+    monkeypatch.setattr(ard_scene_select, "iter_l1_filter", _fake_iter_l1_filter)
+    monkeypatch.setattr(datacube, "Datacube", MagicMock())
+
+    products = ["usgs_ls8c_level1_2", "usgs_ls9c_level1_2", "esa_s2am_level1_0"]
+    outputs = []
+    for parallel_products in (1, 3):
+        outfile = tmp_path / f"scenes-{parallel_products}.txt"
+        l1_count, uuids2archive = l1_scenes_to_process(
+            outfile,
+            products=products,
+            brdfdir=None,
+            i_viirsdir=None,
+            m_viirsdir=None,
+            wvdir=None,
+            use_viirs_after=None,
+            region_codes={},
+            scene_limit=5,
+            interim_days_wait=40,
+            days_to_exclude=[],
+            find_blocked=False,
+            parallel_products=parallel_products,
+        )
+        assert l1_count == 5
+        assert uuids2archive == [f"{product}-archive" for product in products]
+        outputs.append(outfile.read_text())
+
+    # Same scene list, whether products are run serially or in parallel.
+    assert outputs[0] == outputs[1]
+    # The newest scenes, across all products.
+    assert [_get_path_date(path) for path in outputs[0].splitlines()] == [
+        "20240319",
+        "20240318",
+        "20240317",
+        "20240316",
+        "20240315",
+    ]
+
+
+def test_l1_scenes_to_process_over_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(ard_scene_select, "iter_l1_filter", _fake_iter_l1_filter)
+    monkeypatch.setattr(datacube, "Datacube", MagicMock())
+
+    products = ["usgs_ls8c_level1_2", "usgs_ls9c_level1_2"]
+    previous = datetime.datetime(2024, 3, 1, tzinfo=pytz.UTC)
+    for parallel_products in (1, 2):
+        state_file = tmp_path / f"state-{parallel_products}.json"
+        save_scan_states(
+            state_file, {product: ScanState(watermark=previous) for product in products}
+        )
+        l1_count, uuids2archive = l1_scenes_to_process(
+            tmp_path / f"scenes-{parallel_products}.txt",
+            products=products,
+            brdfdir=None,
+            i_viirsdir=None,
+            m_viirsdir=None,
+            wvdir=None,
+            use_viirs_after=None,
+            region_codes={},
+            # Each product's own scenes fit, but not both together.
+            scene_limit=5,
+            interim_days_wait=40,
+            days_to_exclude=[],
+            find_blocked=False,
+            parallel_products=parallel_products,
+            state_file=state_file,
+        )
+        assert l1_count == 5
+        # Not the ARD the cut ls9 scene would have replaced.
+        assert uuids2archive == [
+            "usgs_ls8c_level1_2-archive",
+            "usgs_ls8c_level1_2-archive-oldest",
+            "usgs_ls9c_level1_2-archive",
+        ]
+        # The oldest ls9 scene was cut, so it must be looked at again next time.
+        states = load_scan_states(state_file)
+        assert states["usgs_ls9c_level1_2"].watermark == previous
+        if parallel_products > 1:
+            # (A serial run stops at the limit, before finding ls8 has no more.)
+            assert states["usgs_ls8c_level1_2"].watermark == FAKE_WATERMARK
+
+
+def test_newest_first_stops_at_limit():
+    taken = []
+
+    def scenes(dates):
+        for date in dates:
+            taken.append(date)
+            yield f"/l1/LC08_L1TP_092079_{date}_20240401_02_T1.tar"
+
+    newest = _newest_first(
+        [
+            scenes(["20240320", "20240301", "20240201"]),
+            scenes(["20240310", "20240101"]),
+        ],
+        scene_limit=2,
+    )
+    assert [_get_path_date(path) for path in newest] == ["20240320", "20240310"]
+    # The older scenes were never looked at.
+    assert "20240201" not in taken
+    assert "20240101" not in taken
+
+
+def test_level1_record_local_path():
+    record = Level1Record(
+        id=uuid.uuid4(),
+        product="usgs_ls8c_level1_2",
+        uri="file:///g/data/da82/092_079/LC80920792024074/LC08_L1TP_092079_20240314_20240401_02_T1.odc-metadata.yaml",
+        product_id="LC08_L1TP_092079_20240314_20240401_02_T1",
+        scene_id="LC80920792024074LGN00",
+        region_code="092079",
+        time_end=datetime.datetime(2024, 3, 14, tzinfo=pytz.UTC),
+    )
+    assert (
+        utils.calc_file_path(record, record.product_id)
+        == "/g/data/da82/092_079/LC80920792024074/LC08_L1TP_092079_20240314_20240401_02_T1.tar"
+    )
+
+
 L8_C2_PATTERN = (
     r"^(?P<sensor>LC)"
     r"(?P<satellite>08)_"
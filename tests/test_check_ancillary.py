@@ -1,6 +1,7 @@
 #! /usr/bin/env python3
 
 import datetime
+import os
 from pathlib import Path
 
 try:
@@ -8,9 +9,12 @@ try:
 except ModuleNotFoundError:
     # for non-NCI setup
     pass
+import h5py
+import numpy
 import pytz
 
-from scene_select.check_ancillary import AncillaryFiles
+from scene_select import check_ancillary
+from scene_select.check_ancillary import WV_FMT, AncillaryCache, AncillaryFiles
 
 __all__ = ("H5CompressionFilter",)  # Stop flake8 F401's
 
@@ -128,3 +132,168 @@ def test_ancillaryfiles_actual():
     ancill_there, msg = af_ob.ancillary_files(a_dt)
     assert not ancill_there
     assert "year" in msg
+
+
+def write_wv_file(wv_dir: Path, year: int, last_day: datetime.datetime):
+    """Write a small water vapour file, with 6-hourly timestamps up to the end of the day."""
+    timestamps = numpy.arange(
+        numpy.datetime64(f"{year}-01-01"),
+        numpy.datetime64(last_day.date() + datetime.timedelta(days=1)),
+        numpy.timedelta64(6, "h"),
+    ).astype("datetime64[ns]")
+    index = numpy.zeros(
+        len(timestamps), dtype=[("timestamp", "<i8"), ("band_name", "S12")]
+    )
+    index["timestamp"] = timestamps.astype("i8")
+    index["band_name"] = [f"BAND-{i + 1}" for i in range(len(timestamps))]
+    with h5py.File(wv_dir / WV_FMT.format(year=year), "w") as fid:
+        dset = fid.create_dataset("INDEX", data=index)
+        dset.attrs["python_type"] = "`Pandas.DataFrame`"
+        dset.attrs["timestamp_dtype"] = "<M8[ns]"
+        dset.attrs["band_name_dtype"] = "|S12"
+
+
+def test_ancillary_files_batch(tmp_path):
+    write_wv_file(tmp_path, 2020, datetime.datetime(2020, 8, 9))
+    af_ob = AncillaryFiles(brdf_dir=BRDF_TEST_DIR, wv_dir=tmp_path)
+    datetimes = [
+        datetime.datetime(1944, 6, 4, tzinfo=pytz.UTC),
+        datetime.datetime(2020, 8, 1, tzinfo=pytz.UTC),
+        datetime.datetime(2020, 8, 2, tzinfo=pytz.UTC),
+        datetime.datetime(2020, 8, 10, tzinfo=pytz.UTC),
+        datetime.datetime(2020, 8, 11, tzinfo=pytz.UTC),
+        datetime.datetime(2020, 1, 1, tzinfo=pytz.UTC),
+    ]
+    ancill_there, msgs = af_ob.ancillary_files_batch(datetimes)
+    assert ancill_there.tolist() == [False, True, False, True, False, False]
+    assert "year" in msgs[0]
+    assert "BRDF" in msgs[2]
+    assert "Water vapour" in msgs[4]
+    # No water vapour before the first timestamp of the year
+    assert "Water vapour" in msgs[5]
+
+    # The same answers, one at a time
+    for a_dt, there, msg in zip(datetimes, ancill_there, msgs):
+        assert af_ob.ancillary_files(a_dt) == (there, msg)
+
+    assert af_ob.ancillary_files_batch([])[0].tolist() == []
+
+
+def test_day_dirs_listed_once(tmp_path):
+    af_ob = AncillaryFiles(brdf_dir=tmp_path, wv_dir=tmp_path)
+    tmp_path.joinpath("2020.08.01").mkdir()
+    tmp_path.joinpath("2020.08.02").touch()
+    assert af_ob.check_modis("2020.08.01") == (True, "")
+    # Not a directory
+    assert not af_ob.check_modis("2020.08.02")[0]
+    # Only listed once
+    tmp_path.joinpath("2020.08.03").mkdir()
+    assert not af_ob.check_modis("2020.08.03")[0]
+
+    assert af_ob.day_dirs(tmp_path / "missing") == set()
+
+
+def test_refresh(tmp_path):
+    write_wv_file(tmp_path, 2019, datetime.datetime(2019, 12, 31))
+    write_wv_file(tmp_path, 2020, datetime.datetime(2020, 8, 9))
+    af_ob = AncillaryFiles(brdf_dir=tmp_path, wv_dir=tmp_path)
+    assert not af_ob.check_modis("2020.08.01")[0]
+    af_ob.get_wv_timestamps(2019)
+    af_ob.get_wv_timestamps(2020)
+
+    tmp_path.joinpath("2020.08.01").mkdir()
+    write_wv_file(tmp_path, 2020, datetime.datetime(2020, 8, 10))
+    af_ob.refresh()
+    # What may have changed is looked at again
+    assert af_ob.check_modis("2020.08.01") == (True, "")
+    assert af_ob.get_wv_timestamps(2020)[-1] > numpy.datetime64("2020-08-10")
+    # A closed year is kept
+    assert 2019 in af_ob._wv_timestamps
+
+
+def test_ancillary_cache(tmp_path, monkeypatch):
+    wv_dir = tmp_path / "wv"
+    wv_dir.mkdir()
+    brdf_dir = tmp_path / "brdf"
+    brdf_dir.joinpath("2020.08.01").mkdir(parents=True)
+    write_wv_file(wv_dir, 2019, datetime.datetime(2019, 12, 31))
+    write_wv_file(wv_dir, 2020, datetime.datetime(2020, 8, 9))
+    cache_path = tmp_path / "ancillary_cache.json"
+    datetimes = [
+        datetime.datetime(2019, 8, 1, tzinfo=pytz.UTC),
+        datetime.datetime(2020, 8, 1, tzinfo=pytz.UTC),
+        datetime.datetime(2020, 8, 11, tzinfo=pytz.UTC),
+    ]
+
+    def check():
+        af_ob = AncillaryFiles(brdf_dir=brdf_dir, wv_dir=wv_dir, cache_path=cache_path)
+        return af_ob.ancillary_files_batch(datetimes)[0].tolist()
+
+    assert check() == [False, True, False]
+    assert cache_path.exists()
+
+    # Nothing has changed, so nothing is re-read.
+    def no_reading(*args):
+        raise AssertionError("Ancillary should not be re-read")
+
+    with monkeypatch.context() as m:
+        m.setattr(check_ancillary, "read_h5_timestamps", no_reading)
+        m.setattr(os, "scandir", no_reading)
+        assert check() == [False, True, False]
+
+    # New data for the (open) year, and BRDF: only they are re-read.
+    write_wv_file(wv_dir, 2020, datetime.datetime(2020, 8, 12))
+    os.utime(wv_dir / WV_FMT.format(year=2020), ns=(0, 1))
+    brdf_dir.joinpath("2019.08.01").mkdir()
+    brdf_dir.joinpath("2020.08.11").mkdir()
+    reads = []
+    read_h5_timestamps = check_ancillary.read_h5_timestamps
+
+    def reading(fid, dataset_name):
+        reads.append(Path(fid.filename).name)
+        return read_h5_timestamps(fid, dataset_name)
+
+    monkeypatch.setattr(check_ancillary, "read_h5_timestamps", reading)
+    assert check() == [True, True, True]
+    # The closed year was never re-read.
+    assert reads == [WV_FMT.format(year=2020)]
+
+
+def test_ancillary_cache_unreadable(tmp_path):
+    cache_path = tmp_path / "ancillary_cache.json"
+    cache_path.write_text("{not json")
+    cache = AncillaryCache(cache_path)
+    assert cache.get(tmp_path) is None
+    cache.put(tmp_path, 1, ["2020.08.01"])
+    assert AncillaryCache(cache_path).get(tmp_path, 1) == ["2020.08.01"]
+    assert AncillaryCache(cache_path).get(tmp_path, 2) is None
+
+
+def test_ancillary_cache_concurrent(tmp_path):
+    cache_path = tmp_path / "ancillary_cache.json"
+    older, newer = tmp_path / "older", tmp_path / "newer"
+    AncillaryCache(cache_path).put(older, 1, ["2020.08.01"])
+    AncillaryCache(cache_path).put(newer, 1, ["2020.08.01"])
+
+    ours = AncillaryCache(cache_path)
+    # Another run updates both meanwhile, and ours only sees a newer version of one.
+    theirs = AncillaryCache(cache_path)
+    theirs.put(older, 2, ["2020.08.01", "2020.08.02"])
+    theirs.put(newer, 2, ["2020.08.01", "2020.08.02"])
+    ours.put(newer, 3, ["2020.08.01", "2020.08.02", "2020.08.03"])
+
+    # The newer entry of each is kept, not our stale one.
+    cache = AncillaryCache(cache_path)
+    assert cache.get(older, 2) == ["2020.08.01", "2020.08.02"]
+    assert cache.get(newer, 3) == ["2020.08.01", "2020.08.02", "2020.08.03"]
+    assert ours.get(older, 2) == ["2020.08.01", "2020.08.02"]
+
+
+def test_read_h5_timestamps(tmp_path):
+    write_wv_file(tmp_path, 2020, datetime.datetime(2020, 8, 9))
+    with h5py.File(tmp_path / WV_FMT.format(year=2020), "r") as fid:
+        timestamps = check_ancillary.read_h5_timestamps(fid, "INDEX")
+    assert timestamps.dtype == numpy.dtype("datetime64[ns]")
+    assert timestamps[0] == numpy.datetime64("2020-01-01T00:00")
+    assert timestamps[-1] == numpy.datetime64("2020-08-09T18:00")
+    assert (numpy.diff(timestamps) == numpy.timedelta64(6, "h")).all()
@@ -0,0 +1,61 @@
+#! /usr/bin/env python3
+
+import json
+import logging
+
+from scene_select.dass_logs import LOGGER_NAME, REASON, DecisionLog
+
+REMOVED = "scene removed"
+
+
+def _logged(caplog):
+    return [json.loads(record.getMessage()) for record in caplog.records]
+
+
+def test_decisions_are_sampled_and_counted(caplog):
+    caplog.set_level(logging.DEBUG, logger=LOGGER_NAME)
+    decisions = DecisionLog(sample_size=2)
+    for i in range(5):
+        decisions.scene(f"scene-{i}", dataset_id=str(i)).debug(
+            REMOVED, **{REASON: "Region not in AOI"}
+        )
+    decisions.scene("scene-5", dataset_id="5").info(
+        REMOVED, **{REASON: "This day is excluded."}
+    )
+
+    logged = _logged(caplog)
+    assert [(line["dataset_id"], line[REASON]) for line in logged] == [
+        ("0", "Region not in AOI"),
+        ("1", "Region not in AOI"),
+        ("5", "This day is excluded."),
+    ]
+    assert decisions.summary() == {
+        REMOVED: {
+            "Region not in AOI": dict(count=5, sample=["scene-0", "scene-1"]),
+            "This day is excluded.": dict(count=1, sample=["scene-5"]),
+        }
+    }
+
+
+def test_log_all_decisions(caplog):
+    caplog.set_level(logging.DEBUG, logger=LOGGER_NAME)
+    decisions = DecisionLog(sample_size=1, log_all=True)
+    for i in range(3):
+        decisions.scene(f"scene-{i}").debug(REMOVED, **{REASON: "Region not in AOI"})
+
+    assert len(_logged(caplog)) == 3
+    assert decisions.summary()[REMOVED]["Region not in AOI"] == dict(
+        count=3, sample=["scene-0"]
+    )
+
+
+def test_disabled_level_is_still_counted(caplog):
+    caplog.set_level(logging.INFO, logger=LOGGER_NAME)
+    decisions = DecisionLog()
+    decisions.scene("scene-0").debug(REMOVED, **{REASON: "Processing level too low"})
+    decisions.scene("scene-1").debug("Processing to interim")
+
+    assert _logged(caplog) == []
+    assert decisions.summary() == {
+        REMOVED: {"Processing level too low": dict(count=1, sample=["scene-0"])}
+    }
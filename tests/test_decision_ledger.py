@@ -0,0 +1,113 @@
+#! /usr/bin/env python3
+
+import datetime
+
+from click.testing import CliRunner
+
+from scene_select.decision_ledger import (
+    REMOVED,
+    SELECTED,
+    Decision,
+    DecisionLedger,
+    cli,
+)
+
+AOI = "Region not in AOI"
+
+
+def _decision(scene_id, region_code="092079", decision=SELECTED, **kwargs):
+    fields = dict(
+        scene_id=scene_id,
+        dataset_id=f"{scene_id}-id",
+        product="usgs_ls8c_level1_2",
+        region_code=region_code,
+        acquisition_date="2024-03-14",
+        decision=decision,
+        stage=None,
+        reason=None,
+    )
+    fields.update(kwargs)
+    return Decision(**fields)
+
+
+def _ledger(path):
+    with DecisionLedger(path) as ledger:
+        ledger.record_run(
+            "filter-jobid-000001",
+            ["usgs_ls8c_level1_2"],
+            [
+                _decision("a", decision=REMOVED, stage="aoi", reason=AOI),
+                _decision("b"),
+            ],
+            started=datetime.datetime(2024, 3, 15),
+        )
+        ledger.record_run(
+            "filter-jobid-000002",
+            ["usgs_ls8c_level1_2"],
+            [_decision("a", decision=REMOVED, stage="aoi", reason=AOI)],
+            started=datetime.datetime(2024, 3, 16),
+        )
+
+
+def test_query(tmp_path):
+    path = tmp_path / "ledger.sqlite"
+    _ledger(path)
+    with DecisionLedger(path) as ledger:
+        # Latest run first
+        assert [row["run_id"] for row in ledger.query(scene="a")] == [
+            "filter-jobid-000002",
+            "filter-jobid-000001",
+        ]
+        assert [row["scene_id"] for row in ledger.query(scene="b-id")] == ["b"]
+        assert len(ledger.query(reason=AOI, run_id="filter-jobid-000001")) == 1
+        assert ledger.query(region_code="092080") == []
+        assert len(ledger.query(date_from="2024-03-14", date_to="2024-03-14")) == 3
+        assert ledger.query(date_from="2024-03-15") == []
+
+        # Recording a run again replaces it.
+        ledger.record_run("filter-jobid-000002", ["usgs_ls8c_level1_2"], [])
+        assert [(run["run_id"], run["removed"]) for run in ledger.runs()] == [
+            ("filter-jobid-000002", 0),
+            ("filter-jobid-000001", 1),
+        ]
+
+
+def test_cli(tmp_path):
+    path = tmp_path / "ledger.sqlite"
+    _ledger(path)
+    runner = CliRunner()
+
+    result = runner.invoke(cli, ["--ledger", str(path), "why", "a", "--limit", "1"])
+    assert result.exit_code == 0, result.output
+    header, row = result.output.splitlines()
+    assert row.split("\t")[-3:] == [REMOVED, "aoi", AOI]
+
+    result = runner.invoke(cli, ["--ledger", str(path), "why", "nothing"])
+    assert result.exit_code == 1
+    # (As the likeliest reasons)
+    assert "outside the AOI" in result.stderr
+    assert "excluded day" in result.stderr
+
+    result = runner.invoke(cli, ["--ledger", str(path), "list", "--reason", AOI])
+    assert result.exit_code == 0, result.output
+    assert len(result.output.splitlines()) == 3
+
+
+def test_old_runs_removed(tmp_path):
+    path = tmp_path / "ledger.sqlite"
+    _ledger(path)
+    with DecisionLedger(path) as ledger:
+        ledger.record_run(
+            "filter-jobid-000003",
+            ["usgs_ls8c_level1_2"],
+            [_decision("c")],
+            started=datetime.datetime(2024, 4, 15),
+            keep_days=30,
+        )
+        # The first run started more than 30 days before.
+        assert [run["run_id"] for run in ledger.runs()] == [
+            "filter-jobid-000003",
+            "filter-jobid-000002",
+        ]
+        assert ledger.query(run_id="filter-jobid-000001") == []
+        assert len(ledger.query(scene="a")) == 1
@@ -0,0 +1,96 @@
+#! /usr/bin/env python3
+
+import datetime
+
+import numpy
+import pytz
+
+from scene_select.ard_scene_select import exclude_days
+from scene_select.eligibility import EligibilityCalendar
+
+DAYS_TO_EXCLUDE = ["2020-09-02:2020-09-05", "2020-08-09:2020-08-30"]
+NOW = datetime.datetime(2020, 10, 1, tzinfo=pytz.UTC)
+
+
+def test_matches_exclude_days():
+    calendar = EligibilityCalendar.from_options(DAYS_TO_EXCLUDE, 0, now=NOW)
+    times = [
+        datetime.datetime(1944, 6, 4, tzinfo=pytz.UTC),
+        datetime.datetime(2020, 8, 8, 23, 59, 59, 999999, tzinfo=pytz.UTC),
+        datetime.datetime(2020, 8, 9, tzinfo=pytz.UTC),
+        datetime.datetime(2020, 8, 30, 23, 59, 59, 999999, tzinfo=pytz.UTC),
+        datetime.datetime(2020, 9, 1, tzinfo=pytz.UTC),
+        datetime.datetime(2020, 9, 5, 12, tzinfo=pytz.UTC),
+        datetime.datetime(2020, 9, 6, tzinfo=pytz.UTC),
+    ]
+    expected = [exclude_days(DAYS_TO_EXCLUDE, t) for t in times]
+    assert expected == [False, False, True, True, False, True, False]
+
+    assert [calendar.is_excluded(t) for t in times] == expected
+    assert calendar.is_excluded(times).tolist() == expected
+    # Already an array (naive UTC)
+    as_array = numpy.array(
+        [t.replace(tzinfo=None) for t in times], dtype="datetime64[ns]"
+    )
+    assert calendar.is_excluded(as_array).tolist() == expected
+
+
+def test_overlapping_periods_are_merged():
+    calendar = EligibilityCalendar.from_options(
+        ["2020-08-09:2020-08-30", "2020-08-01:2020-08-10", "2020-08-20:2020-08-21"],
+        0,
+        now=NOW,
+    )
+    assert len(calendar.excluded_periods) == 1
+    assert calendar.is_excluded(datetime.datetime(2020, 8, 1, tzinfo=pytz.UTC))
+    assert calendar.is_excluded(datetime.datetime(2020, 8, 25, tzinfo=pytz.UTC))
+    assert not calendar.is_excluded(datetime.datetime(2020, 8, 31, tzinfo=pytz.UTC))
+
+
+def test_no_excluded_days():
+    calendar = EligibilityCalendar.from_options([], 0, now=NOW)
+    assert not calendar.is_excluded(datetime.datetime(1944, 6, 4))
+    assert calendar.is_excluded([datetime.datetime(1944, 6, 4)]).tolist() == [False]
+    assert calendar.is_excluded([]).tolist() == []
+
+
+def test_interim_cutoff():
+    calendar = EligibilityCalendar.from_options([], 10, now=NOW)
+    assert calendar.interim_cutoff == datetime.datetime(2020, 9, 21, tzinfo=pytz.UTC)
+    assert calendar.can_process_to_interim(
+        datetime.datetime(2020, 9, 20, tzinfo=pytz.UTC)
+    )
+    assert not calendar.can_process_to_interim(
+        datetime.datetime(2020, 9, 22, tzinfo=pytz.UTC)
+    )
+
+
+def test_included_periods():
+    calendar = EligibilityCalendar.from_options(DAYS_TO_EXCLUDE, 0, now=NOW)
+    utc = datetime.timezone.utc
+    begin = datetime.datetime(2020, 8, 1, tzinfo=utc)
+    end = datetime.datetime(2020, 9, 30, 23, 59, 59, 999999, tzinfo=utc)
+    included = calendar.included_periods(begin, end)
+    assert [(start.date(), stop.date()) for start, stop in included] == [
+        (datetime.date(2020, 8, 1), datetime.date(2020, 8, 8)),
+        (datetime.date(2020, 8, 31), datetime.date(2020, 9, 1)),
+        (datetime.date(2020, 9, 6), datetime.date(2020, 9, 30)),
+    ]
+
+    # Every time is either included or excluded, without gaps.
+    periods = sorted(included + calendar.excluded_periods)
+    assert periods[0][0] == begin and periods[-1][1] == end
+    for (_, stop), (start, _) in zip(periods, periods[1:]):
+        assert start - stop == datetime.timedelta(microseconds=1)
+
+    # Wholly within an excluded period (naive times are UTC)
+    assert (
+        calendar.included_periods(
+            datetime.datetime(2020, 8, 10), datetime.datetime(2020, 8, 20)
+        )
+        == []
+    )
+    # Nothing excluded
+    assert EligibilityCalendar.from_options([], 0, now=NOW).included_periods(
+        begin, end
+    ) == [(begin, end)]
@@ -0,0 +1,65 @@
+#! /usr/bin/env python3
+
+from scene_select.filter_pipeline import FilterPipeline, FilterStage
+
+
+class Multiples(FilterStage):
+    def __init__(self, divisor, cost, selectivity, calls):
+        super().__init__()
+        self.name = f"multiple_of_{divisor}"
+        self.divisor = divisor
+        self.cost = cost
+        self.selectivity = selectivity
+        self.calls = calls
+
+    def keep(self, candidate):
+        self.calls.append(self.name)
+        return candidate % self.divisor == 0
+
+
+class Unique(FilterStage):
+    name = "unique"
+    sequential = True
+
+    def __init__(self):
+        super().__init__()
+        self.seen = set()
+
+    def keep(self, candidate):
+        return candidate // 10 not in self.seen
+
+    def accepted(self, candidate):
+        self.seen.add(candidate // 10)
+
+
+def test_cheap_selective_stages_run_first():
+    calls = []
+    expensive = Multiples(2, cost=100, selectivity=0.5, calls=calls)
+    cheap = Multiples(3, cost=1, selectivity=0.3, calls=calls)
+    pipeline = FilterPipeline([expensive, cheap])
+
+    assert pipeline.stages == [cheap, expensive]
+    assert pipeline.run(range(12)) == [0, 6]
+
+    # The expensive stage only saw the survivors of the cheap one.
+    assert calls.count("multiple_of_3") == 12
+    assert calls.count("multiple_of_2") == 4
+
+    summary = pipeline.summary()
+    assert list(summary) == ["multiple_of_3", "multiple_of_2"]
+    assert summary["multiple_of_3"]["checked"] == 12
+    assert summary["multiple_of_3"]["removed"] == 8
+    assert summary["multiple_of_2"]["checked"] == 4
+    assert summary["multiple_of_2"]["removed"] == 2
+
+
+def test_sequential_stages_see_earlier_decisions():
+    unique = Unique()
+    pipeline = FilterPipeline([unique, Multiples(2, 1, 0.5, [])])
+
+    # Sequential stages always run after the independent ones
+    assert pipeline.stages[-1] is unique
+
+    assert pipeline.run([10, 12, 13, 21, 24]) == [10, 24]
+    assert pipeline.run([14, 30]) == [30]
+    assert unique.removed == 2
@@ -0,0 +1,508 @@
+#! /usr/bin/env python3
+"""
+l1_filter, against a stand-in for the datacube index.
+"""
+
+import datetime
+import uuid
+from collections import namedtuple
+from pathlib import Path
+
+import pytest
+import pytz
+from datacube.model import Range
+
+from scene_select import ard_scene_select
+from scene_select.ard_scene_select import (
+    L1FilterRun,
+    iter_l1_filter,
+    l1_filter,
+    merge_shard_runs,
+    region_shard,
+)
+from scene_select.scan_state import WATERMARK_OVERLAP, ScanState
+from scene_select.utils import default_utc
+
+TEST_DATA = Path(__file__).parent.joinpath("test_data")
+
+L1_PRODUCT = "usgs_ls8c_level1_2"
+START = datetime.datetime(2020, 7, 20, tzinfo=pytz.UTC)
+END = datetime.datetime(2020, 8, 31, tzinfo=pytz.UTC)
+
+
+def make_l1(
+    region_code: str,
+    day: datetime.datetime,
+    level="L1TP",
+    added: datetime.datetime = START,
+):
+    path, row = region_code[:3], region_code[3:]
+    ymd = day.strftime("%Y%m%d")
+    product_id = f"LC08_{level}_{path}{row}_{ymd}_{ymd}_02_T1"
+    return dict(
+        id=uuid.uuid4(),
+        product=L1_PRODUCT,
+        uri=f"file:///l1/{region_code}/{product_id}.odc-metadata.yaml",
+        landsat_product_id=product_id,
+        landsat_scene_id=f"LC8{path}{row}{day.strftime('%Y%j')}LGN00",
+        region_code=region_code,
+        time=Range(day, day),
+        added=added,
+    )
+
+
+def make_ard(level1: dict, maturity: str):
+    """An ARD processed from the level 1"""
+    return dict(
+        id=uuid.uuid4(),
+        product="ga_ls8c_ard_3",
+        landsat_scene_id=level1["landsat_scene_id"],
+        dataset_maturity=maturity,
+        region_code=level1["region_code"],
+        time=level1["time"],
+        added=level1["added"],
+    )
+
+
+class FakeDatasets:
+    def __init__(self, datasets):
+        self.datasets = datasets
+
+    def get_product_time_bounds(self, product):
+        return START, END
+
+    def search_returning(self, field_names, product, time, id=None, region_code=None):
+        result = namedtuple("search_result", field_names)
+        for dataset in self._search(product, time, id, region_code):
+            yield result(**{name: dataset[name] for name in field_names})
+
+    def count(self, product, time, region_code=None):
+        return sum(1 for _ in self._search(product, time, None, region_code))
+
+    def _search(self, product, time, id, region_code):
+        # (naive times are UTC, as for ODC)
+        begin, end = default_utc(time.begin), default_utc(time.end)
+        products = [product] if isinstance(product, str) else product
+        for dataset in self.datasets:
+            if id is not None and dataset["id"] not in id:
+                continue
+            if region_code is not None and dataset["region_code"] not in region_code:
+                continue
+            if dataset["product"] in products and begin <= dataset["time"].end <= end:
+                yield dataset
+
+    def added_since(self, since):
+        return {
+            dataset["id"]: dataset["added"]
+            for dataset in self.datasets
+            if since is None or dataset["added"] > since
+        }
+
+
+class FakeIndex:
+    def __init__(self, datasets):
+        self.datasets = FakeDatasets(datasets)
+
+
+class FakeDatacube:
+    def __init__(self, datasets):
+        self.index = FakeIndex(datasets)
+
+
+@pytest.fixture
+def final_children(monkeypatch):
+    """The ids of the datasets that have a final ARD child"""
+    children = set()
+    monkeypatch.setattr(
+        ard_scene_select,
+        "datasets_with_final_child",
+        lambda dc, ids: children.intersection(ids),
+    )
+    monkeypatch.setattr(
+        ard_scene_select, "calc_processed_ard_scene_ids", lambda *args, **kwargs: {}
+    )
+    return children
+
+
+@pytest.fixture
+def no_final_children(monkeypatch):
+    """No level 1 has a final child (but the processed ARDs are searched for)"""
+    monkeypatch.setattr(
+        ard_scene_select, "datasets_with_final_child", lambda dc, ids: set()
+    )
+
+
+@pytest.fixture
+def added_queries(monkeypatch):
+    """The (raw SQL) queries for when datasets were added, against the fake index"""
+    searched = []
+
+    def datasets_added_since(dc, product, since):
+        searched.append(since)
+        return dc.index.datasets.added_since(since)
+
+    monkeypatch.setattr(ard_scene_select, "datasets_added_since", datasets_added_since)
+    monkeypatch.setattr(
+        ard_scene_select,
+        "latest_added",
+        lambda dc, product: max(dc.index.datasets.added_since(None).values()),
+    )
+    return searched
+
+
+def filter_params(**kwargs):
+    params = dict(
+        brdfdir=TEST_DATA / "BRDF",
+        i_viirsdir=TEST_DATA / "VNP43IA1.001",
+        m_viirsdir=TEST_DATA / "VNP43MA1.001",
+        use_viirs_after=datetime.datetime(2099, 9, 9),
+        wvdir=TEST_DATA / "water_vapour",
+        region_codes={"ls": {"092079", "092080"}},
+        # Ancillary is never ready in the test data, so produce interims straight away
+        interim_days_wait=0,
+        days_to_exclude=[],
+        find_blocked=False,
+        min_date=START,
+        max_date=END,
+    )
+    params.update(kwargs)
+    return params
+
+
+def run_filter(datasets, **kwargs):
+    return l1_filter(FakeDatacube(datasets), L1_PRODUCT, **filter_params(**kwargs))
+
+
+def test_l1_filter(final_children):
+    day = datetime.datetime(2020, 8, 1, tzinfo=pytz.UTC)
+    wanted = make_l1("092079", day)
+    outside_aoi = make_l1("100100", day)
+    low_level = make_l1("092080", day, level="L1GS")
+    with_child = make_l1("092080", day + datetime.timedelta(days=8))
+    excluded = make_l1("092079", day + datetime.timedelta(days=16))
+    final_children.add(with_child["id"])
+
+    files, uuids2archive, duplicates, stages, scan_state = run_filter(
+        [wanted, outside_aoi, low_level, with_child, excluded],
+        days_to_exclude=["2020-08-17:2020-08-17"],
+    )
+    assert files == [
+        f"/l1/092079/{wanted['landsat_product_id']}.tar",
+    ]
+    assert uuids2archive == []
+    assert duplicates == 0
+    # The AOI and excluded days are part of the search
+    assert stages["aoi"]["checked"] == 3
+    assert stages["aoi"]["removed"] == 0
+    assert stages["processing_level"]["removed"] == 1
+    assert stages["excluded_days"]["removed"] == 0
+    assert stages["final_child"]["removed"] == 1
+    assert scan_state is None
+
+
+def test_l1_filter_incremental(no_final_children, added_queries):
+    day = datetime.datetime(2020, 8, 1, tzinfo=pytz.UTC)
+    first_added = datetime.datetime(2020, 8, 2, tzinfo=pytz.UTC)
+    wanted = make_l1("092079", day, added=first_added - datetime.timedelta(days=1))
+    outside_aoi = make_l1("100100", day, added=first_added - datetime.timedelta(days=1))
+    # On an excluded day, for now.
+    waiting = make_l1("092080", day + datetime.timedelta(days=2), added=first_added)
+    datasets = [wanted, outside_aoi, waiting]
+    days_to_exclude = ["2020-08-03:2020-08-03"]
+
+    # A full scan, as there's no watermark yet.
+    files, _, _, stages, scan_state = run_filter(
+        datasets, days_to_exclude=days_to_exclude, scan_state=ScanState()
+    )
+    assert files == [f"/l1/092079/{wanted['landsat_product_id']}.tar"]
+    # (Left out of the search)
+    assert stages["excluded_days"]["removed"] == 0
+    assert added_queries == []
+    assert scan_state.watermark == first_added
+    # Everything but the settled scene outside the AOI, and the excluded scene (which
+    # needs a full scan once its day is no longer excluded)
+    assert scan_state.pending == {wanted["id"]}
+
+    # The wanted scene is processed, and a new one turns up.
+    datasets.append(make_ard(wanted, "final"))
+    new = make_l1(
+        "092079",
+        day + datetime.timedelta(days=9),
+        added=first_added + datetime.timedelta(days=10),
+    )
+    datasets.append(new)
+    files, _, _, stages, scan_state = run_filter(
+        datasets, days_to_exclude=days_to_exclude, scan_state=scan_state
+    )
+    assert files == [f"/l1/092079/{new['landsat_product_id']}.tar"]
+    # Only the new and pending scenes were looked at
+    assert stages["aoi"]["checked"] == 3
+    assert stages["reprocessed"]["removed"] == 1
+    # (The excluded scene is added within the watermark overlap, so looked at by id)
+    assert stages["excluded_days"]["removed"] == 1
+    assert added_queries == [first_added - WATERMARK_OVERLAP]
+    # (The ARD added is of another product)
+    assert scan_state.watermark == new["added"]
+    # The scene with a final ARD is settled. The new one, just selected, is still
+    # pending until its ARD turns up.
+    assert scan_state.pending == {new["id"]}
+
+
+def test_iter_l1_filter_newest_first(monkeypatch):
+    checked = []
+
+    def datasets_with_final_child(dc, ids):
+        checked.extend(ids)
+        return set()
+
+    monkeypatch.setattr(
+        ard_scene_select, "datasets_with_final_child", datasets_with_final_child
+    )
+    monkeypatch.setattr(
+        ard_scene_select, "calc_processed_ard_scene_ids", lambda *args, **kwargs: {}
+    )
+    monkeypatch.setattr(ard_scene_select, "SEQUENTIAL_CHUNK", 1)
+
+    days = [START + datetime.timedelta(days=8 * i) for i in range(5)]
+    datasets = [make_l1("092079", day) for day in days]
+    run = L1FilterRun()
+    scenes = iter_l1_filter(
+        FakeDatacube(datasets), L1_PRODUCT, run=run, **filter_params()
+    )
+    newest = [next(scenes), next(scenes)]
+    scenes.close()
+
+    assert newest == [
+        f"/l1/092079/{dataset['landsat_product_id']}.tar"
+        for dataset in datasets[::-1][:2]
+    ]
+    # The older scenes were never checked against the index.
+    assert datasets[0]["id"] not in checked
+    assert run.accepted == 2
+    assert not run.complete
+
+
+def test_iter_l1_filter_records_decisions(final_children):
+    day = datetime.datetime(2020, 8, 1, tzinfo=pytz.UTC)
+    wanted = make_l1("092079", day)
+    low_level = make_l1("092080", day, level="L1GS")
+    run = L1FilterRun()
+    files = list(
+        iter_l1_filter(
+            FakeDatacube([wanted, low_level]),
+            L1_PRODUCT,
+            run=run,
+            record_decisions=True,
+            **filter_params(),
+        )
+    )
+    assert files == [f"/l1/092079/{wanted['landsat_product_id']}.tar"]
+    decisions = {decision.dataset_id: decision for _, decision in run.ledger}
+    assert decisions[str(wanted["id"])].decision == "selected"
+    removed = decisions[str(low_level["id"])]
+    assert (removed.decision, removed.stage) == ("removed", "processing_level")
+    assert removed.reason is not None
+    assert removed.region_code == "092080"
+    assert removed.acquisition_date == "2020-08-01"
+
+
+def test_iter_l1_filter_aoi_in_search(final_children, monkeypatch):
+    day = datetime.datetime(2020, 8, 1, tzinfo=pytz.UTC)
+    wanted = [make_l1("092079", day), make_l1("092080", day)]
+    outside_aoi = [make_l1("100100", day), make_l1("100101", day)]
+    monkeypatch.setattr(ard_scene_select, "REGION_CODE_CHUNK", 1)
+    dc = FakeDatacube(wanted + outside_aoi)
+    searched = []
+    search_returning = dc.index.datasets.search_returning
+
+    def recording_search_returning(field_names, **query):
+        searched.append(query.get("region_code"))
+        return search_returning(field_names, **query)
+
+    dc.index.datasets.search_returning = recording_search_returning
+
+    run = L1FilterRun()
+    files = list(iter_l1_filter(dc, L1_PRODUCT, run=run, **filter_params()))
+    assert len(files) == 2
+    # Each chunk of region codes, for each month
+    assert searched == [["092079"], ["092080"]] * 2
+    # Never fetched, but counted
+    assert run.stage_summary["aoi"]["checked"] == 2
+    assert run.decisions["scene removed"]["Region not in AOI"]["count"] == 2
+
+    run = L1FilterRun()
+    list(
+        iter_l1_filter(dc, L1_PRODUCT, run=run, count_outside=False, **filter_params())
+    )
+    assert "Region not in AOI" not in run.decisions.get("scene removed", {})
+
+
+def test_iter_l1_filter_excluded_days_not_searched(final_children, monkeypatch):
+    day = datetime.datetime(2020, 8, 1, tzinfo=pytz.UTC)
+    wanted = make_l1("092079", day)
+    excluded = make_l1("092079", day + datetime.timedelta(days=16))
+    dc = FakeDatacube([wanted, excluded])
+    searched = []
+    search_returning = dc.index.datasets.search_returning
+
+    def recording_search_returning(field_names, **query):
+        searched.append(query["time"])
+        return search_returning(field_names, **query)
+
+    dc.index.datasets.search_returning = recording_search_returning
+
+    # All of July, and the middle of August
+    params = filter_params(
+        days_to_exclude=["2020-07-01:2020-07-31", "2020-08-10:2020-08-20"]
+    )
+    files = list(iter_l1_filter(dc, L1_PRODUCT, **params))
+    assert files == [f"/l1/092079/{wanted['landsat_product_id']}.tar"]
+    # Newest first
+    assert [(r.begin.day, r.end.day) for r in searched] == [(21, 31), (1, 9)]
+
+
+def test_iter_l1_filter_shards_match_serial(final_children, added_queries):
+    region_codes = {f"0920{row}" for row in range(70, 82)}
+    days = [START + datetime.timedelta(days=8 * i) for i in range(5)]
+    datasets = [
+        make_l1(region_code, day) for region_code in region_codes for day in days
+    ]
+    datasets += [
+        make_l1("092070", days[1], level="L1GS"),
+        make_l1("100100", days[2]),
+    ]
+    final_children.update(dataset["id"] for dataset in datasets[::7])
+    dc = FakeDatacube(datasets)
+    params = filter_params(region_codes={"ls": region_codes})
+
+    serial = L1FilterRun()
+    list(iter_l1_filter(dc, L1_PRODUCT, run=serial, scan_state=ScanState(), **params))
+
+    shard_runs = []
+    for shard_index in range(3):
+        shard_runs.append(L1FilterRun())
+        list(
+            iter_l1_filter(
+                dc,
+                L1_PRODUCT,
+                run=shard_runs[-1],
+                scan_state=ScanState(),
+                shard=(shard_index, 3),
+                **params,
+            )
+        )
+    assert all(run.accepted for run in shard_runs)
+    merged = merge_shard_runs(shard_runs)
+
+    def in_order(selected):
+        return sorted(selected, key=lambda item: (-item[0].timestamp(), item[1]))
+
+    assert merged.selected == in_order(serial.selected)
+    assert merged.accepted == serial.accepted
+    assert merged.complete
+    assert {
+        stage: (summary["checked"], summary["removed"])
+        for stage, summary in merged.stage_summary.items()
+    } == {
+        stage: (summary["checked"], summary["removed"])
+        for stage, summary in serial.stage_summary.items()
+    }
+    assert {
+        (event, reason, summary["count"])
+        for event, reasons in merged.decisions.items()
+        for reason, summary in reasons.items()
+    } == {
+        (event, reason, summary["count"])
+        for event, reasons in serial.decisions.items()
+        for reason, summary in reasons.items()
+    }
+    assert merged.scan_state == serial.scan_state
+
+
+def test_merge_shard_runs_archive_order():
+    day = datetime.datetime(2020, 8, 1)
+    first = L1FilterRun(
+        archived=[
+            (day, "a", "level1-a", "/l1/a.tar"),
+            (day - datetime.timedelta(days=2), "c", "level1-c", "/l1/c.tar"),
+        ],
+        complete=True,
+        decisions={"scene added": {"Interim": dict(count=2, sample=["x", "y"])}},
+    )
+    second = L1FilterRun(
+        archived=[(day - datetime.timedelta(days=1), "b", "level1-b", "/l1/b.tar")],
+        complete=False,
+        decisions={"scene added": {"Interim": dict(count=1, sample=["z"])}},
+    )
+    merged = merge_shard_runs([first, second], sample_size=2)
+    assert merged.uuids2archive == ["a", "b", "c"]
+    assert not merged.complete
+    assert merged.decisions == {
+        "scene added": {"Interim": dict(count=3, sample=["x", "y"])}
+    }
+    assert merged.scan_state is None
+
+
+def test_shards_multi_granule_path(final_children):
+    day = datetime.datetime(2020, 8, 1, tzinfo=pytz.UTC)
+    # Granules of one package, in regions of different shards.
+    first, second = make_l1("092079", day), make_l1("092080", day)
+    assert region_shard("092079", 3) != region_shard("092080", 3)
+    second.update(uri=first["uri"], landsat_product_id=first["landsat_product_id"])
+    dc = FakeDatacube([first, second])
+    params = filter_params(record_decisions=True)
+
+    serial = L1FilterRun()
+    list(iter_l1_filter(dc, L1_PRODUCT, run=serial, **params))
+    shard_runs = []
+    for shard_index in range(3):
+        shard_runs.append(L1FilterRun())
+        list(
+            iter_l1_filter(
+                dc, L1_PRODUCT, run=shard_runs[-1], shard=(shard_index, 3), **params
+            )
+        )
+    merged = merge_shard_runs(shard_runs)
+
+    assert [path for _, path, _ in merged.selected] == [
+        path for _, path, _ in serial.selected
+    ]
+    assert len(merged.selected) == 1
+    assert serial.duplicates == 1
+    assert (merged.accepted, merged.duplicates) == (serial.accepted, serial.duplicates)
+    assert merged.stage_summary["duplicate_path"]["removed"] == 1
+    assert merged.stage_summary["final_child"]["checked"] == 1
+    assert {
+        (decision.dataset_id, decision.decision, decision.stage)
+        for _, decision in merged.ledger
+    } == {
+        (decision.dataset_id, decision.decision, decision.stage)
+        for _, decision in serial.ledger
+    }
+    assert (
+        merged.decisions["scene removed"][ard_scene_select.DUPLICATE_PATH]["count"] == 1
+    )
+
+
+def test_region_shard():
+    # The same in every process (unlike hash())
+    assert [region_shard(code, 3) for code in ("092079", "092080", "55HFA")] == [
+        0,
+        1,
+        2,
+    ]
+    assert {region_shard(f"0920{row}", 3) for row in range(70, 82)} == {0, 1, 2}
+
+
+def test_l1_filter_processed_ard_early_in_first_month(no_final_children):
+    # Before the min date, but in the same month, so it's searched.
+    processed = make_l1("092079", datetime.datetime(2020, 8, 2, tzinfo=pytz.UTC))
+    datasets = [processed, make_ard(processed, "interim")]
+
+    files, uuids2archive, _, stages, _ = run_filter(
+        datasets, min_date=datetime.datetime(2020, 8, 10, tzinfo=pytz.UTC)
+    )
+    # (Its ancillary isn't ready, so the interim isn't replaced yet.)
+    assert files == []
+    assert uuids2archive == []
+    assert stages["reprocessed"]["removed"] == 1
@@ -0,0 +1,181 @@
+#! /usr/bin/env python3
+
+import datetime
+import uuid
+from collections import namedtuple
+from unittest.mock import Mock
+
+from datacube.model import Range
+
+from scene_select.ard_scene_select import (
+    PROCESSED_ARD_TIME_MARGIN,
+    _resident_ard_scenes,
+    calc_processed_ard_scene_ids,
+)
+from scene_select import processed_ard_cache
+from scene_select.processed_ard_cache import ArdEntry, ProcessedArdCache
+from scene_select.processed_ards import ProcessedArd, ProcessedArdScenes
+
+Result = namedtuple("Result", ("landsat_scene_id", "dataset_maturity", "id", "time"))
+ACQUIRED = datetime.datetime(2020, 7, 15, tzinfo=datetime.timezone.utc)
+
+
+def test_processed_ard_scenes():
+    first, second, third = uuid.uuid4(), uuid.uuid4(), uuid.UUID(int=1 << 8)
+    collisions = []
+    scenes = ProcessedArdScenes(
+        [
+            ("LC80920792020214", first, "interim"),
+            ("LC80920802020214", third, "provisional"),
+            ("LC80920792020214", second, "final"),
+        ],
+        on_collision=lambda *args: collisions.append(args),
+    )
+    assert len(scenes) == 2
+    assert "LC80920792020214" in scenes
+    assert "LC80920812020214" not in scenes
+    # The last one wins
+    assert scenes["LC80920792020214"] == ProcessedArd(second, "final")
+    assert scenes["LC80920802020214"] == ProcessedArd(third, "provisional")
+    assert scenes.get("LC80920812020214") is None
+    assert collisions == [("LC80920792020214", first, second)]
+
+    assert not ProcessedArdScenes([])
+
+
+def test_calc_processed_ard_scene_ids():
+    ard_id = uuid.uuid4()
+    dc = Mock()
+    dc.index.datasets.search_returning.return_value = [
+        Result("LC80920792020214LGN00", "final", ard_id, Range(ACQUIRED, ACQUIRED))
+    ]
+    time_range = Range(datetime.datetime(2020, 7, 1), datetime.datetime(2020, 8, 1))
+
+    scenes = calc_processed_ard_scene_ids(dc, "usgs_ls8c_level1_2", "ls", time_range)
+    assert scenes["LC80920792020214"] == ProcessedArd(ard_id, "final")
+    assert dc.index.datasets.search_returning.call_args.kwargs["time"] == Range(
+        time_range.begin - PROCESSED_ARD_TIME_MARGIN,
+        time_range.end + PROCESSED_ARD_TIME_MARGIN,
+    )
+
+    assert calc_processed_ard_scene_ids(dc, "unknown_level1", "ls") is None
+
+
+def test_processed_ard_cache(tmp_path, monkeypatch):
+    t0 = datetime.datetime(2020, 8, 1, tzinfo=datetime.timezone.utc)
+    ards = {}
+
+    def add(scene_id, days, maturity="final"):
+        entry = ArdEntry(
+            scene_id, uuid.uuid4(), maturity, t0 + datetime.timedelta(days=days)
+        )
+        ards[entry.id] = entry
+        return entry
+
+    searches = []
+
+    def search(id=None):
+        searches.append(id)
+        return [ards[i] for i in (id if id is not None else list(ards))]
+
+    changes = dict(active=set(), archived=set(), latest=t0)
+    monkeypatch.setattr(
+        processed_ard_cache, "latest_change", lambda dc, product: changes["latest"]
+    )
+    monkeypatch.setattr(
+        processed_ard_cache,
+        "changed_since",
+        lambda dc, product, since: (
+            changes["active"],
+            changes["archived"],
+            changes["latest"],
+        ),
+    )
+    monkeypatch.setattr(
+        processed_ard_cache, "active_count", lambda dc, product: len(ards)
+    )
+
+    old = add("LC80920792020214", 0, "interim")
+    archived = add("LC80920802020214", 1)
+    with ProcessedArdCache(tmp_path, "ga_ls8c_ard_3") as cache:
+        # Built in full the first time
+        cache.refresh(None, search)
+        assert searches == [None]
+        assert cache.refreshed_until == t0
+        assert len(cache.processed_ard_scenes()) == 2
+
+    # Reprocessed to final, and one is archived
+    new = add("LC80920792020214", 2)
+    del ards[archived.id]
+    changes.update(
+        active={new.id},
+        archived={archived.id},
+        latest=t0 + datetime.timedelta(hours=3),
+    )
+    collisions = []
+    with ProcessedArdCache(tmp_path, "ga_ls8c_ard_3") as cache:
+        cache.refresh(None, search)
+        assert searches[1:] == [[new.id]]
+        assert cache.refreshed_until == changes["latest"]
+        scenes = cache.processed_ard_scenes(
+            on_collision=lambda *args: collisions.append(args)
+        )
+        assert list(scenes) == ["LC80920792020214"]
+        assert scenes["LC80920792020214"] == ProcessedArd(new.id, "final")
+        assert collisions == [("LC80920792020214", old.id, new.id)]
+
+        # Only those within the time range
+        window = Range(t0 - datetime.timedelta(days=1), t0 + datetime.timedelta(days=1))
+        scenes = cache.processed_ard_scenes(window)
+        assert scenes["LC80920792020214"] == ProcessedArd(old.id, "interim")
+
+        # A rebuild picks up what a refresh would miss
+        del ards[old.id]
+        cache.refresh(None, search, rebuild=True)
+        assert searches[-1] is None
+        assert len(cache.processed_ard_scenes(window)) == 0
+
+        # Un-archived: it isn't among the changes, but the count of active datasets is off
+        ards[archived.id] = archived
+        changes.update(active=set(), archived=set())
+        searched = len(searches)
+        cache.refresh(None, search)
+        assert searches[searched:] == [None]
+        assert cache.processed_ard_scenes()["LC80920802020214"] == ProcessedArd(
+            archived.id, "final"
+        )
+
+        # Otherwise, no rebuild
+        searched = len(searches)
+        cache.refresh(None, search)
+        assert searches[searched:] == []
+
+
+def test_resident_ard_scenes(tmp_path):
+    t0 = datetime.datetime(2020, 8, 1, tzinfo=datetime.timezone.utc)
+    entries = [
+        ArdEntry("LC80920792020214", uuid.uuid4(), "final", t0),
+        ArdEntry(
+            "LC80920802020214", uuid.uuid4(), "final", t0 - datetime.timedelta(days=30)
+        ),
+    ]
+    resident = {}
+    with ProcessedArdCache(tmp_path, "ga_ls8c_ard_3") as cache:
+        cache._insert(entries)
+        cache._set_refreshed_until(t0)
+        window = Range(t0 - datetime.timedelta(days=1), t0 + datetime.timedelta(days=1))
+        scenes = _resident_ard_scenes(cache, window, resident)
+        assert list(scenes) == ["LC80920792020214"]
+
+        # Reused by a later cycle, while the ARD hasn't changed
+        later = Range(window.begin + datetime.timedelta(days=1), window.end)
+        assert _resident_ard_scenes(cache, later, resident) is scenes
+
+        # Read again when it reaches further back
+        earlier = Range(t0 - datetime.timedelta(days=40), window.end)
+        assert len(_resident_ard_scenes(cache, earlier, resident)) == 2
+
+        # Or when the ARD has changed
+        held = resident["ga_ls8c_ard_3"].scenes
+        cache._set_refreshed_until(t0 + datetime.timedelta(hours=1))
+        assert _resident_ard_scenes(cache, earlier, resident) is not held
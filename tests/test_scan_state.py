@@ -0,0 +1,50 @@
+#! /usr/bin/env python3
+
+import datetime
+import uuid
+
+import pytz
+
+from scene_select.scan_state import ScanState, load_scan_states, save_scan_states
+
+
+def test_scan_states_round_trip(tmp_path):
+    state_file = tmp_path / "state.json"
+    assert load_scan_states(state_file) == {}
+
+    states = {
+        "usgs_ls8c_level1_2": ScanState(
+            watermark=datetime.datetime(2020, 8, 2, 3, 4, 5, 6, tzinfo=pytz.UTC),
+            pending={uuid.uuid4(), uuid.uuid4()},
+        ),
+        "usgs_ls9c_level1_2": ScanState(),
+    }
+    save_scan_states(state_file, states)
+    loaded = load_scan_states(state_file)
+    assert loaded == states
+    assert loaded["usgs_ls8c_level1_2"].is_incremental
+    assert not loaded["usgs_ls9c_level1_2"].is_incremental
+
+    # A broken state file means a full scan.
+    state_file.write_text("{")
+    assert load_scan_states(state_file) == {}
+
+
+def test_save_scan_states_keeps_other_products(tmp_path):
+    state_file = tmp_path / "state.json"
+    first = datetime.datetime(2020, 8, 2, tzinfo=pytz.UTC)
+    second = datetime.datetime(2020, 8, 3, tzinfo=pytz.UTC)
+    save_scan_states(
+        state_file,
+        {
+            "usgs_ls8c_level1_2": ScanState(watermark=first),
+            "usgs_ls9c_level1_2": ScanState(watermark=first),
+        },
+    )
+
+    # A run of only one of them (eg. with --products)
+    save_scan_states(state_file, {"usgs_ls9c_level1_2": ScanState(watermark=second)})
+    assert load_scan_states(state_file) == {
+        "usgs_ls8c_level1_2": ScanState(watermark=first),
+        "usgs_ls9c_level1_2": ScanState(watermark=second),
+    }
@@ -0,0 +1,118 @@
+#! /usr/bin/env python3
+
+import os
+import socket
+import threading
+
+import pytest
+
+from scene_select import service
+from scene_select.service import (
+    SCHEDULE,
+    SOCKET,
+    STARTED,
+    TRIGGER_FILE,
+    Triggers,
+    serve,
+)
+
+
+@pytest.fixture(autouse=True)
+def quick_poll(monkeypatch):
+    monkeypatch.setattr(service, "POLL_SECONDS", 0.01)
+
+
+def send(socket_path, command: str) -> str:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(str(socket_path))
+        client.sendall(command.encode())
+        return client.recv(1024).decode().strip()
+
+
+def test_needs_a_trigger():
+    with pytest.raises(ValueError):
+        Triggers()
+
+
+def test_schedule():
+    cycles = []
+
+    def run_cycle(reason):
+        cycles.append(reason)
+        if len(cycles) == 3:
+            triggers.stop()
+
+    triggers = Triggers(interval=0.01)
+    serve(run_cycle, triggers)
+    assert cycles == [STARTED, SCHEDULE, SCHEDULE]
+
+
+def test_trigger_file(tmp_path):
+    trigger_file = tmp_path / "trigger"
+    cycles = []
+
+    def run_cycle(reason):
+        cycles.append(reason)
+        if reason == STARTED:
+            trigger_file.touch()
+        else:
+            triggers.stop()
+
+    triggers = Triggers(trigger_file=trigger_file)
+    serve(run_cycle, triggers)
+    assert cycles == [STARTED, TRIGGER_FILE]
+
+
+def test_socket(tmp_path):
+    socket_path = tmp_path / "trigger.sock"
+    # Left behind by an earlier service
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+        stale.bind(str(socket_path))
+
+    cycles = []
+    replies = []
+    started = threading.Event()
+
+    def client():
+        started.wait(5)
+        replies.append(send(socket_path, "run"))
+        replies.append(send(socket_path, "stop"))
+
+    thread = threading.Thread(target=client)
+    thread.start()
+
+    def run_cycle(reason):
+        cycles.append(reason)
+        started.set()
+
+    serve(run_cycle, Triggers(socket_path=socket_path))
+    thread.join(5)
+    assert cycles[0] == STARTED
+    assert set(cycles[1:]) == {SOCKET}
+    assert replies == ["ok", "stopping"]
+    assert not socket_path.exists()
+
+
+def test_failed_cycle_carries_on():
+    cycles = []
+
+    def run_cycle(reason):
+        cycles.append(reason)
+        if len(cycles) == 1:
+            raise RuntimeError("index unavailable")
+        triggers.stop()
+
+    triggers = Triggers(interval=0.01)
+    serve(run_cycle, triggers)
+    assert cycles == [STARTED, SCHEDULE]
+
+
+def test_sigterm_stops_after_the_cycle():
+    cycles = []
+
+    def run_cycle(reason):
+        cycles.append(reason)
+        os.kill(os.getpid(), service.signal.SIGTERM)
+
+    serve(run_cycle, Triggers(interval=0.01))
+    assert cycles == [STARTED]
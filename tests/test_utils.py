@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 
+import datetime
 import os
+import subprocess
+import sys
 from pathlib import Path
 from unittest.mock import Mock
-from scene_select.utils import calc_file_path
+from scene_select.utils import calc_file_path, default_utc
 
 
 def test_local_path():
@@ -27,3 +30,27 @@ def test_local_path():
     actual = os.path.join(the_path, product_id + ".tar")
     result = calc_file_path(ls_l1_dataset, product_id)
     assert result == actual
+
+
+def test_default_utc():
+    naive = datetime.datetime(2020, 8, 1, 10)
+    assert default_utc(naive) == naive.replace(tzinfo=datetime.timezone.utc)
+    aest = datetime.timezone(datetime.timedelta(hours=10))
+    aware = datetime.datetime(2020, 8, 1, 10, tzinfo=aest)
+    assert default_utc(aware) is aware
+
+
+def test_scene_select_imports_no_index_libraries():
+    # So that --help (or a run given --usgs-level1-files) starts quickly.
+    imported = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, scene_select.ard_scene_select; print(' '.join(sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    for heavy in ("datacube", "eodatasets3", "sqlalchemy", "h5py", "pandas"):
+        assert heavy not in imported
@@ -50,3 +50,11 @@ for _ in range(1000):
     af_ob.ancillary_files(a_date)
 t_end = time.time()
 print(t_end - t_start)
+
+# The same number of lookups, checked in one batch
+a_dates = [random_date(d_start, d_end) for _ in range(1000)]
+af_ob = AncillaryFiles(brdf_dir=BRDF_TEST_DIR, wv_dir=WV_TEST_DIR)
+t_start = time.time()
+af_ob.ancillary_files_batch(a_dates)
+t_end = time.time()
+print(t_end - t_start)